@@ -0,0 +1,100 @@
+# src/benchmarks/compact_response_bench.py
+"""
+Benchmark response transcription/shadowing: JSON mặc định (pydantic) vs compact (cột + orjson + gzip).
+
+Đường mặc định mô phỏng FastAPI với response_model: model_dump -> validate lại theo response_model
+-> dump mode json -> json.dumps.
+Chạy: python -m src.benchmarks.compact_response_bench
+"""
+import gzip
+import json
+import random
+import time
+
+import orjson
+
+from src.dto import ApiResponse, TranscriptionResponse, TranscriptionSegment
+from src.services.sentence_token_store import SentenceTokens
+from src.services.shadowing_service import build_shadowing_columns, build_shadowing_result
+from src.utils.compact_response import COMPACT_GZIP_LEVEL, columns
+
+_VOCAB = (
+    "the a learner should practice speaking english every day because listening and "
+    "repeating sentences helps build fluency confidence pronunciation vocabulary grammar"
+).split()
+
+
+def _fake_transcription(n_words: int, words_per_segment: int = 12) -> tuple[list[str], dict]:
+    rng = random.Random(n_words)
+    texts = [rng.choice(_VOCAB) for _ in range(n_words)]
+    segments, t = [], 0.0
+    for start in range(0, n_words, words_per_segment):
+        chunk = texts[start:start + words_per_segment]
+        words = []
+        for w in chunk:
+            words.append({"word": w, "start": round(t, 3), "end": round(t + 0.3, 3), "score": round(rng.random(), 3)})
+            t += 0.35
+        segments.append({"start": words[0]["start"], "end": words[-1]["end"], "text": " ".join(chunk), "words": words})
+    return texts, {"text": " ".join(texts), "segments": segments, "language": "en"}
+
+
+def _default_path(expected: SentenceTokens, result: dict) -> bytes:
+    response = TranscriptionResponse(
+        id="bench",
+        filename="bench.wav",
+        duration=1.0,
+        language=result["language"],
+        segments=[
+            TranscriptionSegment(start=s["start"], end=s["end"], text=s["text"], words=s["words"])
+            for s in result["segments"]
+        ],
+        full_text=result["text"],
+        shadowingResult=build_shadowing_result(expected, result),
+    )
+    content = ApiResponse.success(data=response).model_dump()
+    validated = ApiResponse[TranscriptionResponse].model_validate(content)
+    return json.dumps(validated.model_dump(mode="json"), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _compact_path(expected: SentenceTokens, result: dict) -> bytes:
+    segments = result["segments"]
+    words = [w for s in segments for w in s["words"]]
+    data = {
+        "id": "bench",
+        "filename": "bench.wav",
+        "duration": 1.0,
+        "language": result["language"],
+        "full_text": result["text"],
+        "segments": {**columns(segments, {"start": "start", "end": "end", "text": "text"}),
+                     "wordCount": [len(s["words"]) for s in segments]},
+        "words": columns(words, {"text": "word", "start": "start", "end": "end", "score": "score"}),
+        "shadowingResult": build_shadowing_columns(expected, result),
+    }
+    return orjson.dumps({"code": 200, "message": "Success", "result": data})
+
+
+def _timed(fn, rounds: int) -> float:
+    fn()
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return sorted(timings)[len(timings) // 2] * 1e3
+
+
+if __name__ == "__main__":
+    for label, n_words, rounds in (("shadowing", 15, 300), ("đoạn văn", 200, 50), ("lesson", 3000, 5)):
+        texts, result = _fake_transcription(n_words)
+        expected = SentenceTokens(1, tuple(texts), tuple(texts))
+
+        default_body = _default_path(expected, result)
+        compact_body = _compact_path(expected, result)
+        default_ms = _timed(lambda: _default_path(expected, result), rounds)
+        compact_ms = _timed(lambda: _compact_path(expected, result), rounds)
+        gzip_ms = _timed(lambda: gzip.compress(_compact_path(expected, result), COMPACT_GZIP_LEVEL), rounds)
+        print(
+            f"{label:<10} {n_words:>5} words | default {default_ms:8.3f} ms {len(default_body):>8} B | "
+            f"compact {compact_ms:8.3f} ms {len(compact_body):>8} B | "
+            f"compact+gzip {gzip_ms:8.3f} ms {len(gzip.compress(compact_body, COMPACT_GZIP_LEVEL)):>7} B"
+        )
@@ -0,0 +1,117 @@
+# src/benchmarks/shadowing_alignment_bench.py
+"""
+Benchmark alignment chấm shadowing (src/utils/word_alignment.py).
+
+So với DP thuần Python O(n * m) (cost mỗi cặp từ có memo); kiểm tra 2 bên cho cùng tổng cost.
+Chạy: python -m src.benchmarks.shadowing_alignment_bench
+"""
+import random
+import time
+
+from src.services.sentence_token_store import SentenceTokens
+from src.services.shadowing_service import _near_max_edits, _substitution_cost, build_shadowing_result
+from src.utils.word_alignment import align_tokens
+
+_VOCAB = (
+    "the a learner should practice speaking english every day because listening and "
+    "repeating sentences helps build fluency confidence pronunciation vocabulary grammar "
+    "news learning teacher morning weather different important remember question answer "
+    "through thought though beautiful comfortable restaurant environment government"
+).split()
+
+
+def _learner_version(words: list[str], rng: random.Random, error_rate: float) -> list[str]:
+    """Mô phỏng lỗi thường gặp: bỏ từ, nói thừa, nuốt âm cuối, nói sai từ."""
+    out = []
+    for w in words:
+        r = rng.random()
+        if r < error_rate * 0.25:
+            continue                                     # bỏ từ
+        if r < error_rate * 0.5:
+            out.append(rng.choice(["uh", "um", "the"]))  # nói thừa
+            out.append(w)
+        elif r < error_rate * 0.75 and len(w) > 3:
+            out.append(w[:-1])                           # nuốt âm cuối (NEAR)
+        elif r < error_rate:
+            out.append(rng.choice(_VOCAB))               # sai từ
+        else:
+            out.append(w)
+    return out
+
+
+def _reference_cost(a: list[str], b: list[str]) -> float:
+    memo: dict = {}
+    prev = [float(j) for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        cur = [float(i)] + [0.0] * len(b)
+        for j in range(1, len(b) + 1):
+            pair = (a[i - 1], b[j - 1])
+            sub = memo.get(pair)
+            if sub is None:
+                sub = memo[pair] = 0.0 if pair[0] == pair[1] else _substitution_cost(*pair)
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + sub)
+        prev = cur
+    return prev[-1]
+
+
+def _ops_cost(a: list[str], b: list[str], ops) -> float:
+    cost = 0.0
+    for i, j in ops:
+        if i is None or j is None:
+            cost += 1
+        elif a[i] != b[j]:
+            cost += _substitution_cost(a[i], b[j])
+    return cost
+
+
+def _timed(fn, rounds: int) -> tuple[float, float]:
+    fn()  # warm-up
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1e3, timings[int(len(timings) * 0.95)] * 1e3
+
+
+def _build_request(words: list[str]) -> SentenceTokens:
+    return SentenceTokens(sentence_id=1, texts=tuple(words), normalized=tuple(words))
+
+
+def _bench(n_words: int, error_rate: float, rounds: int = 100) -> None:
+    rng = random.Random(n_words)
+    expected = [rng.choice(_VOCAB) for _ in range(n_words)]
+    recognized = _learner_version(expected, rng, error_rate)
+
+    ops = align_tokens(expected, recognized, _substitution_cost, max_edits=_near_max_edits)
+    assert abs(_ops_cost(expected, recognized, ops) - _reference_cost(expected, recognized)) < 1e-6
+
+    align_p50, align_p95 = _timed(
+        lambda: align_tokens(expected, recognized, _substitution_cost, max_edits=_near_max_edits), rounds
+    )
+    ref_p50, _ = _timed(lambda: _reference_cost(expected, recognized), 3)
+
+    rq = _build_request(expected)
+    result = {"text": " ".join(recognized), "segments": []}
+    full_p50, _ = _timed(lambda: build_shadowing_result(rq, result), rounds)
+
+    print(
+        f"{n_words:>4} words, error {error_rate:>4.0%}: "
+        f"align p50 {align_p50:7.3f} ms / p95 {align_p95:7.3f} ms | "
+        f"python DP {ref_p50:8.2f} ms | build_shadowing_result {full_p50:7.3f} ms"
+    )
+
+
+def _demo() -> None:
+    # 1 từ thừa ở đầu câu: so theo vị trí sẽ chấm sai toàn bộ phần sau
+    rq = _build_request("i want to learn english every day".split())
+    scored = build_shadowing_result(rq, {"text": "uh i want to learnin english day", "segments": []})
+    print(" ".join(f"{c.expectedWord or '-'}/{c.recognizedWord or '-'}:{c.status}" for c in scored.compares))
+
+
+if __name__ == "__main__":
+    _demo()
+    for n_words in (20, 50, 200, 500):
+        for error_rate in (0.0, 0.1, 0.3):
+            _bench(n_words, error_rate)
@@ -0,0 +1,103 @@
+# src/benchmarks/word_similarity_bench.py
+"""
+Micro-benchmark phân loại từ (CORRECT/NEAR/WRONG) của shadowing_service.
+
+So sánh với bản cũ (Levenshtein full matrix list-of-lists) trên các lỗi thường gặp của learner,
+kiểm tra 2 bên cho cùng kết quả.
+Chạy: python -m src.benchmarks.word_similarity_bench
+"""
+import random
+import time
+
+from src.services.shadowing_service import _classify_word
+
+_WORDS = (
+    "news learning teacher morning weather different important remember question answer "
+    "through thought though beautiful comfortable restaurant environment government "
+    "pronunciation vocabulary because every practice speaking listening sentence the a "
+    "is are was were have has think thing three tree world word walked wanted"
+).split()
+
+
+def _levenshtein_full(a: str, b: str) -> int:
+    """Bản cũ: O(len(a) * len(b)), cấp phát nguyên ma trận mỗi lần gọi."""
+    if a == b:
+        return 0
+    if not a:
+        return len(b)
+    if not b:
+        return len(a)
+    la, lb = len(a), len(b)
+    dp = [[0] * (lb + 1) for _ in range(la + 1)]
+    for i in range(la + 1):
+        dp[i][0] = i
+    for j in range(lb + 1):
+        dp[0][j] = j
+    for i in range(1, la + 1):
+        for j in range(1, lb + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            dp[i][j] = min(dp[i - 1][j] + 1, dp[i][j - 1] + 1, dp[i - 1][j - 1] + cost)
+    return dp[la][lb]
+
+
+def _classify_full(expected: str, recognized: str) -> tuple[str, float]:
+    if expected == recognized:
+        return "CORRECT", 1.0
+    dist = _levenshtein_full(expected, recognized)
+    max_len = max(len(expected), len(recognized))
+    if dist == 1:
+        return "NEAR", 0.95 if max_len <= 4 else 0.9 if max_len <= 7 else 0.85
+    if 1.0 - dist / max_len >= 0.8:
+        return "NEAR", 0.7
+    return "WRONG", 0.0
+
+
+def _mistake(word: str, rng: random.Random) -> str:
+    """Lỗi hay gặp: nuốt âm cuối, thêm/bớt s/ed, sai nguyên âm, đảo chữ, nói từ khác."""
+    kind = rng.randrange(6)
+    if kind == 0 and len(word) > 2:
+        return word[:-1]
+    if kind == 1:
+        return word + rng.choice(["s", "ed", "ing"])
+    if kind == 2:
+        i = rng.randrange(len(word))
+        return word[:i] + rng.choice("aeiou") + word[i + 1:]
+    if kind == 3 and len(word) > 3:
+        i = rng.randrange(len(word) - 1)
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if kind == 4:
+        return rng.choice(_WORDS)
+    return word
+
+
+def _timed(label: str, fn, pairs, rounds: int = 20, before_round=None) -> float:
+    timings = []
+    for _ in range(rounds):
+        if before_round:
+            before_round()
+        started = time.perf_counter()
+        for expected, recognized in pairs:
+            fn(expected, recognized)
+        timings.append(time.perf_counter() - started)
+    per_pair = sorted(timings)[len(timings) // 2] / len(pairs) * 1e6
+    print(f"{label:<28} {per_pair:7.3f} µs/pair")
+    return per_pair
+
+
+if __name__ == "__main__":
+    rng = random.Random(14)
+    pairs = [(w, _mistake(w, rng)) for w in (rng.choice(_WORDS) for _ in range(5000))]
+
+    mismatches = [p for p in pairs if _classify_word(*p) != _classify_full(*p)]
+    assert not mismatches, mismatches[:5]
+    statuses: dict[str, int] = {}
+    for p in pairs:
+        status = _classify_word(*p)[0]
+        statuses[status] = statuses.get(status, 0) + 1
+    print(f"{len(pairs)} pairs, {len(set(pairs))} unique: {statuses}")
+
+    base = _timed("full matrix (cũ)", _classify_full, pairs)
+    _timed("bounded, không memo", _classify_word.__wrapped__, pairs)
+    cold = _timed("bounded, memo trống", _classify_word, pairs, before_round=_classify_word.cache_clear)
+    warm = _timed("bounded, memo ấm", _classify_word, pairs)
+    print(f"speedup: cold {base / cold:.1f}x, warm {base / warm:.1f}x | {_classify_word.cache_info()}")
@@ -61,6 +61,13 @@ class TranscriptionResponse(BaseModel):
         super().__init__(**data)
         self.created_at = DateTime.now()
 
+class ShadowingBatchItemResult(BaseModel):
+    # Kết quả từng clip trong batch; lỗi riêng 1 clip không làm hỏng cả batch
+    index: int
+    sentenceId: Optional[int] = None
+    result: Optional[TranscriptionResponse] = None
+    error: Optional[str] = None
+
 class TranscribeUrlRequest(BaseModel):
     audio_url: str
 
@@ -139,6 +146,16 @@ class TranscribedDto(BaseModel):
     segments: List[SegmentDto]
     class Config:
         from_attributes = True
+
+class TranscribedChunkDto(BaseModel):
+    # 1 chunk audio (cắt theo khoảng lặng) đã transcribe + align xong
+    index: int
+    totalChunks: int
+    start: float
+    end: float
+    segments: List[SegmentDto]
+    class Config:
+        from_attributes = True
 class SentenceAnalyzedDto(BaseModel):
     orderIndex: int
     phoneticUk: Optional[str] = None
@@ -160,6 +177,18 @@ class LessonGenerationAiMetadataDto(BaseModel):
     class Config:
         from_attributes = True
 
+# Metadata lưu theo từng section (mỗi step 1 object gzip), manifest nhỏ trỏ tới các section
+class LessonMetadataSectionDto(BaseModel):
+    url: str
+    encoding: str = "gzip"
+    sizeBytes: int
+    compressedBytes: int
+    sha256: str
+
+class LessonMetadataManifestDto(BaseModel):
+    manifestVersion: int = 1
+    sections: Dict[str, LessonMetadataSectionDto] = {}
+
 
     
 class SpaCyWordAnalysisRequest(BaseModel):
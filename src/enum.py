@@ -11,6 +11,7 @@ class LessonProcessingStep(str, Enum):
     NONE = "NONE"
     PROCESSING_STARTED = "PROCESSING_STARTED"
     SOURCE_FETCHED = "SOURCE_FETCHED"
+    TRANSCRIBING = "TRANSCRIBING"  # tiến độ trung gian của bước transcribe
     TRANSCRIBED = "TRANSCRIBED"
     NLP_ANALYZED = "NLP_ANALYZED"
     COMPLETED = "COMPLETED"
@@ -14,6 +14,8 @@ class BaseErrorCode(Enum):
     NOT_FOUND = (1005, "Không tìm thấy", HTTPStatus.NOT_FOUND)
     BAD_REQUEST = (1006, "Yêu cầu không hợp lệ", HTTPStatus.BAD_REQUEST)
     INVALID_AUDIO_FILE = (1007, "Tệp âm thanh không hợp lệ", HTTPStatus.BAD_REQUEST)
+    ASR_TIMEOUT = (1008, "Nhận dạng giọng nói quá thời gian", HTTPStatus.GATEWAY_TIMEOUT)
+    JOB_CANCELLED = (1009, "Job đã bị huỷ", HTTPStatus.CONFLICT)
 
     def __init__(self, code: int, message: str, status: HTTPStatus):
         self.code = code
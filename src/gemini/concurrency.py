@@ -0,0 +1,155 @@
+# src/gemini/concurrency.py
+"""
+Giới hạn concurrency tự điều chỉnh (AIMD) cho các lời gọi Gemini.
+
+- Batch xong nhanh (<= latency target): tăng cộng, +1 sau mỗi `limit` batch thành công.
+- Batch chậm / lỗi: giảm nhân x0.75. 429 / quota: giảm một nửa, dừng tăng trong lúc backoff
+  rồi thử lại batch (tối đa `rate_limit_retries` lần).
+- Nhiều batch cùng lỗi trong 1 đợt chỉ giảm 1 lần: chỉ batch bắt đầu SAU lần giảm trước mới được giảm tiếp.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from src.gemini.config import config
+
+_SLOW_DECREASE = 0.75
+_RATE_LIMIT_DECREASE = 0.5
+_RATE_LIMIT_NAMES = {"ResourceExhausted", "TooManyRequests"}
+_RECENT_JOBS = 20
+
+
+def is_rate_limit_error(e: BaseException) -> bool:
+    if type(e).__name__ in _RATE_LIMIT_NAMES or getattr(e, "code", None) == 429:
+        return True
+    text = str(e).lower()
+    return "429" in text or "quota" in text or "rate limit" in text
+
+
+class AdaptiveConcurrencyLimiter:
+    def __init__(self, min_limit: int, max_limit: int, initial: int, latency_target: float,
+                 rate_limit_retries: int, rate_limit_backoff: float, name: str = "gemini"):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.latency_target = latency_target
+        self.rate_limit_retries = rate_limit_retries
+        self.rate_limit_backoff = rate_limit_backoff
+
+        self._limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self._in_flight = 0
+        self._cond = asyncio.Condition()
+        self._last_decrease_at = 0.0
+        self._cooldown_until = 0.0
+
+        self._stats = {"calls": 0, "errors": 0, "rateLimited": 0, "retries": 0, "increases": 0, "decreases": 0}
+        self._latency_ewma: float | None = None
+        self._recent_jobs: deque = deque(maxlen=_RECENT_JOBS)
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    # SLOT
+    async def _acquire(self) -> None:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+
+    async def _release(self) -> None:
+        async with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    # AIMD
+    def _increase(self) -> None:
+        if time.monotonic() < self._cooldown_until or self._limit >= self.max_limit:
+            return
+        before = self.limit
+        self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+        if self.limit > before:
+            self._stats["increases"] += 1
+            print(f"[{self.name}] concurrency {before} -> {self.limit}")
+
+    def _decrease(self, started_at: float, factor: float) -> None:
+        if started_at < self._last_decrease_at:
+            return  # đã giảm cho đợt quá tải này rồi
+        before = self.limit
+        self._limit = max(float(self.min_limit), self._limit * factor)
+        self._last_decrease_at = time.monotonic()
+        self._stats["decreases"] += 1
+        print(f"[{self.name}] concurrency {before} -> {self.limit}")
+
+    def _on_done(self, started_at: float, error: BaseException | None) -> bool:
+        """Cập nhật limit; trả về True nếu là lỗi 429/quota."""
+        latency = time.monotonic() - started_at
+        self._stats["calls"] += 1
+        if error is None:
+            self._latency_ewma = latency if self._latency_ewma is None else 0.8 * self._latency_ewma + 0.2 * latency
+            if latency > self.latency_target:
+                self._decrease(started_at, _SLOW_DECREASE)
+            else:
+                self._increase()
+            return False
+
+        self._stats["errors"] += 1
+        if is_rate_limit_error(error):
+            self._stats["rateLimited"] += 1
+            self._decrease(started_at, _RATE_LIMIT_DECREASE)
+            self._cooldown_until = time.monotonic() + self.rate_limit_backoff
+            return True
+        self._decrease(started_at, _SLOW_DECREASE)
+        return False
+
+    # PUBLIC API
+    async def run(self, fn: Callable[..., Awaitable[Any]], *args) -> Any:
+        attempt = 0
+        while True:
+            await self._acquire()
+            started_at = time.monotonic()
+            try:
+                result = await fn(*args)
+            except Exception as e:
+                rate_limited = self._on_done(started_at, e)
+                if not rate_limited or attempt >= self.rate_limit_retries:
+                    raise
+            else:
+                self._on_done(started_at, None)
+                return result
+            finally:
+                await self._release()
+
+            attempt += 1
+            self._stats["retries"] += 1
+            await asyncio.sleep(self.rate_limit_backoff * 2 ** (attempt - 1))
+
+    def record_job(self, summary: dict) -> None:
+        self._recent_jobs.append(summary)
+
+    def get_stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "minLimit": self.min_limit,
+            "maxLimit": self.max_limit,
+            "inFlight": self._in_flight,
+            "latencyEwmaSeconds": round(self._latency_ewma, 3) if self._latency_ewma is not None else None,
+            "latencyTargetSeconds": self.latency_target,
+            **self._stats,
+            "recentJobs": list(self._recent_jobs),
+        }
+
+
+sentence_batch_limiter = AdaptiveConcurrencyLimiter(
+    min_limit=config.concurrency_min,
+    max_limit=config.concurrency_max,
+    initial=config.concurrency_initial,
+    latency_target=config.latency_target_seconds,
+    rate_limit_retries=config.rate_limit_retries,
+    rate_limit_backoff=config.rate_limit_backoff_seconds,
+    name="gemini_sentence_batch",
+)
@@ -4,6 +4,14 @@ class GeminiConfig(BaseSettings):
     api_key: str
     model: str = "gemini-2.5-flash"
 
+    # AIMD cho batch phân tích câu (dùng chung mọi lesson job trong process)
+    concurrency_min: int = 1
+    concurrency_max: int = 4
+    concurrency_initial: int = 1
+    latency_target_seconds: float = 30.0  # batch chậm hơn -> coi như quá tải, giảm concurrency
+    rate_limit_retries: int = 3  # 429/quota -> giảm một nửa rồi thử lại batch
+    rate_limit_backoff_seconds: float = 2.0
+
     model_config = {
         "env_file": ".env",
         "env_prefix": "GEMINI_",   
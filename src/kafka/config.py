@@ -11,14 +11,19 @@ def create_kafka_producer() -> Producer:
     }
     return Producer(producer_config)
 
-def create_kafka_consumer(topics: list[str]) -> Consumer:
+def create_kafka_consumer(topics: list[str], on_assign=None, on_revoke=None) -> Consumer:
     consumer_config = {
         "bootstrap.servers": "localhost:9092", 
         "group.id": "lp-service-group", 
         "auto.offset.reset": "earliest", # Đọc từ đầu nếu chưa có offset
-        "enable.auto.commit": True, # Tự động commit offset
-        "auto.commit.interval.ms": 1000, # Commit mỗi giây
+        "enable.auto.commit": False, # Commit thủ công sau khi handler xử lý xong
+        "max.poll.interval.ms": 600000, # Đang pause vẫn poll đều, nhưng để dư cho job lesson dài
     }
     consumer = Consumer(consumer_config)
-    consumer.subscribe(topics)
+    callbacks = {}
+    if on_assign:
+        callbacks["on_assign"] = on_assign
+    if on_revoke:
+        callbacks["on_revoke"] = on_revoke
+    consumer.subscribe(topics, **callbacks)
     return consumer
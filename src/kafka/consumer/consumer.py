@@ -1,9 +1,13 @@
-from typing import Any, Callable, Dict, Tuple, Type
+from typing import Any, Callable, Dict, Optional, Tuple, Type
 import asyncio
 import json
-from confluent_kafka import KafkaError
+import os
+import threading
+import time
+from confluent_kafka import KafkaError, TopicPartition
 from src.kafka.config import create_kafka_consumer
 from src.kafka.event import LessonGenerationRequestedEvent
+from src.kafka.io_thread import KAFKA_CONSUME_TIMEOUT, kafka_io
 from src.kafka.topic import LESSON_GENERATION_REQUESTED_TOPIC
 
 TopicHandler = Callable[[Any], asyncio.Task | Any]
@@ -14,43 +18,248 @@ TOPIC_ROUTES: Dict[str, TopicRoute] = {
     LESSON_GENERATION_REQUESTED_TOPIC: (LessonGenerationRequestedEvent, handle_lesson_generation_requested),
 }
 
+# Số lesson job chạy song song tối đa trên 1 instance; đầy -> pause partition, không poll thêm
+KAFKA_MAX_IN_FLIGHT = int(os.getenv("KAFKA_MAX_IN_FLIGHT", "2"))
 
-async def consume_events():
-    topics = list(TOPIC_ROUTES.keys())
-    consumer = await asyncio.to_thread(create_kafka_consumer, topics)
-    print(f"kafka_consumer_started topics={topics}")
-
-    try:
-        while True:
-            msg = await asyncio.to_thread(consumer.poll, 0.1)
-            if msg is None:
-                continue
 
+class _PartitionOffsets:
+    """
+    Offset của 1 partition: job có thể xong không theo thứ tự,
+    chỉ commit tới offset nhỏ nhất còn đang chạy (không bao giờ ack message chưa xử lý).
+    """
+
+    def __init__(self):
+        self.in_flight: set[int] = set()
+        self.next_offset: Optional[int] = None  # offset sau message cuối đã nhận
+        self.committed: Optional[int] = None
+
+    def start(self, offset: int) -> None:
+        if self.committed is None:
+            self.committed = offset  # vị trí bắt đầu đọc: chưa có gì mới để commit
+        self.in_flight.add(offset)
+        self.next_offset = max(self.next_offset or 0, offset + 1)
+
+    def finish(self, offset: int) -> Optional[int]:
+        """Trả về offset cần commit (None nếu watermark chưa tiến)."""
+        self.in_flight.discard(offset)
+        watermark = min(self.in_flight) if self.in_flight else self.next_offset
+        if watermark is None or (self.committed is not None and watermark <= self.committed):
+            return None
+        self.committed = watermark
+        return watermark
+
+
+class KafkaConsumerRuntime:
+    """
+    Consumer có giới hạn concurrency:
+    - Tối đa `max_in_flight` handler chạy cùng lúc; đầy -> pause toàn bộ partition, bớt -> resume.
+    - Tắt auto commit; commit offset sau khi handler xong (lỗi cũng commit, tránh message độc lặp vô hạn).
+    - Fetch / pause / seek / commit chạy trên thread Kafka I/O riêng (`kafka_io`), nhận message theo batch.
+    - Metrics: in-flight, paused, lag theo partition.
+    """
+
+    def __init__(self, routes: Dict[str, TopicRoute], max_in_flight: int = KAFKA_MAX_IN_FLIGHT):
+        self.routes = routes
+        self.max_in_flight = max(1, max_in_flight)
+
+        self._consumer = None
+        self._tasks: set[asyncio.Task] = set()
+        self._offsets: dict[tuple[str, int], _PartitionOffsets] = {}
+        self._lock = threading.Lock()  # on_assign/on_revoke chạy trong thread Kafka I/O
+        # (topic, partition) -> epoch sau lần seek gần nhất; batch fetch trước đó là dữ liệu cũ
+        self._seek_epochs: dict[tuple[str, int], int] = {}
+        self._paused = False
+        self._assignment_changed = False
+
+        self._stats = {"received": 0, "completed": 0, "failed": 0, "invalid": 0, "commits": 0, "pauses": 0}
+        self._paused_seconds = 0.0
+        self._paused_since: Optional[float] = None
+
+    # REBALANCE (thread Kafka I/O)
+    def _on_assign(self, consumer, partitions) -> None:
+        with self._lock:
+            for p in partitions:
+                self._offsets.setdefault((p.topic, p.partition), _PartitionOffsets())
+            # Partition mới chưa theo trạng thái pause/resume hiện tại -> vòng lặp áp lại
+            self._assignment_changed = True
+
+    def _on_revoke(self, consumer, partitions) -> None:
+        with self._lock:
+            for p in partitions:
+                self._offsets.pop((p.topic, p.partition), None)
+
+    # BACKPRESSURE
+    def _saturated(self) -> bool:
+        return len(self._tasks) >= self.max_in_flight
+
+    async def _apply_backpressure(self) -> None:
+        saturated = self._saturated()
+        if saturated == self._paused and not self._assignment_changed:
+            return
+        self._assignment_changed = False
+
+        assignment = await kafka_io.call(self._consumer.assignment)
+        if saturated:
+            await kafka_io.pause(assignment)
+            if not self._paused:
+                self._stats["pauses"] += 1
+                self._paused_since = time.monotonic()
+                print(f"kafka_consumer_paused in_flight={len(self._tasks)}")
+        else:
+            await kafka_io.resume(assignment)
+            if self._paused_since is not None:
+                self._paused_seconds += time.monotonic() - self._paused_since
+                self._paused_since = None
+                print(f"kafka_consumer_resumed in_flight={len(self._tasks)}")
+        self._paused = saturated
+
+    # COMMIT
+    def _commit(self, topic: str, partition: int, offset: int) -> None:
+        with self._lock:
+            tracker = self._offsets.get((topic, partition))
+            commit_offset = tracker.finish(offset) if tracker else None
+        if commit_offset is None:
+            return
+
+        def on_done(future) -> None:
+            if future.exception() is not None:
+                print(f"kafka_commit_error topic={topic} partition={partition} offset={commit_offset} "
+                      f"err={future.exception()}")
+
+        kafka_io.submit(
+            self._consumer.commit, offsets=[TopicPartition(topic, partition, commit_offset)], asynchronous=True
+        ).add_done_callback(on_done)
+        self._stats["commits"] += 1
+
+    async def _run_handler(self, handler, event, topic: str, partition: int, offset: int) -> None:
+        # Bị huỷ lúc shutdown (CancelledError) -> không commit, message được xử lý lại sau restart
+        try:
+            await handler(event)
+            self._stats["completed"] += 1
+        except Exception as e:
+            self._stats["failed"] += 1
+            print(f"kafka_handler_error topic={topic} partition={partition} offset={offset} err={e}")
+        self._commit(topic, partition, offset)
+
+    def _dispatch(self, msg) -> None:
+        topic, partition, offset = msg.topic(), msg.partition(), msg.offset()
+        with self._lock:
+            tracker = self._offsets.setdefault((topic, partition), _PartitionOffsets())
+            tracker.start(offset)
+
+        route = self.routes.get(topic)
+        try:
+            if not route:
+                raise ValueError(f"unknown topic {topic}")
+            model_cls, handler = route
+            payload = json.loads(msg.value().decode("utf-8"))
+            event = model_cls(**payload)
+        except Exception as e:
+            # Message hỏng: bỏ qua nhưng vẫn commit để không chặn partition
+            self._stats["invalid"] += 1
+            print(f"kafka_message_error topic={topic} err={e}")
+            self._commit(topic, partition, offset)
+            return
+
+        task = asyncio.create_task(self._run_handler(handler, event, topic, partition, offset))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle_batch(self, epoch: int, batch: list) -> None:
+        for msg in batch:
             if msg.error():
                 if msg.error().code() != KafkaError._PARTITION_EOF:
                     print(f"kafka_error err={msg.error()}")
                 continue
 
-            route = TOPIC_ROUTES.get(msg.topic())
-            if not route:
-                print(f"KAFKA UNKNOWN TOPIC {msg.topic()}")
+            key = (msg.topic(), msg.partition())
+            if epoch < self._seek_epochs.get(key, 0):
+                continue  # fetch trước lần tua lại -> sẽ được đọc lại từ offset đã seek
+
+            if self._saturated():
+                # Message đã fetch trước khi pause -> tua lại, lần resume sau đọc lại
+                await self._apply_backpressure()
+                tp = TopicPartition(msg.topic(), msg.partition(), msg.offset())
+                self._seek_epochs[key] = await kafka_io.seek(tp)
                 continue
 
-            model_cls, handler = route
+            self._stats["received"] += 1
+            self._dispatch(msg)
+
+    # MAIN LOOP
+    async def run(self) -> None:
+        topics = list(self.routes.keys())
+        self._consumer = await kafka_io.call(
+            create_kafka_consumer, topics, on_assign=self._on_assign, on_revoke=self._on_revoke
+        )
+        kafka_io.attach_consumer(self._consumer)
+        print(f"kafka_consumer_started topics={topics} max_in_flight={self.max_in_flight}")
+
+        try:
+            while True:
+                await self._apply_backpressure()
+                try:
+                    epoch, batch = await asyncio.wait_for(kafka_io.messages.get(), KAFKA_CONSUME_TIMEOUT)
+                except asyncio.TimeoutError:
+                    continue
+                await self._handle_batch(epoch, batch)
+
+        except asyncio.CancelledError:
+            print("kafka_consumer_stopping")
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+            kafka_io.detach_consumer()
+            await kafka_io.call(self._consumer.close)
+            print("kafka_consumer_stopped")
+
+    # METRICS
+    def get_metrics(self) -> dict:
+        partitions = []
+        with self._lock:
+            offsets = dict(self._offsets)
+        for (topic, partition), tracker in offsets.items():
+            lag = None
+            if self._consumer is not None:
+                try:
+                    _, high = self._consumer.get_watermark_offsets(TopicPartition(topic, partition), cached=True)
+                    if high >= 0 and tracker.committed is not None:
+                        lag = max(0, high - tracker.committed)
+                except Exception:
+                    pass
+            partitions.append({
+                "topic": topic,
+                "partition": partition,
+                "inFlight": len(tracker.in_flight),
+                "committedOffset": tracker.committed,
+                "lag": lag,
+            })
+
+        paused_seconds = self._paused_seconds
+        if self._paused_since is not None:
+            paused_seconds += time.monotonic() - self._paused_since
+        return {
+            "maxInFlight": self.max_in_flight,
+            "inFlight": len(self._tasks),
+            "paused": self._paused,
+            "pausedSeconds": round(paused_seconds, 3),
+            "totalLag": sum(p["lag"] or 0 for p in partitions),
+            "partitions": partitions,
+            "io": kafka_io.get_stats(),
+            **self._stats,
+        }
+
+
+consumer_runtime = KafkaConsumerRuntime(TOPIC_ROUTES)
+
+
+async def consume_events():
+    await consumer_runtime.run()
 
-            try:
-                payload = json.loads(msg.value().decode("utf-8"))
-                event = model_cls(**payload)
-                asyncio.create_task(handler(event))
-            except Exception as e:
-                print(f"kafka_message_error topic={msg.topic()} err={e}")
 
-    except asyncio.CancelledError:
-        print("kafka_consumer_stopping")
-    finally:
-        await asyncio.to_thread(consumer.close)
-        print("kafka_consumer_stopped")
+def get_consumer_metrics() -> dict:
+    return consumer_runtime.get_metrics()
 
 
 async def start_kafka_consumers():
-    await consume_events()
\ No newline at end of file
+    await consume_events()
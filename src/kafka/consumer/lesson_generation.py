@@ -1,50 +1,39 @@
 import asyncio
-import json
+import os
 from typing import List
 
 from src import dto
 from src.enum import LessonProcessingStep, LessonSourceType
 from src.kafka.event import LessonGenerationRequestedEvent, LessonProcessingStepUpdatedEvent
 from src.kafka.producer import publish_lesson_processing_step_updated
-from src.services import media_service, ai_job_service, speech_to_text_service
-from src.services.file_service import fetch_json_from_url, file_exists
+from src.services import media_service, job_cancellation, speech_to_text_service, lesson_metadata_store, \
+    nlp_checkpoint_store, single_flight, audio_cache
+from src.services.job_cancellation import CancelToken
+from src.services.file_service import file_exists
 from src.s3_storage import cloud_service
-from src.utils.chunk_utils import chunk_list
 from src.gemini import analyzer
+from src.gemini.concurrency import AdaptiveConcurrencyLimiter, sentence_batch_limiter
+from src.utils.source_id import url_source_id, youtube_video_id
+
+# 1 = NLP (Gemini) chạy song song với ASR: đủ BATCH_SIZE câu là gửi luôn, không chờ transcribe xong
+LESSON_PIPELINE_OVERLAP = os.getenv("LESSON_PIPELINE_OVERLAP", "1") == "1"
 
 
 async def _is_cancelled(ai_job_id: str | None) -> bool:
     if not ai_job_id:
         return False
-    cancelled = await ai_job_service.ai_job_was_cancelled(ai_job_id)
+    # Cờ trong RAM do listener pub/sub cập nhật -> không tốn round-trip Redis mỗi bước
+    cancelled = await job_cancellation.is_cancelled(ai_job_id)
     if cancelled:
         print(f"lesson_generation_cancelled ai_job_id={ai_job_id}")
     return cancelled
 
 
-async def _load_metadata(url: str | None) -> dto.LessonGenerationAiMetadataDto:
-    if not url:
-        return dto.LessonGenerationAiMetadataDto()
-    try:
-        data = await fetch_json_from_url(url)
-        return dto.LessonGenerationAiMetadataDto.model_validate(data) if data else dto.LessonGenerationAiMetadataDto()
-    except Exception:
-        return dto.LessonGenerationAiMetadataDto()
-
-
-async def _save_metadata(lesson_id: int | None, metadata: dto.LessonGenerationAiMetadataDto) -> str | None:
-    if not lesson_id:
-        return None
-    return await cloud_service.upload_json_content(
-        json.dumps(metadata.model_dump(by_alias=True), ensure_ascii=False),
-        public_id=f"lps/lessons/{lesson_id}/ai-metadata",
-    )
-
-
 async def _publish_step(ai_job_id: str | None, step: LessonProcessingStep, message: str, 
                        audio_url: str | None = None, source_reference_id: str | None = None,
                        thumbnail_url: str | None = None, is_skip: bool = False,
-                       metadata_url: str | None = None, duration_seconds: int = 0) -> None:
+                       metadata_url: str | None = None, duration_seconds: int = 0,
+                       progress_percent: int | None = None) -> None:
     await publish_lesson_processing_step_updated(
         LessonProcessingStepUpdatedEvent(
             aiJobId=ai_job_id,
@@ -56,19 +45,160 @@ async def _publish_step(ai_job_id: str | None, step: LessonProcessingStep, messa
             aiMetadataUrl=metadata_url,
             durationSeconds=duration_seconds,
             aiMessage=message,
+            progressPercent=progress_percent,
         )
     )
     print(f">[Lesson Generation] Step {step} published for ai_job_id={ai_job_id}: {message}")
 
 
-async def _download_audio_by_source(event: LessonGenerationRequestedEvent) -> dto.AudioInfo:
+class _NlpStage:
+    """
+    Stage NLP của pipeline: nhận segment dần dần (theo thứ tự), đủ `batch_size` câu
+    thì đẩy 1 batch vào queue; worker gọi Gemini song song với ASR.
+    Batch giống hệt cách chia cũ (orderIndex liên tục, mỗi batch `batch_size` câu).
+    Số batch chạy cùng lúc do `limiter` (AIMD, dùng chung cả process) quyết định.
+    Batch xong được checkpoint vào Redis theo `checkpoint_owner` (lesson) -> lần chạy
+    lại (lỗi giữa chừng, is_restart) chỉ gọi Gemini cho batch còn thiếu.
+    """
+
+    def __init__(self, ai_job_id: str | None, batch_size: int, checkpoint_owner: str | None = None,
+                 limiter: AdaptiveConcurrencyLimiter = sentence_batch_limiter):
+        self.ai_job_id = ai_job_id
+        self.checkpoint_owner = checkpoint_owner
+        self.batch_size = batch_size
+        self.limiter = limiter
+        self.cancelled = False
+        self.analyzed: List[dto.SentenceAnalyzedDto] = []
+
+        # Concurrency thực tế của job này (limit lúc gửi từng batch)
+        self._limits: List[int] = []
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._resumed_batches = 0
+
+        # 1 lệnh HGETALL, chạy song song với ASR
+        self._checkpoints = asyncio.create_task(nlp_checkpoint_store.load(checkpoint_owner))
+
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pending: List[dict] = []
+        self._next_index = 0
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(limiter.max_limit)]
+
+    def add_segments(self, segments: List[dto.SegmentDto]) -> None:
+        for seg in segments:
+            self._pending.append({"orderIndex": self._next_index, "text": seg.text})
+            self._next_index += 1
+            if len(self._pending) >= self.batch_size:
+                self._queue.put_nowait(self._pending)
+                self._pending = []
+
+    def raise_if_failed(self) -> None:
+        # Gemini lỗi giữa chừng -> fail job ngay, không chờ ASR chạy hết
+        for worker in self._workers:
+            if worker.done() and not worker.cancelled() and worker.exception():
+                raise worker.exception()
+
+    async def finish(self) -> List[dto.SentenceAnalyzedDto] | None:
+        """Đẩy phần còn lại, chờ mọi batch xong. None nếu job bị huỷ giữa chừng."""
+        if self._pending:
+            self._queue.put_nowait(self._pending)
+            self._pending = []
+        for _ in self._workers:
+            self._queue.put_nowait(None)
+
+        await asyncio.gather(*self._workers)
+        if self.cancelled:
+            return None
+        if self._resumed_batches:
+            print(f"nlp_checkpoint_resumed ai_job_id={self.ai_job_id} batches={self._resumed_batches}")
+        self._record_concurrency()
+        return sorted(self.analyzed, key=lambda s: s.orderIndex)
+
+    def _record_concurrency(self) -> None:
+        if not self._limits:
+            return
+        summary = {
+            "aiJobId": self.ai_job_id,
+            "calls": len(self._limits),
+            "minLimit": min(self._limits),
+            "maxLimit": max(self._limits),
+            "avgLimit": round(sum(self._limits) / len(self._limits), 2),
+            "peakInFlight": self._peak_in_flight,
+        }
+        self.limiter.record_job(summary)
+        print(f"nlp_concurrency ai_job_id={self.ai_job_id} calls={summary['calls']} "
+              f"limit={summary['minLimit']}..{summary['maxLimit']} avg={summary['avgLimit']} "
+              f"peak_in_flight={summary['peakInFlight']}")
+
+    async def cancel(self) -> None:
+        for task in (*self._workers, self._checkpoints):
+            task.cancel()
+        await asyncio.gather(*self._workers, self._checkpoints, return_exceptions=True)
+
+    async def _worker(self) -> None:
+        while True:
+            batch = await self._queue.get()
+            if batch is None or self.cancelled:
+                return
+            if await _is_cancelled(self.ai_job_id):
+                self.cancelled = True
+                return
+
+            result = nlp_checkpoint_store.lookup(await self._checkpoints, batch)
+            if result is None:
+                # Lesson khác cùng nguồn đang phân tích đúng batch này -> chờ dùng chung
+                result = await single_flight.run(
+                    f"nlp:{nlp_checkpoint_store.batch_digest(batch)}",
+                    lambda: self.limiter.run(self._analyze, batch),
+                )
+                await nlp_checkpoint_store.save(self.checkpoint_owner, batch, result)
+            else:
+                self._resumed_batches += 1
+            self.analyzed.extend(dto.SentenceAnalyzedDto(**item) for item in result)
+
+    async def _analyze(self, batch: List[dict]) -> list:
+        # Chạy bên trong slot của limiter -> đếm đúng số batch đang gọi Gemini
+        self._limits.append(self.limiter.limit)
+        self._in_flight += 1
+        self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        try:
+            return await analyzer.analyze_sentence_batch(batch)
+        finally:
+            self._in_flight -= 1
+
+
+async def _download_audio_by_source(event: LessonGenerationRequestedEvent,
+                                    cancel_token: CancelToken | None = None) -> dto.AudioInfo:
     request = dto.MediaAudioCreateRequest(input_url=event.source_url)
     if event.source_type == LessonSourceType.youtube:
-        return await media_service.download_youtube_audio(request)
-    return await media_service.download_audio_file(request)
+        return await media_service.download_youtube_audio(request, cancel_token)
+    return await media_service.download_audio_file(request, cancel_token)
+
+
+def _expected_source_id(event: LessonGenerationRequestedEvent) -> str | None:
+    """Tên file audio (bỏ đuôi) mà media_service sẽ dùng cho nguồn này -> pin trước khi tải."""
+    if not event.source_url:
+        return None
+    if event.source_type == LessonSourceType.youtube:
+        return youtube_video_id(event.source_url)
+    return url_source_id(event.source_url)
+
 
+async def _fetch_source(event: LessonGenerationRequestedEvent, cancel_token: CancelToken) -> dto.AudioInfo:
+    """Tải audio nguồn + upload Cloudinary; chạy 1 lần cho mọi job cùng nguồn (single-flight)."""
+    audio_info = await _download_audio_by_source(event, cancel_token)
+    cancel_token.raise_if_cancelled()
 
-async def _ensure_local_audio_file(audio_info: dto.AudioInfo) -> dto.AudioInfo:
+    audio_info.audioUrl = await cloud_service.upload_file(
+        audio_info.file_path,
+        public_id=f"lps/lessons/audio/{audio_info.sourceReferenceId}",
+        resource_type="video",
+    )
+    return audio_info
+
+
+async def _ensure_local_audio_file(audio_info: dto.AudioInfo,
+                                   cancel_token: CancelToken | None = None) -> dto.AudioInfo:
     if file_exists(audio_info.file_path):
         print(f"Audio file already exists locally: {audio_info.file_path}")
         return audio_info
@@ -77,7 +207,8 @@ async def _ensure_local_audio_file(audio_info: dto.AudioInfo) -> dto.AudioInfo:
         dto.MediaAudioCreateRequest(
             input_url=audio_info.audioUrl,
             audio_name=audio_info.sourceReferenceId,
-        )
+        ),
+        cancel_token,
     )
     audio_info.file_path = downloaded.file_path
     print(f"Downloaded audio file locally: {audio_info.file_path}")
@@ -86,41 +217,61 @@ async def _ensure_local_audio_file(audio_info: dto.AudioInfo) -> dto.AudioInfo:
 
 async def handle_lesson_generation_requested(event: LessonGenerationRequestedEvent) -> None:
     print(f"[Lesson Generation] Started for ai_job_id={event.ai_job_id}")
-    BATCH_SIZE, MAX_CONCURRENCY = 10, 1
+    BATCH_SIZE = 10
+    nlp_stage: _NlpStage | None = None
+    cancel_token: CancelToken | None = None
+    # File audio job đang dùng -> audio_cache không evict cho tới khi job xong
+    pinned_audio: set[str] = set()
+
+    def pin_audio(source_id: str | None) -> None:
+        if source_id and source_id not in pinned_audio:
+            audio_cache.acquire(source_id)
+            pinned_audio.add(source_id)
 
     try:
+        # Token nhận lệnh huỷ qua pub/sub, truyền xuống download / ASR / Gemini
+        cancel_token = await job_cancellation.register(event.ai_job_id)
         await asyncio.sleep(2)
         if await _is_cancelled(event.ai_job_id):
             return
 
-        metadata = await _load_metadata(event.ai_meta_data_url)
+        # Chỉ tải manifest; section nào cần mới tải
+        metadata = await lesson_metadata_store.load(event.lesson_id, event.ai_meta_data_url)
         metadata_url = event.ai_meta_data_url
+        # Nhiều lesson cùng nguồn (hoặc event bị giao lại) -> download / ASR / Gemini chỉ chạy 1 lần
+        source_key = single_flight.source_key(event.source_type, event.source_url)
+        pin_audio(_expected_source_id(event))
 
         # STEP 1: source audio
-        if metadata.sourceFetched is None or event.is_restart:
-            audio_info = await _download_audio_by_source(event)
-            if await _is_cancelled(event.ai_job_id):
-                return
-
-            audio_url = await cloud_service.upload_file(
-                audio_info.file_path,
-                public_id=f"lps/lessons/audio/{audio_info.sourceReferenceId}",
-                resource_type="video",
-            )
-
-            audio_info.audioUrl = audio_url
-            metadata.sourceFetched = dto.SourceFetchedDto.model_validate(audio_info.model_dump(by_alias=True))
-            metadata_url = await _save_metadata(event.lesson_id, metadata)
+        source_fetched = None if event.is_restart else await metadata.get("sourceFetched")
+        if source_fetched is None:
+            audio_info = await cancel_token.guard(single_flight.run(
+                f"source:{source_key}" if source_key else None,
+                lambda: _fetch_source(event, cancel_token),
+                encode=lambda info: info.model_dump(by_alias=True),
+                decode=dto.AudioInfo.model_validate,
+                fresh=event.is_restart,
+            ))
+            # Kết quả dùng chung: copy riêng; từ instance khác thì file local chưa có -> tải từ Cloudinary
+            pin_audio(audio_info.sourceReferenceId)
+            audio_info = await cancel_token.guard(_ensure_local_audio_file(audio_info.model_copy(), cancel_token))
+            audio_url = audio_info.audioUrl
+            source_fetched = dto.SourceFetchedDto.model_validate(audio_info.model_dump(by_alias=True))
             is_skip_step1 = False
         else:
-            audio_info = dto.AudioInfo.model_validate(metadata.sourceFetched)
+            audio_info = dto.AudioInfo.model_validate(source_fetched)
             audio_url = audio_info.audioUrl
             is_skip_step1 = True
-            audio_info = await _ensure_local_audio_file(audio_info)
+            pin_audio(audio_info.sourceReferenceId)
+            audio_info = await cancel_token.guard(_ensure_local_audio_file(audio_info, cancel_token))
 
-        if metadata.sourceFetched and not metadata.sourceFetched.duration:
+        # Duration phải có trước khi ghi section -> lần restart sau không probe lại
+        missing_duration = not source_fetched.duration
+        if missing_duration:
             duration = await speech_to_text_service.get_audio_duration(audio_info.file_path)
-            metadata.sourceFetched.duration = int(duration)
+            source_fetched.duration = int(duration)
+        if not is_skip_step1 or missing_duration:
+            metadata_url = await metadata.put("sourceFetched", source_fetched)
 
         if await _is_cancelled(event.ai_job_id):
             return
@@ -134,15 +285,54 @@ async def handle_lesson_generation_requested(event: LessonGenerationRequestedEve
             thumbnail_url=audio_info.thumbnailUrl,
             is_skip=is_skip_step1,
             metadata_url=metadata_url,
-            duration_seconds=int(metadata.sourceFetched.duration or 0) if metadata.sourceFetched else 0,
+            duration_seconds=int(source_fetched.duration or 0),
         )
         print(f"✅ [Lesson Generation] Step SOURCE_FETCHED completed for ai_job_id={event.ai_job_id}")
 
-        # STEP 2: transcribe
-        if metadata.transcribed is None or event.is_restart:
-            raw = await speech_to_text_service.transcribe(audio_info.file_path)
-            metadata.transcribed = dto.TranscribedDto.model_validate(raw)
-            metadata_url = await _save_metadata(event.lesson_id, metadata)
+        # STEP 3 cần chạy -> khởi động stage NLP từ bây giờ để nhận câu ngay khi ASR ra
+        if event.is_restart or not metadata.has("nlpAnalyzed"):
+            checkpoint_owner = f"lesson:{event.lesson_id}" if event.lesson_id else event.ai_job_id
+            nlp_stage = _NlpStage(event.ai_job_id, BATCH_SIZE, checkpoint_owner)
+
+        # STEP 2: transcribe (transcript cũ chỉ tải về khi NLP cần chạy lại trên nó)
+        transcribed = None
+        reuse_transcript = not event.is_restart and metadata.has("transcribed")
+        if reuse_transcript and nlp_stage:
+            transcribed = await metadata.get("transcribed")
+            reuse_transcript = transcribed is not None
+
+        streamed_to_nlp = False
+
+        async def transcribe_and_stream() -> dto.TranscribedDto:
+            nonlocal streamed_to_nlp
+            segments: List[dto.SegmentDto] = []
+            async for chunk in speech_to_text_service.transcribe_stream(audio_info.file_path, cancel_token=cancel_token):
+                segments.extend(chunk.segments)
+                if nlp_stage and LESSON_PIPELINE_OVERLAP:
+                    nlp_stage.add_segments(chunk.segments)
+                    nlp_stage.raise_if_failed()
+                    streamed_to_nlp = True
+                cancel_token.raise_if_cancelled()
+
+                # Tiến độ trung gian: UI không còn đứng ở "processing" nhiều phút
+                await _publish_step(
+                    ai_job_id=event.ai_job_id,
+                    step=LessonProcessingStep.TRANSCRIBING,
+                    message=f"Transcribed {chunk.index + 1}/{chunk.totalChunks} chunks ({int(chunk.end)}s).",
+                    progress_percent=int((chunk.index + 1) * 100 / chunk.totalChunks),
+                )
+            return dto.TranscribedDto(segments=segments)
+
+        if not reuse_transcript:
+            # Job cùng nguồn đang transcribe -> chờ transcript của job đó (không có tiến độ từng chunk)
+            transcribed = await cancel_token.guard(single_flight.run(
+                f"transcribe:{source_key}" if source_key else None,
+                transcribe_and_stream,
+                encode=lambda t: t.model_dump(by_alias=True),
+                decode=dto.TranscribedDto.model_validate,
+                fresh=event.is_restart,
+            ))
+            metadata_url = await metadata.put("transcribed", transcribed)
             is_skip_step2 = False
         else:
             is_skip_step2 = True
@@ -160,28 +350,16 @@ async def handle_lesson_generation_requested(event: LessonGenerationRequestedEve
         )
         print(f"✅ [Lesson Generation] Step TRANSCRIBED completed for ai_job_id={event.ai_job_id}")
 
-        # STEP 3: NLP
-        if metadata.nlpAnalyzed is None or event.is_restart:
-            segments = metadata.transcribed.segments
-            sentences_payload = [{"orderIndex": i, "text": seg.text} for i, seg in enumerate(segments)]
-            chunks = list(chunk_list(sentences_payload, BATCH_SIZE))
-            analyzed: List[dto.SentenceAnalyzedDto] = []
-
-            for i in range(0, len(chunks), MAX_CONCURRENCY):
-                if await _is_cancelled(event.ai_job_id):
-                    return
+        # STEP 3: NLP (phần lớn batch đã chạy xong trong lúc transcribe)
+        if nlp_stage:
+            # Transcript lấy lại từ metadata cũ / từ job khác, hoặc tắt overlap -> gửi toàn bộ câu bây giờ
+            if not streamed_to_nlp:
+                nlp_stage.add_segments(transcribed.segments)
 
-                wave = chunks[i:i + MAX_CONCURRENCY]
-                results = await asyncio.gather(*[analyzer.analyze_sentence_batch(chunk) for chunk in wave], return_exceptions=True)
-
-                for chunk, result in zip(wave, results):
-                    if isinstance(result, Exception):
-                        raise result
-                    analyzed.extend(dto.SentenceAnalyzedDto(**item) for item in result)
-
-            analyzed.sort(key=lambda s: s.orderIndex)
-            metadata.nlpAnalyzed = dto.NlpAnalyzedDto(sentences=analyzed)
-            metadata_url = await _save_metadata(event.lesson_id, metadata)
+            analyzed = await cancel_token.guard(nlp_stage.finish())
+            if analyzed is None:
+                return
+            metadata_url = await metadata.put("nlpAnalyzed", dto.NlpAnalyzedDto(sentences=analyzed))
             is_skip_step3 = False
         else:
             is_skip_step3 = True
@@ -208,6 +386,9 @@ async def handle_lesson_generation_requested(event: LessonGenerationRequestedEve
         )
 
     except Exception as e:
+        if job_cancellation.is_cancel_error(e):
+            print(f"lesson_generation_cancelled ai_job_id={event.ai_job_id}")
+            return
         print(f"lesson_generation_failed ai_job_id={event.ai_job_id} err={e}")
         await publish_lesson_processing_step_updated(
             LessonProcessingStepUpdatedEvent(
@@ -217,4 +398,11 @@ async def handle_lesson_generation_requested(event: LessonGenerationRequestedEve
             )
         )
     finally:
+        # Huỷ / lỗi giữa chừng -> dừng các batch Gemini còn lại
+        if nlp_stage:
+            await nlp_stage.cancel()
+        if cancel_token:
+            job_cancellation.release(cancel_token)
+        for source_id in pinned_audio:
+            audio_cache.release(source_id)
         print(f"lesson_generation_done ai_job_id={event.ai_job_id}")
\ No newline at end of file
@@ -26,6 +26,7 @@ class LessonProcessingStepUpdatedEvent(BaseModel):
     is_skip: Optional[bool] = Field(None, alias="isSkip")
     ai_meta_data_url: Optional[str] = Field(None, alias="aiMetadataUrl")
     duration_seconds: Optional[int] = Field(None, alias="durationSeconds")
+    progress_percent: Optional[int] = Field(None, alias="progressPercent")
 
     class Config:
         from_attributes = True
@@ -0,0 +1,191 @@
+"""
+Kafka I/O trên 1 thread riêng, không dùng default executor của asyncio
+(nơi ASR / upload / yt-dlp chiếm hết slot -> poll Kafka bị xếp hàng, throughput tụt).
+
+- Consumer: `consume(KAFKA_CONSUME_BATCH, KAFKA_CONSUME_TIMEOUT)` theo batch -> `messages` (asyncio.Queue).
+- Producer: thread gọi `poll(0)` sau mỗi vòng -> delivery report -> `deliveries` (asyncio.Queue).
+- Lệnh khác (tạo consumer, pause/resume/seek/commit/close, flush) gửi vào thread qua `call()` / `submit()`,
+  chạy giữa 2 lần consume -> consumer chỉ do 1 thread điều khiển.
+- Consumer đang pause: thread chờ lệnh (resume phản hồi ngay) và consume không chờ để vẫn phục vụ rebalance.
+- Mỗi batch kèm `epoch` (tăng sau mỗi seek): message fetch trước khi tua lại có epoch cũ -> caller bỏ qua.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+# =========================
+# CONFIG
+# =========================
+KAFKA_CONSUME_BATCH = int(os.getenv("KAFKA_CONSUME_BATCH", "100"))
+# Thời gian chờ tối đa của 1 lần consume = độ trễ tối đa của lệnh pause/seek/commit
+KAFKA_CONSUME_TIMEOUT = float(os.getenv("KAFKA_CONSUME_TIMEOUT", "0.1"))
+
+
+class KafkaIOThread:
+    """1 thread daemon sở hữu consumer + poll producer; bắc cầu sang asyncio bằng queue."""
+
+    def __init__(self, name: str = "kafka-io"):
+        self.name = name
+        self.messages: asyncio.Queue = asyncio.Queue()  # (epoch, [Message])
+        self.deliveries: asyncio.Queue = asyncio.Queue()  # (err, Message)
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._commands: queue.SimpleQueue = queue.SimpleQueue()
+        self._consumer = None
+        self._producer = None
+        self._running = False
+        self._paused = False
+        self._epoch = 0
+
+        self._stats = {"batches": 0, "messages": 0, "maxBatch": 0, "commands": 0,
+                       "deliveries": 0, "deliveryErrors": 0, "errors": 0}
+
+    # LIFECYCLE (event loop)
+    def start(self) -> None:
+        if self._running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        print(f"kafka_io_started batch={KAFKA_CONSUME_BATCH} timeout={KAFKA_CONSUME_TIMEOUT}s")
+
+    async def stop(self, flush_timeout: float = 10) -> None:
+        """Flush producer rồi dừng thread (lệnh còn trong hàng vẫn được chạy)."""
+        if not self._running:
+            return
+        if self._producer is not None:
+            await self.call(self._producer.flush, flush_timeout)
+        self._running = False
+        await asyncio.to_thread(self._thread.join, flush_timeout)
+        print("kafka_io_stopped")
+
+    def attach_consumer(self, consumer) -> None:
+        self._consumer = consumer
+
+    def detach_consumer(self) -> None:
+        self._consumer = None
+
+    def attach_producer(self, producer) -> None:
+        self._producer = producer
+
+    # COMMANDS
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Chạy `fn` trên thread Kafka (gọi được từ mọi thread); trả về concurrent Future."""
+        future: Future = Future()
+        self._commands.put((future, fn, args, kwargs))
+        return future
+
+    async def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        self.start()
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    async def seek(self, partition) -> int:
+        """Tua partition; trả về epoch mới (batch có epoch nhỏ hơn là dữ liệu trước khi tua)."""
+        return await self.call(self._seek, partition)
+
+    async def pause(self, partitions) -> None:
+        await self.call(self._set_paused, partitions, True)
+
+    async def resume(self, partitions) -> None:
+        await self.call(self._set_paused, partitions, False)
+
+    def _set_paused(self, partitions, paused: bool) -> None:
+        if paused:
+            self._consumer.pause(partitions)
+        else:
+            self._consumer.resume(partitions)
+        self._paused = paused
+
+    def _seek(self, partition) -> int:
+        self._consumer.seek(partition)
+        self._epoch += 1
+        return self._epoch
+
+    def on_delivery(self, err, msg) -> None:
+        """Callback `on_delivery` của producer; chạy trong thread Kafka lúc poll."""
+        self._stats["deliveries"] += 1
+        if err is not None:
+            self._stats["deliveryErrors"] += 1
+        self._emit(self.deliveries, (err, msg))
+
+    # THREAD
+    def _emit(self, target: asyncio.Queue, item: Any) -> None:
+        try:
+            self._loop.call_soon_threadsafe(target.put_nowait, item)
+        except RuntimeError:
+            pass  # event loop đã đóng (shutdown)
+
+    def _run_commands(self, wait: float = 0) -> None:
+        while True:
+            try:
+                future, fn, args, kwargs = self._commands.get(timeout=wait) if wait else self._commands.get_nowait()
+            except queue.Empty:
+                return
+            wait = 0
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._stats["commands"] += 1
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def _consume_once(self, consumer) -> None:
+        timeout = KAFKA_CONSUME_TIMEOUT
+        if self._paused:
+            self._run_commands(wait=KAFKA_CONSUME_TIMEOUT)
+            if self._consumer is not consumer:
+                return  # consumer vừa được đóng bởi lệnh trên
+            timeout = 0
+        try:
+            batch = consumer.consume(KAFKA_CONSUME_BATCH, timeout)
+        except Exception as e:
+            self._stats["errors"] += 1
+            print(f"kafka_io_consume_error err={e}")
+            time.sleep(KAFKA_CONSUME_TIMEOUT)
+            return
+        if batch:
+            self._stats["batches"] += 1
+            self._stats["messages"] += len(batch)
+            self._stats["maxBatch"] = max(self._stats["maxBatch"], len(batch))
+            self._emit(self.messages, (self._epoch, batch))
+
+    def _run(self) -> None:
+        while self._running:
+            self._run_commands()
+            consumer, producer = self._consumer, self._producer
+            try:
+                if consumer is not None:
+                    self._consume_once(consumer)
+                    if producer is not None:
+                        producer.poll(0)
+                elif producer is not None:
+                    producer.poll(KAFKA_CONSUME_TIMEOUT)
+                else:
+                    self._run_commands(wait=KAFKA_CONSUME_TIMEOUT)
+            except Exception as e:
+                self._stats["errors"] += 1
+                print(f"kafka_io_error err={e}")
+        self._run_commands()
+
+    # METRICS
+    def get_stats(self) -> dict:
+        batches = self._stats["batches"]
+        return {
+            "running": self._running,
+            "paused": self._paused,
+            "epoch": self._epoch,
+            "pendingCommands": self._commands.qsize(),
+            "queuedBatches": self.messages.qsize(),
+            "avgBatch": round(self._stats["messages"] / batches, 2) if batches else 0,
+            **self._stats,
+        }
+
+
+kafka_io = KafkaIOThread()
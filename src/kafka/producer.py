@@ -1,24 +1,27 @@
-from src.kafka.config import create_kafka_producer
-
 from src.kafka.config import create_kafka_producer
 from src.kafka.event import LessonProcessingStepUpdatedEvent
+from src.kafka.io_thread import kafka_io
 from src.kafka.topic import LESSON_PROCESSING_STEP_UPDATED_TOPIC
-import asyncio
 
 producer = create_kafka_producer()
+# Thread Kafka I/O poll producer -> delivery report, không tốn slot executor mỗi event
+kafka_io.attach_producer(producer)
+
+
 async def publish_lesson_processing_step_updated(event: LessonProcessingStepUpdatedEvent) -> None:
+    kafka_io.start()
     producer.produce(
         topic=LESSON_PROCESSING_STEP_UPDATED_TOPIC,
         key=str(event.ai_job_id),
         value=event.model_dump_json(by_alias=True),
+        on_delivery=kafka_io.on_delivery,
     )
-    await asyncio.to_thread(producer.poll, 0)
-    
 
 
-# Background task để flush messages định kỳ
-async def periodic_flush():
+# Background task đọc delivery report (thay cho flush định kỳ: thread Kafka I/O đã poll liên tục)
+async def consume_delivery_reports():
+    kafka_io.start()
     while True:
-        await asyncio.sleep(1)  # Chạy mỗi giây
-        # Flush trong thread để tránh blocking event loop
-        await asyncio.to_thread(producer.flush, 0.1)  # Timeout ngắn
\ No newline at end of file
+        err, msg = await kafka_io.deliveries.get()
+        if err is not None:
+            print(f"kafka_delivery_error topic={msg.topic()} key={msg.key()} err={err}")
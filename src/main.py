@@ -8,17 +8,22 @@ import torch
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from src.errors.base_exception_handler import (
     base_exception_handler, global_exception_handler, http_exception_handler
 )
 from src.errors.base_exception import BaseException
 from src.discovery_client.eureka_config import register_with_eureka
-from src.kafka.consumer.consumer import start_kafka_consumers
-from src.kafka.producer import periodic_flush, producer
+from src.kafka.consumer.consumer import start_kafka_consumers, get_consumer_metrics
+from src.gemini.concurrency import sentence_batch_limiter
+from src.kafka.io_thread import kafka_io
+from src.kafka.producer import consume_delivery_reports
 from src.s3_storage.config import setup_cloudinary
 from src.redis.redis_client import redis_client
 from src.routers import spaCy_router, tts_router, ai_job_router, speech_to_text_router
+from src.services import speech_to_text_service, warmup_service, job_cancellation, nlp_checkpoint_store, \
+    single_flight, audio_cache
 
 # LOGGING CONFIG
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(name)s | %(message)s")
@@ -39,9 +44,18 @@ async def lifespan(app: FastAPI):
     # await register_with_eureka()
     print("✅ Registered with Eureka")
     
+    # ASR WORKER POOL (mỗi process tự load model)
+    speech_to_text_service.start_asr_pool()
+
+    # WARM-UP (opt-in MODEL_WARMUP=1): chạy nền, /ready báo trạng thái
+    warmup_task = asyncio.create_task(warmup_service.warm_up_models())
+
+    # HUỶ JOB: 1 subscription pub/sub dùng chung cho cả process
+    cancel_listener_task = asyncio.create_task(job_cancellation.run_listener())
+
     # KAFKA CONSUMERS
     kafka_task = asyncio.create_task(start_kafka_consumers())
-    flush_task = asyncio.create_task(periodic_flush())
+    delivery_task = asyncio.create_task(consume_delivery_reports())
     print("✅ Kafka consumers started")
     
 
@@ -51,26 +65,27 @@ async def lifespan(app: FastAPI):
     # ========== SHUTDOWN ==========
     print("Shutting down FastAPI...")
     
+    warmup_task.cancel()
+    cancel_listener_task.cancel()
+
     # STOP KAFKA
     kafka_task.cancel()
-    flush_task.cancel()
+    delivery_task.cancel()
     try:
         await kafka_task
-        await flush_task
+        await delivery_task
     except asyncio.CancelledError:
         pass
-    producer.flush(10)
+    # Flush producer trên thread Kafka I/O rồi dừng thread
+    await kafka_io.stop(flush_timeout=10)
     
     # CLEANUP GPU MEMORY
     print("Cleaning WhisperX & GPU memory...")
     import src.services.speech_to_text_service as stt_service
+    await stt_service.shadowing_batcher.stop()
+    await stt_service.asr_pool.stop()
     stt_service.unload_whisperx()
 
-    try:
-        del whisper_model
-    except:
-        pass
-
     try:
         from whisperx import alignment
         alignment.alignment_model = None
@@ -113,6 +128,24 @@ app.add_exception_handler(Exception, global_exception_handler)
 def health():
     return {"status": "UP"}
 
+# Readiness: chỉ nhận traffic khi model đã load + warm-up xong (503 nếu chưa)
+@app.get("/ready")
+def ready():
+    readiness = warmup_service.get_readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+# Kafka consumer: in-flight job, pause/resume, lag theo partition
+@app.get("/kafka/metrics")
+def kafka_metrics():
+    return {
+        **get_consumer_metrics(),
+        "geminiConcurrency": sentence_batch_limiter.get_stats(),
+        "jobCancellation": job_cancellation.get_stats(),
+        "nlpCheckpoints": nlp_checkpoint_store.get_stats(),
+        "singleFlight": single_flight.get_stats(),
+        "audioCache": audio_cache.get_stats(),
+    }
+
 @app.get("/info")
 def info():
     return {"service": "lps-service", "version": "1.0.0"}
\ No newline at end of file
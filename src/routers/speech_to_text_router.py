@@ -1,104 +1,180 @@
+import asyncio
 import json
 import os
 import uuid
-from fastapi import Depends, Form, UploadFile, File, HTTPException, APIRouter, status
-from src.services.shadowing_service import build_shadowing_result
+from datetime import datetime
+from typing import List, Optional
+from fastapi import (
+    Depends, Form, Query, Request, UploadFile, File, HTTPException, APIRouter, WebSocket, WebSocketDisconnect, status,
+)
+from src.services import sentence_token_store
+from src.services.sentence_token_store import SentenceTokens
+from src.services.shadowing_service import build_shadowing_columns, build_shadowing_result
+from src.services.shadowing_stream_service import ShadowingStreamSession
 from src import dto
 from src.auth.dto import UserPrincipal
 from src.dto import ApiResponse
 from src.auth.dependencies import get_current_user
-from src.services.speech_to_text_service import transcribe, get_audio_duration
+from src.utils.compact_response import columns, compact_response, wants_compact
+from src.services.speech_to_text_service import (
+    SAMPLE_RATE, ShadowingClip, transcribe_batched, transcribe_shadowing_batch,
+    decode_audio_bytes, get_waveform_duration, get_batcher_metrics,
+)
 
 router = APIRouter(prefix="/speech-to-text", tags=["Speech to Text"])
 
-# Thư mục tạm để lưu file upload
-UPLOAD_DIR = "src/temp/shadowing"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+ALLOWED_EXTENSIONS = {".wav", ".mp3", ".m4a", ".flac", ".ogg", ".webm"}
+SHADOWING_BATCH_MAX_ITEMS = int(os.getenv("SHADOWING_BATCH_MAX_ITEMS", "50"))
+
+
+# HELPERS
+def _parse_shadowing_request(sentence_id: int, expected_words) -> dto.ShadowingRequest:
+    """expectedWords: JSON string (form) hoặc list đã parse (websocket)."""
+    words_raw = json.loads(expected_words) if isinstance(expected_words, str) else expected_words
+    return dto.ShadowingRequest(
+        sentenceId=sentence_id,
+        expectedWords=[dto.ShadowingWord(**w) for w in words_raw],
+    )
+
+
+async def _resolve_expected(sentence_id: int, expected_words) -> SentenceTokens:
+    """
+    Có expectedWords -> parse + lưu vào store (lần đầu, hoặc câu đã bị sửa).
+    Không có -> lấy từ store theo sentenceId (client retry chỉ cần gửi sentenceId).
+    """
+    if expected_words:
+        expected = SentenceTokens.from_request(_parse_shadowing_request(sentence_id, expected_words))
+        await sentence_token_store.put(expected)
+        return expected
+
+    expected = await sentence_token_store.get(sentence_id)
+    if expected is None:
+        raise ValueError(f"sentence {sentence_id} is not cached, expectedWords is required")
+    return expected
+
+
+def _build_transcription_response(
+    file_id: str,
+    filename: str,
+    duration: float,
+    transcription_result: dict,
+    shadowing_result: dto.ShadowingResult,
+) -> dto.TranscriptionResponse:
+    segments = []
+    for segment in transcription_result.get("segments", []):
+        segments.append(
+            dto.TranscriptionSegment(
+                start=segment.get("start", 0),
+                end=segment.get("end", 0),
+                text=segment.get("text", ""),
+                words=segment.get("words", []),
+            )
+        )
+
+    return dto.TranscriptionResponse(
+        id=file_id,
+        filename=filename,
+        duration=duration,
+        language=transcription_result.get("language", "en"),
+        segments=segments,
+        full_text=transcription_result.get("text", ""),
+        shadowingResult=shadowing_result,  # gắn vào đây
+    )
+
+
+def _build_compact_transcription(
+    file_id: str,
+    filename: str,
+    duration: float,
+    transcription_result: dict,
+    shadowing_columns: dict,
+) -> dict:
+    """
+    Cùng nội dung với TranscriptionResponse nhưng dạng cột:
+    segments/words/compares là {tên cột: [giá trị...]}, words gom phẳng (segments.wordCount để tách lại).
+    """
+    segments = transcription_result.get("segments", [])
+    words = [w for segment in segments for w in segment.get("words", [])]
+    segment_columns = columns(segments, {"start": "start", "end": "end", "text": "text"})
+    segment_columns["wordCount"] = [len(segment.get("words", [])) for segment in segments]
+
+    return {
+        "id": file_id,
+        "filename": filename,
+        "duration": duration,
+        "language": transcription_result.get("language", "en"),
+        "full_text": transcription_result.get("text", ""),
+        "created_at": datetime.now().isoformat(),
+        "segments": segment_columns,
+        "words": columns(words, {"text": "word", "start": "start", "end": "end", "score": "score"}),
+        "shadowingResult": shadowing_columns,
+    }
 
 
 @router.post("/transcribe", response_model=ApiResponse[dto.TranscriptionResponse])
 async def transcribe_audio(
+    request: Request,
     file: UploadFile = File(..., description="Audio file to transcribe"),
     sentenceId: int = Form(...),
-    expectedWords: str = Form(...),
+    expectedWords: Optional[str] = Form(None, description="Bỏ trống nếu câu đã được gửi trước đó"),
+    wordTimings: bool = Form(False, description="Chạy forced alignment để có timestamps từng từ"),
+    promptHint: bool = Form(True, description="Dùng câu mong đợi làm gợi ý khi decode"),
+    format: Optional[str] = Query(None, description="compact = response dạng cột (orjson + gzip)"),
     # current_user: UserPrincipal = Depends(get_current_user),
 ):
     """
     Upload audio file and transcribe using WhisperX (async, non-blocking).
     """
-    # Parse ShadowingRequest từ Form
+    # Câu mong đợi: từ Form hoặc từ sentence token store
     try:
-        words_raw = json.loads(expectedWords)
-        shadowing_rq = dto.ShadowingRequest(
-            sentenceId=sentenceId,
-            expectedWords=[dto.ShadowingWord(**w) for w in words_raw],
-        )
+        expected = await _resolve_expected(sentenceId, expectedWords)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Invalid expectedWords payload: {e}",
         )
 
-    print(f"Received shadowing request: {shadowing_rq}")
+    print(f"Received shadowing request: sentenceId={sentenceId}, words={len(expected.texts)}")
     try:
         # Kiểm tra file type
-        allowed_extensions = {".wav", ".mp3", ".m4a", ".flac", ".ogg", ".webm"}
         file_extension = os.path.splitext(file.filename)[1].lower()
 
-        if file_extension not in allowed_extensions:
+        if file_extension not in ALLOWED_EXTENSIONS:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File type not supported. Allowed: {allowed_extensions}",
+                detail=f"File type not supported. Allowed: {ALLOWED_EXTENSIONS}",
             )
 
-        # Tạo file path tạm
         file_id = str(uuid.uuid4())
-        temp_file_path = os.path.join(UPLOAD_DIR, f"{file_id}{file_extension}")
 
-        # Lưu file upload
-        with open(temp_file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # Decode 1 lần trong RAM -> waveform 16 kHz mono dùng chung cho duration, ASR, align
+        content = await file.read()
+        audio = await decode_audio_bytes(content)
+        duration = get_waveform_duration(audio)
 
-        try:
-            # Get audio duration (async wrapper -> chạy trong thread pool)
-            duration = await get_audio_duration(temp_file_path)
-
-            # Transcribe với WhisperX (async wrapper)
-            transcription_result = await transcribe(temp_file_path)
-            
-            # Build shadowing result
-            shadowing_result = build_shadowing_result(shadowing_rq, transcription_result)
-
-            # Format response
-            segments = []
-            for segment in transcription_result.get("segments", []):
-                segments.append(
-                    dto.TranscriptionSegment(
-                        start=segment.get("start", 0),
-                        end=segment.get("end", 0),
-                        text=segment.get("text", ""),
-                        words=segment.get("words", []),
-                    )
-                )
+        # Transcribe với WhisperX (gom batch cùng các request khác)
+        # Mặc định chỉ lấy text (không align) -> shadowing chỉ cần text để chấm
+        expected_text = expected.expected_text
+        transcription_result = await transcribe_batched(
+            audio,
+            word_timings=wordTimings,
+            prompt=expected_text if promptHint and expected_text else None,
+        )
 
-            response = dto.TranscriptionResponse(
-                id=file_id,
-                filename=file.filename,
-                duration=duration,
-                language=transcription_result.get("language", "en"),
-                segments=segments,
-                full_text=transcription_result.get("text", ""),
-                shadowingResult=shadowing_result,  # gắn vào đây
-            )
+        # Compact (opt-in): build thẳng dạng cột, không qua pydantic
+        if wants_compact(request, format):
+            return await compact_response(request, _build_compact_transcription(
+                file_id, file.filename, duration, transcription_result,
+                build_shadowing_columns(expected, transcription_result),
+            ))
 
-            return ApiResponse.success(data=response)
+        # Build shadowing result
+        shadowing_result = build_shadowing_result(expected, transcription_result)
 
-        finally:
-            # Cleanup: Xóa file tạm sau khi xử lý
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-                print(f"Temporary file removed: {temp_file_path}")
+        response = _build_transcription_response(
+            file_id, file.filename, duration, transcription_result, shadowing_result
+        )
+        return ApiResponse.success(data=response)
 
     except HTTPException:
         # Giữ nguyên HTTPException đã raise ở trên (file type, ...)
@@ -109,3 +185,204 @@ async def transcribe_audio(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Transcription failed: {str(e)}",
         )
+
+
+def _error_message(e: Exception) -> str:
+    detail = getattr(e, "detail", None)
+    if isinstance(detail, dict):
+        return detail.get("message", str(detail))
+    return str(detail or e)
+
+
+def _parse_sentence_id(value) -> Optional[int]:
+    """sentenceId từ JSON client: int, hoặc chuỗi / số thực đổi được chính xác sang int; còn lại None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            return None
+    return None
+
+
+@router.post("/transcribe-batch", response_model=ApiResponse[List[dto.ShadowingBatchItemResult]])
+async def transcribe_audio_batch(
+    request: Request,
+    files: List[UploadFile] = File(..., description="Audio clips, cùng thứ tự với items"),
+    items: str = Form(..., description='JSON: [{"sentenceId": 1, "expectedWords"?: [...]}, ...]'),
+    wordTimings: bool = Form(False),
+    promptHint: bool = Form(True),
+    format: Optional[str] = Query(None, description="compact = response dạng cột (orjson + gzip)"),
+    # current_user: UserPrincipal = Depends(get_current_user),
+):
+    """
+    Chấm nhiều câu trong 1 request: các clip decode chung 1 batch model.
+    Lỗi từng item trả về trong `error`, không làm fail cả batch.
+    """
+    try:
+        items_raw = json.loads(items)
+        if not isinstance(items_raw, list):
+            raise ValueError("items must be a JSON array")
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid items payload: {e}")
+
+    if len(items_raw) != len(files):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"items ({len(items_raw)}) and files ({len(files)}) must have the same length",
+        )
+    if len(files) > SHADOWING_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many items (max {SHADOWING_BATCH_MAX_ITEMS})",
+        )
+
+    results = [dto.ShadowingBatchItemResult(index=i) for i in range(len(files))]
+
+    # Parse + validate từng item
+    async def resolve_item(file: UploadFile, raw) -> SentenceTokens:
+        if os.path.splitext(file.filename or "")[1].lower() not in ALLOWED_EXTENSIONS:
+            raise ValueError(f"File type not supported. Allowed: {ALLOWED_EXTENSIONS}")
+        sentence_id = _parse_sentence_id(raw.get("sentenceId"))
+        if sentence_id is None:
+            raise ValueError("sentenceId must be an integer")
+        return await _resolve_expected(sentence_id, raw.get("expectedWords"))
+
+    resolved = await asyncio.gather(
+        *[resolve_item(file, raw) for file, raw in zip(files, items_raw)], return_exceptions=True
+    )
+    requests: dict[int, SentenceTokens] = {}
+    for i, (raw, expected) in enumerate(zip(items_raw, resolved)):
+        # Chỉ echo sentenceId hợp lệ: giá trị rác làm response_model fail -> 500 cả batch
+        results[i].sentenceId = _parse_sentence_id(raw.get("sentenceId")) if isinstance(raw, dict) else None
+        if isinstance(expected, Exception):
+            results[i].error = f"Invalid item: {_error_message(expected)}"
+        else:
+            requests[i] = expected
+
+    # Decode song song (mỗi file 1 lần, trong RAM)
+    valid = list(requests.keys())
+    contents = await asyncio.gather(*[files[i].read() for i in valid])
+    audios = await asyncio.gather(*[decode_audio_bytes(c) for c in contents], return_exceptions=True)
+
+    clips: dict[int, ShadowingClip] = {}
+    for i, audio in zip(valid, audios):
+        if isinstance(audio, Exception):
+            results[i].error = f"Invalid audio: {_error_message(audio)}"
+            continue
+        expected_text = requests[i].expected_text
+        clips[i] = ShadowingClip(
+            audio=audio,
+            align=wordTimings,
+            prompt=expected_text if promptHint and expected_text else None,
+        )
+
+    # 1 batch model cho tất cả clip hợp lệ
+    indexes = list(clips.keys())
+    outputs = await transcribe_shadowing_batch([clips[i] for i in indexes]) if indexes else []
+
+    compact = wants_compact(request, format)
+    compact_results: dict[int, dict] = {}
+    for i, output in zip(indexes, outputs):
+        if isinstance(output, Exception):
+            results[i].error = f"Transcription failed: {_error_message(output)}"
+            continue
+        try:
+            if compact:
+                compact_results[i] = _build_compact_transcription(
+                    str(uuid.uuid4()),
+                    files[i].filename,
+                    get_waveform_duration(clips[i].audio),
+                    output,
+                    build_shadowing_columns(requests[i], output),
+                )
+                continue
+            shadowing_result = build_shadowing_result(requests[i], output)
+            results[i].result = _build_transcription_response(
+                str(uuid.uuid4()),
+                files[i].filename,
+                get_waveform_duration(clips[i].audio),
+                output,
+                shadowing_result,
+            )
+        except Exception as e:
+            results[i].error = f"Scoring failed: {_error_message(e)}"
+
+    if compact:
+        return await compact_response(request, [
+            {"index": r.index, "sentenceId": r.sentenceId, "result": compact_results.get(r.index), "error": r.error}
+            for r in results
+        ])
+    return ApiResponse.success(data=results)
+
+
+@router.websocket("/stream")
+async def transcribe_stream_ws(websocket: WebSocket):
+    """
+    Shadowing realtime qua WebSocket.
+
+    1. Client gửi JSON init: {"sentenceId", "expectedWords"?, "sampleRate"?, "wordTimings"?, "promptHint"?}
+       (expectedWords bỏ trống được nếu câu đã có trong sentence token store)
+    2. Client gửi binary frame PCM s16le mono trong lúc nói
+       -> server đẩy {"type": "partial", "result": ShadowingResult}
+    3. Client gửi {"event": "end"} -> server trả {"type": "final", "result": TranscriptionResponse}
+    """
+    await websocket.accept()
+
+    try:
+        init = await websocket.receive_json()
+        expected = await _resolve_expected(int(init["sentenceId"]), init.get("expectedWords"))
+        sample_rate = int(init.get("sampleRate", SAMPLE_RATE))
+    except Exception as e:
+        await websocket.send_json({"type": "error", "message": f"Invalid init message: {e}"})
+        await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+        return
+
+    async def send_partial(result: dto.ShadowingResult) -> None:
+        await websocket.send_json({"type": "partial", "result": result.model_dump(mode="json")})
+
+    session = ShadowingStreamSession(
+        expected,
+        on_partial=send_partial,
+        sample_rate=sample_rate,
+        word_timings=bool(init.get("wordTimings", False)),
+        prompt_hint=bool(init.get("promptHint", True)),
+    )
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                await session.close()
+                return
+            if message.get("bytes"):
+                session.feed(message["bytes"])
+            elif message.get("text") and json.loads(message["text"]).get("event") == "end":
+                break
+
+        transcription_result, shadowing_result = await session.finish()
+        response = _build_transcription_response(
+            str(uuid.uuid4()), "stream", session.duration, transcription_result, shadowing_result
+        )
+        await websocket.send_json({"type": "final", "result": response.model_dump(mode="json")})
+        await websocket.close()
+
+    except WebSocketDisconnect:
+        await session.close()
+    except Exception as e:
+        await session.close()
+        await websocket.send_json({"type": "error", "message": f"Transcription failed: {_error_message(e)}"})
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+
+
+@router.get("/metrics", response_model=ApiResponse[dict])
+async def transcribe_metrics():
+    """
+    Metrics của micro-batching queue (queue depth, batch size...) + sentence token store.
+    """
+    return ApiResponse.success(data={**get_batcher_metrics(), "sentenceTokens": sentence_token_store.get_stats()})
@@ -46,10 +46,21 @@ def _upload_json_content_sync(json_str: str, public_id: str) -> str:
         format="json"
     )
 
+def _upload_raw_content_sync(data: bytes, public_id: str, format: str) -> str:
+    return _core_upload(
+        public_id=public_id,
+        file_source=data,
+        resource_type="raw",
+        format=format
+    )
+
 # --- Public Async API ---
 
 async def upload_file(file_source: Union[str, IO], public_id: str, resource_type: str = "auto") -> str:
     return await asyncio.to_thread(_upload_file_sync, file_source, public_id, resource_type)
 
 async def upload_json_content(json_str: str, public_id: str) -> str:
-    return await asyncio.to_thread(_upload_json_content_sync, json_str, public_id)
\ No newline at end of file
+    return await asyncio.to_thread(_upload_json_content_sync, json_str, public_id)
+
+async def upload_raw_content(data: bytes, public_id: str, format: str) -> str:
+    return await asyncio.to_thread(_upload_raw_content_sync, data, public_id, format)
@@ -0,0 +1,406 @@
+import asyncio
+import importlib
+import multiprocessing as mp
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from src.errors.base_exception import BaseException
+from src.errors.base_error_code import BaseErrorCode
+
+# spawn: mỗi worker là 1 interpreter sạch (an toàn với torch/CUDA)
+_CTX = mp.get_context("spawn")
+
+# Chu kỳ kiểm tra worker còn sống khi đang đợi kết quả
+_POLL_INTERVAL_S = 0.5
+
+
+@dataclass
+class LaneConfig:
+    workers: int
+    timeout_s: float
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+class JobAborted(Exception):
+    """Caller huỷ job (CancelToken / future bị cancel) trong lúc worker đang chạy."""
+
+
+# Target là string "module:function" -> process con tự import, không pickle function
+def _resolve(target: str):
+    module_name, fn_name = target.split(":")
+    return getattr(importlib.import_module(module_name), fn_name)
+
+
+def _serialize_error(e: Exception) -> tuple:
+    if isinstance(e, BaseException):
+        detail = e.detail["message"] if isinstance(e.detail, dict) else str(e.detail)
+        return ("app", e.error_code.name, detail)
+    return ("runtime", type(e).__name__, str(e))
+
+
+def _deserialize_error(payload: tuple) -> Exception:
+    kind, name, message = payload
+    if kind == "app" and name in BaseErrorCode.__members__:
+        return BaseException(BaseErrorCode[name], message)
+    return RuntimeError(f"{name}: {message}")
+
+
+# PROCESS CON
+def _worker_main(conn, initializer: str | None, lane: str) -> None:
+    warmup_info = None
+    if initializer:
+        try:
+            warmup_info = _resolve(initializer)(lane)
+        except Exception as e:
+            print(f"[ASR Worker] Warm-up failed: {e}")
+            warmup_info = {"error": str(e)}
+    conn.send(("ready", warmup_info))
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message is None:
+            break
+
+        target, args = message
+        try:
+            conn.send(("ok", _resolve(target)(*args)))
+        except Exception as e:
+            conn.send(("err", _serialize_error(e)))
+
+
+class _AsrWorker:
+    def __init__(self, lane: str, index: int, initializer: str | None):
+        self.name = f"asr-{lane}-{index}"
+        self.lane = lane
+        self.initializer = initializer
+        self.process = None
+        self.conn = None
+        self.ready = False
+        self.warmup_info = None
+        self.restarts = 0
+
+    def start(self) -> None:
+        parent_conn, child_conn = _CTX.Pipe()
+        self.process = _CTX.Process(
+            target=_worker_main,
+            args=(child_conn, self.initializer, self.lane),
+            name=self.name,
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.ready = False
+        print(f"[ASR Pool] {self.name} started pid={self.process.pid}")
+
+    def kill(self) -> None:
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join(1)
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        self.process = None
+
+    def restart(self) -> None:
+        print(f"[ASR Pool] Restarting {self.name}")
+        self.kill()
+        self.restarts += 1
+        self.start()
+
+    def wait_ready(self, should_stop: Callable[[], bool] = lambda: False) -> None:
+        """Đợi worker load model xong (không tính vào timeout của job)."""
+        while not self.ready:
+            if self.conn.poll(_POLL_INTERVAL_S):
+                status, payload = self.conn.recv()
+                self.ready = status == "ready"
+                self.warmup_info = payload
+            elif not self.process.is_alive():
+                raise WorkerCrashed(f"{self.name} exited during warm-up")
+            elif should_stop():
+                raise JobAborted(f"{self.name} warm-up interrupted: pool stopping")
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def call(self, target: str, args: tuple, timeout_s: float,
+             should_stop: Callable[[], bool] = lambda: False) -> tuple:
+        try:
+            self.conn.send((target, args))
+        except (OSError, EOFError) as e:
+            # Worker chết lúc đang rảnh -> pipe gãy (BrokenPipe / conn đã đóng)
+            raise WorkerCrashed(f"{self.name} pipe broken: {e}")
+        deadline = time.monotonic() + timeout_s
+        while True:
+            if self.conn.poll(_POLL_INTERVAL_S):
+                try:
+                    return self.conn.recv()
+                except EOFError:
+                    raise WorkerCrashed(f"{self.name} closed its pipe")
+            if not self.process.is_alive():
+                raise WorkerCrashed(f"{self.name} exited with code {self.process.exitcode}")
+            if should_stop():
+                raise JobAborted(f"{self.name} job cancelled by caller")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{self.name} job exceeded {timeout_s}s")
+
+    def stop(self) -> None:
+        if self.process is None:
+            return
+        try:
+            self.conn.send(None)
+            self.process.join(5)
+        except Exception:
+            pass
+        self.kill()
+
+
+def _set_cancelled(future: asyncio.Future, cancel_token) -> None:
+    if future.done():
+        return
+    try:
+        cancel_token.raise_if_cancelled()
+    except Exception as e:
+        future.set_exception(e)
+        return
+    future.cancel()
+
+
+class _AsrLane:
+    def __init__(self, name: str, config: LaneConfig, initializer: str | None):
+        self.name = name
+        self.config = config
+        self.workers = [_AsrWorker(name, i, initializer) for i in range(config.workers)]
+        self._queue: asyncio.Queue | None = None
+        self._dispatchers: list[asyncio.Task] = []
+        # stop() bật cờ này -> thread đang đợi worker (call / wait_ready) thoát trong <= _POLL_INTERVAL_S
+        self._stopping = False
+        self._in_flight: dict[_AsrWorker, asyncio.Future] = {}
+
+        # Metrics
+        self.busy = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.aborted = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._dispatchers)
+
+    def start(self, executor: ThreadPoolExecutor) -> None:
+        self._stopping = False
+        self._queue = asyncio.Queue()
+        for worker in self.workers:
+            worker.start()
+            self._dispatchers.append(asyncio.create_task(self._dispatch(worker, executor)))
+
+    async def submit(self, target: str, *args: Any, cancel_token=None) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((target, args, future, cancel_token))
+        return await future
+
+    async def _restart(self, worker: _AsrWorker, executor: ThreadPoolExecutor) -> None:
+        # Restart lỗi (spawn thất bại...) không được giết dispatcher; vòng sau wait_ready sẽ thử lại
+        try:
+            await asyncio.get_running_loop().run_in_executor(executor, worker.restart)
+        except Exception as e:
+            print(f"[ASR Pool] Restart {worker.name} failed: {e}")
+
+    async def _dispatch(self, worker: _AsrWorker, executor: ThreadPoolExecutor) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(executor, worker.wait_ready, self._is_stopping)
+            except JobAborted:
+                return
+            except (WorkerCrashed, OSError, EOFError) as e:
+                print(f"[ASR Pool] {worker.name} not ready: {e}")
+                self.crashes += 1
+                await self._restart(worker, executor)
+                await asyncio.sleep(1)
+                continue
+
+            target, args, future, cancel_token = await self._queue.get()
+            if future.cancelled():
+                continue
+            if cancel_token is not None and cancel_token.cancelled:
+                _set_cancelled(future, cancel_token)
+                continue
+
+            # Đọc từ thread chờ kết quả: job bị huỷ -> kill worker, không để chunk chạy tiếp tốn CPU
+            def should_stop(future=future, cancel_token=cancel_token) -> bool:
+                return (self._stopping or future.cancelled()
+                        or (cancel_token is not None and cancel_token.cancelled))
+
+            self.busy += 1
+            self._in_flight[worker] = future
+            try:
+                status, payload = await loop.run_in_executor(
+                    executor, worker.call, target, args, self.config.timeout_s, should_stop
+                )
+                if status == "ok":
+                    self.completed += 1
+                    if not future.done():
+                        future.set_result(payload)
+                else:
+                    self.failed += 1
+                    if not future.done():
+                        future.set_exception(_deserialize_error(payload))
+            except TimeoutError as e:
+                self.timeouts += 1
+                print(f"[ASR Pool] {e}")
+                await self._restart(worker, executor)
+                if not future.done():
+                    future.set_exception(BaseException(BaseErrorCode.ASR_TIMEOUT, str(e)))
+            except JobAborted as e:
+                self.aborted += 1
+                if self._stopping:
+                    return  # stop() đã fail future và sẽ kill worker
+                print(f"[ASR Pool] {e}, restarting worker")
+                await self._restart(worker, executor)
+                _set_cancelled(future, cancel_token)
+            except WorkerCrashed as e:
+                self.crashes += 1
+                print(f"[ASR Pool] {e}")
+                await self._restart(worker, executor)
+                if not future.done():
+                    future.set_exception(
+                        BaseException(BaseErrorCode.INTERNAL_SERVER_ERROR, f"ASR worker crashed: {e}")
+                    )
+            except Exception as e:
+                # Lỗi khác (args không pickle được, pipe hỏng giữa chừng...) -> trả lỗi cho caller, dispatcher vẫn chạy
+                self.failed += 1
+                print(f"[ASR Pool] {worker.name} job error: {type(e).__name__}: {e}")
+                if isinstance(e, (OSError, EOFError)) or not worker.alive:
+                    await self._restart(worker, executor)
+                if not future.done():
+                    future.set_exception(
+                        BaseException(BaseErrorCode.INTERNAL_SERVER_ERROR, f"ASR worker error: {e}")
+                    )
+            finally:
+                self.busy -= 1
+                self._in_flight.pop(worker, None)
+
+    def _is_stopping(self) -> bool:
+        return self._stopping
+
+    async def stop(self, executor: ThreadPoolExecutor) -> None:
+        # Bật cờ trước: thread đang chặn trong worker.call / wait_ready thoát ngay vòng poll kế tiếp,
+        # không giữ executor tới hết timeout job (lesson 1800s) làm worker.stop xếp hàng sau chúng.
+        self._stopping = True
+        stopping_error = BaseException(BaseErrorCode.INTERNAL_SERVER_ERROR, f"ASR lane {self.name} is stopping")
+        busy_workers = set(self._in_flight)
+        for future in self._in_flight.values():
+            if not future.done():
+                future.set_exception(stopping_error)
+        while self._queue is not None and not self._queue.empty():
+            _, _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(stopping_error)
+
+        for task in self._dispatchers:
+            task.cancel()
+        for task in self._dispatchers:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._dispatchers = []
+
+        # Worker đang chạy job dở -> kill luôn; worker rảnh -> dừng nhẹ nhàng
+        loop = asyncio.get_running_loop()
+        for worker in self.workers:
+            await loop.run_in_executor(executor, worker.kill if worker in busy_workers else worker.stop)
+
+    def get_readiness(self) -> dict:
+        return {
+            "ready": all(w.ready for w in self.workers),
+            "workers": [
+                {"name": w.name, "ready": w.ready, "warmup": w.warmup_info}
+                for w in self.workers
+            ],
+        }
+
+    def get_metrics(self) -> dict:
+        return {
+            "workers": len(self.workers),
+            "readyWorkers": sum(1 for w in self.workers if w.ready),
+            "timeoutSeconds": self.config.timeout_s,
+            "queueDepth": self._queue.qsize() if self._queue else 0,
+            "busy": self.busy,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "crashes": self.crashes,
+            "aborted": self.aborted,
+            "restarts": sum(w.restarts for w in self.workers),
+        }
+
+
+class AsrWorkerPool:
+    """
+    Pool các process ASR đã warm (mỗi process có model + align cache riêng).
+
+    - Mỗi lane (vd: shadowing, lesson) có worker + queue riêng -> lesson 10 phút
+      không chặn clip shadowing 3 giây.
+    - `initializer(lane)` chạy 1 lần trong mỗi process (load model của lane).
+    - Mỗi job có timeout; worker bị treo/crash sẽ được kill & restart.
+    - Job có `cancel_token` bị huỷ (hoặc caller cancel) giữa chừng -> kill & restart worker đang chạy nó.
+    - stop(): fail job đang chạy + đang đợi, thread đợi worker thoát ngay (không đợi hết timeout), kill worker bận.
+    - Lane có 0 worker hoặc pool chưa start -> caller tự chạy in-process.
+    """
+
+    def __init__(self, lanes: dict[str, LaneConfig], initializer: str | None = None):
+        self._lanes = {
+            name: _AsrLane(name, cfg, initializer)
+            for name, cfg in lanes.items()
+            if cfg.workers > 0
+        }
+        self._executor: ThreadPoolExecutor | None = None
+
+    def is_running(self, lane: str) -> bool:
+        return lane in self._lanes and self._lanes[lane].running
+
+    def start(self) -> None:
+        if self._executor is not None or not self._lanes:
+            return
+        total_workers = sum(len(lane.workers) for lane in self._lanes.values())
+        # Executor riêng: thread đợi kết quả worker không tranh chỗ với to_thread mặc định
+        self._executor = ThreadPoolExecutor(max_workers=total_workers, thread_name_prefix="asr-pool")
+        for lane in self._lanes.values():
+            lane.start(self._executor)
+        print(f"✅ [ASR Pool] Started lanes={ {n: len(l.workers) for n, l in self._lanes.items()} }")
+
+    async def submit(self, lane: str, target: str, *args: Any, cancel_token=None) -> Any:
+        return await self._lanes[lane].submit(target, *args, cancel_token=cancel_token)
+
+    async def stop(self) -> None:
+        if self._executor is None:
+            return
+        await asyncio.gather(*(lane.stop(self._executor) for lane in self._lanes.values()))
+        self._executor.shutdown(wait=False)
+        self._executor = None
+        print("✅ [ASR Pool] Stopped")
+
+    def get_readiness(self) -> dict:
+        return {name: lane.get_readiness() for name, lane in self._lanes.items()}
+
+    def get_metrics(self) -> dict:
+        return {name: lane.get_metrics() for name, lane in self._lanes.items()}
@@ -0,0 +1,145 @@
+import glob
+import os
+import threading
+from typing import Optional
+
+import orjson
+
+from src import dto
+from src.utils.lru_cache import LRUCache
+
+# =========================
+# CONFIG
+# =========================
+# Audio nguồn tải về (yt-dlp / URL) nằm ở đây, quản lý như cache: key = source id (tên file bỏ đuôi)
+AUDIO_SAVE_PATH = os.getenv("AUDIO_SAVE_PATH", "src/temp/audio_files")
+AUDIO_CACHE_MAX_MB = int(os.getenv("AUDIO_CACHE_MAX_MB", "2048"))
+
+_META_SUFFIX = ".meta.json"
+# File đang ghi dở (yt-dlp / tải URL) -> không tính là entry
+_PARTIAL_SUFFIXES = (".part", ".ytdl", ".tmp")
+
+
+def _files_of(source_id: str) -> list[str]:
+    pattern = os.path.join(glob.escape(AUDIO_SAVE_PATH), f"{glob.escape(source_id)}.*")
+    return [p for p in glob.glob(pattern) if not p.endswith(_PARTIAL_SUFFIXES)]
+
+
+def _meta_path(source_id: str) -> str:
+    return os.path.join(AUDIO_SAVE_PATH, f"{source_id}{_META_SUFFIX}")
+
+
+def _remove_entry(source_id: str, _size: int) -> None:
+    for path in _files_of(source_id):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    print(f"[AudioCache] Evicted {source_id}")
+
+
+# value = tổng size các file của source (audio + meta); pinned = đang được job dùng
+_index = LRUCache(
+    max_size=AUDIO_CACHE_MAX_MB * 1024 * 1024,
+    size_fn=lambda size: size,
+    on_evict=_remove_entry,
+    name="audio_files",
+)
+_index_loaded = False
+_pins: dict[str, int] = {}
+_pins_lock = threading.Lock()
+
+_stats = {"hits": 0, "misses": 0, "writes": 0}
+
+
+def _load_index_sync() -> None:
+    global _index_loaded
+    if _index_loaded:
+        return
+    os.makedirs(AUDIO_SAVE_PATH, exist_ok=True)
+
+    entries: dict[str, list] = {}  # source_id -> [mtime mới nhất, tổng size]
+    for name in os.listdir(AUDIO_SAVE_PATH):
+        if name.endswith(_PARTIAL_SUFFIXES):
+            continue
+        source_id = name[:-len(_META_SUFFIX)] if name.endswith(_META_SUFFIX) else os.path.splitext(name)[0]
+        stat = os.stat(os.path.join(AUDIO_SAVE_PATH, name))
+        entry = entries.setdefault(source_id, [0.0, 0])
+        entry[0] = max(entry[0], stat.st_mtime)
+        entry[1] += stat.st_size
+
+    # Cũ trước -> mới sau (thứ tự LRU)
+    for source_id, (_, size) in sorted(entries.items(), key=lambda item: item[1][0]):
+        _index.put(source_id, size)
+    _index_loaded = True
+
+
+def _audio_file(source_id: str) -> Optional[str]:
+    files = [p for p in _files_of(source_id) if not p.endswith(_META_SUFFIX)]
+    return max(files, key=os.path.getmtime) if files else None
+
+
+# PUBLIC API (sync: gọi trong thread tải file)
+def lookup_sync(source_id: str | None) -> Optional[dto.AudioInfo]:
+    """Cache hit -> AudioInfo (kèm thông tin video đã lưu), không đi mạng."""
+    if not source_id:
+        return None
+    _load_index_sync()
+    path = _audio_file(source_id) if source_id in _index else None
+    if path is None:
+        _stats["misses"] += 1
+        return None
+
+    _index.get(source_id)  # đẩy lên đầu LRU
+    try:
+        os.utime(path)  # giữ thứ tự LRU sau restart
+        with open(_meta_path(source_id), "rb") as f:
+            info = dto.AudioInfo.model_validate({**orjson.loads(f.read()), "file_path": path})
+    except (OSError, ValueError):
+        info = dto.AudioInfo(file_path=path, sourceReferenceId=source_id)
+
+    _stats["hits"] += 1
+    return info
+
+
+def add_sync(info: dto.AudioInfo) -> None:
+    """Ghi nhận file vừa tải (kèm meta) vào cache; có thể evict file cũ không bị pin."""
+    source_id = info.sourceReferenceId
+    if not source_id or not os.path.isfile(info.file_path):
+        return
+    _load_index_sync()
+    with open(_meta_path(source_id), "wb") as f:
+        f.write(orjson.dumps(info.model_dump(by_alias=True, exclude={"file_path"})))
+    size = sum(os.path.getsize(p) for p in _files_of(source_id))
+    _index.put(source_id, size)
+    _stats["writes"] += 1
+
+
+# PIN: file của job đang chạy không bao giờ bị evict (đếm theo số job dùng chung)
+def acquire(source_id: str | None) -> None:
+    if not source_id:
+        return
+    with _pins_lock:
+        _pins[source_id] = _pins.get(source_id, 0) + 1
+        if _pins[source_id] == 1:
+            _index.pin(source_id)
+
+
+def release(source_id: str | None) -> None:
+    if not source_id:
+        return
+    with _pins_lock:
+        count = _pins.get(source_id, 0) - 1
+        if count > 0:
+            _pins[source_id] = count
+            return
+        _pins.pop(source_id, None)
+        _index.unpin(source_id)
+
+
+def get_stats() -> dict:
+    return {
+        **_stats,
+        "pinnedJobs": sum(_pins.values()),
+        "files": _index.get_stats(),
+    }
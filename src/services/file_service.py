@@ -54,6 +54,16 @@ async def fetch_json_from_url(url: str):
         print(f"Lỗi khi tải JSON từ {url}: {e}")
         return None
 
+async def fetch_bytes_from_url(url: str) -> Optional[bytes]:
+    try:
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            response = await client.get(url)
+            response.raise_for_status()
+            return response.content
+    except Exception as e:
+        print(f"Lỗi khi tải dữ liệu từ {url}: {e}")
+        return None
+
 def file_exists(path: str) -> bool:
     """
     Kiểm tra file local có tồn tại trong hệ thống hay không.
@@ -0,0 +1,249 @@
+"""
+Huỷ AI job theo kiểu push thay vì GET Redis trước mỗi bước.
+
+- 1 kết nối pub/sub dùng chung cho cả process:
+  + channel `AI_JOB_CANCEL_CHANNEL` (payload = aiJobId) cho bên nào chủ động publish;
+  + keyspace notification của `aiJobStatus:*` (cần `notify-keyspace-events` có K và $).
+- Đối chiếu định kỳ: 1 lệnh MGET cho mọi job đang chạy (lưới an toàn khi Redis chưa bật
+  keyspace notification hoặc lỡ message lúc mất kết nối).
+- Mỗi job có 1 CancelToken: code async dùng `guard()` để dừng ngay, code chạy trong thread
+  (yt-dlp, tải file, ASR chunk) kiểm tra `token.cancelled` / `raise_if_cancelled()`.
+"""
+import asyncio
+import os
+import threading
+from typing import Any, Awaitable, Optional
+
+from src.errors.base_error_code import BaseErrorCode
+from src.errors.base_exception import BaseException
+from src.redis.redis_client import redis_client
+from src.services import ai_job_service
+from src.utils.lru_cache import LRUCache
+
+# =========================
+# CONFIG
+# =========================
+AI_JOB_CANCEL_CHANNEL = os.getenv("AI_JOB_CANCEL_CHANNEL", "aiJobCancelled")
+AI_JOB_CANCEL_KEYSPACE = os.getenv("AI_JOB_CANCEL_KEYSPACE", "1") == "1"
+# 1 = tự bật `notify-keyspace-events K$` trên Redis nếu chưa có (cần quyền CONFIG)
+AI_JOB_CANCEL_CONFIGURE_KEYSPACE = os.getenv("AI_JOB_CANCEL_CONFIGURE_KEYSPACE", "0") == "1"
+AI_JOB_CANCEL_RESYNC_SECONDS = float(os.getenv("AI_JOB_CANCEL_RESYNC_SECONDS", "10"))
+
+_STATUS_KEY_PREFIX = "aiJobStatus:"
+_CANCELLED_STATUS = "CANCELLED"
+_RECONNECT_MAX_SECONDS = 30
+
+
+class CancelToken:
+    """Cờ huỷ của 1 job; đọc được từ cả event loop lẫn thread."""
+
+    def __init__(self, ai_job_id: str):
+        self.ai_job_id = ai_job_id
+        self._flag = threading.Event()
+        self._event = asyncio.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._flag.is_set()
+
+    def cancel(self) -> None:
+        self._flag.set()
+        self._event.set()
+
+    def raise_if_cancelled(self) -> None:
+        if self._flag.is_set():
+            raise cancelled_error(self.ai_job_id)
+
+    async def guard(self, awaitable: Awaitable[Any]) -> Any:
+        """Chờ `awaitable`; job bị huỷ giữa chừng -> cancel nó và raise JOB_CANCELLED ngay."""
+        self.raise_if_cancelled()
+        task = asyncio.ensure_future(awaitable)
+        waiter = asyncio.create_task(self._event.wait())
+        try:
+            await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if task.done():
+                return task.result()
+            raise cancelled_error(self.ai_job_id)
+        finally:
+            waiter.cancel()
+            if not task.done():
+                task.cancel()
+
+
+def cancelled_error(ai_job_id: str | None) -> BaseException:
+    return BaseException(BaseErrorCode.JOB_CANCELLED, f"AI job {ai_job_id} was cancelled")
+
+
+def is_cancel_error(e: Exception) -> bool:
+    return isinstance(e, BaseException) and e.error_code == BaseErrorCode.JOB_CANCELLED
+
+
+# =========================
+# STATE (mỗi process)
+# =========================
+_tokens: dict[str, CancelToken] = {}
+_refs: dict[str, int] = {}
+_cancelled_ids = LRUCache(max_entries=10000, name="cancelled_ai_jobs")
+_listener_connected = False
+
+_stats = {"pushCancels": 0, "resyncCancels": 0, "resyncs": 0, "fallbackChecks": 0, "reconnects": 0}
+
+
+def _mark_cancelled(ai_job_id: str, source: str) -> None:
+    if _cancelled_ids.get(ai_job_id) is None:
+        _cancelled_ids.put(ai_job_id, True)
+        _stats["resyncCancels" if source == "resync" else "pushCancels"] += 1
+        print(f"ai_job_cancelled ai_job_id={ai_job_id} source={source}")
+    token = _tokens.get(ai_job_id)
+    if token is not None:
+        token.cancel()
+
+
+def _is_cancelled_status(status: Optional[str]) -> bool:
+    return bool(status) and status.strip('"') == _CANCELLED_STATUS
+
+
+# PUBLIC API
+async def register(ai_job_id: str | None) -> CancelToken:
+    """Token cho job sắp chạy; kiểm tra Redis 1 lần để bắt lệnh huỷ đến trước khi subscribe."""
+    token = _tokens.get(ai_job_id) if ai_job_id else None
+    if token is None:
+        token = CancelToken(ai_job_id)
+        if not ai_job_id:
+            return token
+        _tokens[ai_job_id] = token
+    _refs[ai_job_id] = _refs.get(ai_job_id, 0) + 1
+
+    # Redis là nguồn đúng: job restart với cùng id thì bỏ cờ huỷ cũ trong RAM
+    if await ai_job_service.ai_job_was_cancelled(ai_job_id):
+        _mark_cancelled(ai_job_id, "register")
+    else:
+        _cancelled_ids.pop(ai_job_id)
+    return token
+
+
+def release(token: CancelToken) -> None:
+    ai_job_id = token.ai_job_id
+    if not ai_job_id or _tokens.get(ai_job_id) is not token:
+        return
+    _refs[ai_job_id] -= 1
+    if _refs[ai_job_id] <= 0:
+        _tokens.pop(ai_job_id, None)
+        _refs.pop(ai_job_id, None)
+
+
+async def is_cancelled(ai_job_id: str | None) -> bool:
+    """Đọc cờ trong RAM; chỉ hỏi Redis khi listener đang mất kết nối."""
+    if not ai_job_id:
+        return False
+    if _cancelled_ids.get(ai_job_id) is not None:
+        return True
+    if _listener_connected:
+        return False
+
+    _stats["fallbackChecks"] += 1
+    if await ai_job_service.ai_job_was_cancelled(ai_job_id):
+        _mark_cancelled(ai_job_id, "poll")
+        return True
+    return False
+
+
+# LISTENER
+async def _configure_keyspace_events() -> None:
+    current = (await redis_client.config_get("notify-keyspace-events")).get("notify-keyspace-events", "")
+    if "K" in current and ("$" in current or "A" in current):
+        return
+    if not AI_JOB_CANCEL_CONFIGURE_KEYSPACE:
+        print(f"[JobCancellation] Redis notify-keyspace-events='{current}' (cần K$), dùng resync định kỳ")
+        return
+    flags = "".join(dict.fromkeys(current + "K$"))
+    await redis_client.config_set("notify-keyspace-events", flags)
+    print(f"[JobCancellation] Enabled notify-keyspace-events={flags}")
+
+
+async def _on_message(message: dict) -> None:
+    if message.get("type") == "message":
+        ai_job_id = str(message.get("data") or "").strip().strip('"')
+        if ai_job_id:
+            _mark_cancelled(ai_job_id, "channel")
+        return
+
+    if message.get("type") == "pmessage":
+        # channel: __keyspace@0__:aiJobStatus:{id}; chỉ quan tâm job đang chạy ở process này
+        ai_job_id = message["channel"].split(_STATUS_KEY_PREFIX, 1)[-1]
+        if ai_job_id in _tokens and message.get("data") == "set":
+            status = await redis_client.get(f"{_STATUS_KEY_PREFIX}{ai_job_id}")
+            if _is_cancelled_status(status):
+                _mark_cancelled(ai_job_id, "keyspace")
+
+
+async def _listen_forever() -> None:
+    global _listener_connected
+    backoff = 1
+    while True:
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(AI_JOB_CANCEL_CHANNEL)
+            if AI_JOB_CANCEL_KEYSPACE:
+                try:
+                    await _configure_keyspace_events()
+                except Exception as e:
+                    print(f"[JobCancellation] Cannot configure keyspace events: {e}")
+                await pubsub.psubscribe(f"__keyspace@*__:{_STATUS_KEY_PREFIX}*")
+
+            _listener_connected = True
+            backoff = 1
+            print(f"[JobCancellation] Subscribed channel={AI_JOB_CANCEL_CHANNEL} keyspace={AI_JOB_CANCEL_KEYSPACE}")
+            # Lệnh huỷ trong lúc mất kết nối -> đối chiếu lại ngay
+            await _resync()
+
+            async for message in pubsub.listen():
+                await _on_message(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[JobCancellation] Listener error: {e}")
+        finally:
+            _listener_connected = False
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+        _stats["reconnects"] += 1
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, _RECONNECT_MAX_SECONDS)
+
+
+async def _resync() -> None:
+    """1 lệnh MGET cho mọi job đang chạy trong process."""
+    ai_job_ids = [i for i, token in _tokens.items() if not token.cancelled]
+    if not ai_job_ids:
+        return
+    _stats["resyncs"] += 1
+    statuses = await redis_client.mget([f"{_STATUS_KEY_PREFIX}{i}" for i in ai_job_ids])
+    for ai_job_id, status in zip(ai_job_ids, statuses):
+        if _is_cancelled_status(status):
+            _mark_cancelled(ai_job_id, "resync")
+
+
+async def _resync_forever() -> None:
+    while True:
+        await asyncio.sleep(AI_JOB_CANCEL_RESYNC_SECONDS)
+        try:
+            await _resync()
+        except Exception as e:
+            print(f"[JobCancellation] Resync failed: {e}")
+
+
+async def run_listener() -> None:
+    await asyncio.gather(_listen_forever(), _resync_forever())
+
+
+def get_stats() -> dict:
+    return {
+        "listenerConnected": _listener_connected,
+        "activeJobs": len(_tokens),
+        **_stats,
+        "cancelledIds": _cancelled_ids.get_stats(),
+    }
@@ -0,0 +1,166 @@
+"""
+Metadata lesson lưu theo section thay vì 1 JSON lớn ghi lại sau mỗi step.
+
+- Mỗi step (sourceFetched, transcribed, nlpAnalyzed) là 1 object riêng, gzip, trên Cloudinary.
+- Manifest nhỏ (JSON) ở public_id cũ `lps/lessons/{id}/ai-metadata` trỏ tới các section
+  -> `aiMetadataUrl` vẫn là 1 URL; step chỉ ghi section của nó + manifest.
+- Load lười: chỉ tải manifest; section nào cần mới tải. Section không đổi (cùng sha256) thì không upload lại.
+- Vẫn đọc được metadata cũ (1 JSON đầy đủ), lần lưu sau tự chuyển sang dạng section.
+- Mặc định `LESSON_METADATA_SECTIONED=0`: `aiMetadataUrl` vẫn là 1 JSON đầy đủ như trước (backend chưa đọc manifest);
+  bật =1 khi mọi consumer của `aiMetadataUrl` đã đọc được manifest (`manifestVersion`).
+"""
+import asyncio
+import gzip
+import hashlib
+import os
+from typing import Dict, Optional
+
+import orjson
+from pydantic import BaseModel
+
+from src import dto
+from src.s3_storage import cloud_service
+from src.services.file_service import fetch_bytes_from_url, fetch_json_from_url
+
+# =========================
+# CONFIG
+# =========================
+LESSON_METADATA_SECTIONED = os.getenv("LESSON_METADATA_SECTIONED", "0") == "1"
+LESSON_METADATA_GZIP_LEVEL = int(os.getenv("LESSON_METADATA_GZIP_LEVEL", "6"))
+
+SECTION_MODELS: Dict[str, type[BaseModel]] = {
+    "sourceFetched": dto.SourceFetchedDto,
+    "transcribed": dto.TranscribedDto,
+    "nlpAnalyzed": dto.NlpAnalyzedDto,
+}
+
+# Section lớn (transcript cả lesson) -> nén / giải nén trong thread
+_THREAD_BYTES = 64 * 1024
+
+
+def _public_id(lesson_id: int) -> str:
+    return f"lps/lessons/{lesson_id}/ai-metadata"
+
+
+async def _gzip(data: bytes) -> bytes:
+    if len(data) >= _THREAD_BYTES:
+        return await asyncio.to_thread(gzip.compress, data, LESSON_METADATA_GZIP_LEVEL)
+    return gzip.compress(data, compresslevel=LESSON_METADATA_GZIP_LEVEL)
+
+
+async def _gunzip(data: bytes) -> bytes:
+    # CDN có thể đã giải nén sẵn (Content-Encoding) -> kiểm tra magic bytes
+    if data[:2] != b"\x1f\x8b":
+        return data
+    if len(data) >= _THREAD_BYTES:
+        return await asyncio.to_thread(gzip.decompress, data)
+    return gzip.decompress(data)
+
+
+class LessonMetadata:
+    """Metadata của 1 lesson: manifest + section đã tải / đã ghi trong job hiện tại."""
+
+    def __init__(self, lesson_id: int | None, manifest: dto.LessonMetadataManifestDto | None = None,
+                 sections: Dict[str, BaseModel] | None = None, url: str | None = None):
+        self.lesson_id = lesson_id
+        self.url = url if manifest else None  # URL manifest hiện tại (None = chưa có / dạng cũ)
+        self._entries: Dict[str, dto.LessonMetadataSectionDto] = dict(manifest.sections) if manifest else {}
+        self._sections: Dict[str, BaseModel] = dict(sections or {})
+
+    def has(self, name: str) -> bool:
+        """Có section hay không (không cần tải)."""
+        return name in self._sections or name in self._entries
+
+    async def get(self, name: str) -> Optional[BaseModel]:
+        """Tải section khi cần; lỗi tải / parse -> None (caller chạy lại step)."""
+        if name in self._sections:
+            return self._sections[name]
+        entry = self._entries.get(name)
+        if entry is None:
+            return None
+
+        raw = await fetch_bytes_from_url(entry.url)
+        if raw is None:
+            return None
+        try:
+            section = SECTION_MODELS[name].model_validate(orjson.loads(await _gunzip(raw)))
+        except Exception as e:
+            print(f"[LessonMetadata] Invalid section {name} lesson_id={self.lesson_id}: {e}")
+            return None
+
+        self._sections[name] = section
+        return section
+
+    async def put(self, name: str, section: BaseModel) -> str | None:
+        """Ghi section của step vừa xong + manifest; trả về URL metadata (manifest)."""
+        self._sections[name] = section
+        if not self.lesson_id:
+            return None
+
+        if not LESSON_METADATA_SECTIONED:
+            return await self._upload_full_document()
+
+        # Section mới + section từ metadata dạng cũ (chưa có object riêng)
+        changed = False
+        for key, value in self._sections.items():
+            if key == name or key not in self._entries:
+                changed |= await self._upload_section(key, value)
+        if changed or self.url is None:
+            self.url = await self._upload_manifest()
+        return self.url
+
+    async def _upload_section(self, name: str, section: BaseModel) -> bool:
+        body = orjson.dumps(section.model_dump(by_alias=True))
+        digest = hashlib.sha256(body).hexdigest()
+        entry = self._entries.get(name)
+        if entry is not None and entry.sha256 == digest:
+            return False  # restart ra kết quả y hệt -> khỏi upload
+
+        compressed = await _gzip(body)
+        url = await cloud_service.upload_raw_content(
+            compressed,
+            public_id=f"{_public_id(self.lesson_id)}/{name}",
+            format="gz",
+        )
+        self._entries[name] = dto.LessonMetadataSectionDto(
+            url=url, sizeBytes=len(body), compressedBytes=len(compressed), sha256=digest,
+        )
+        print(f"[LessonMetadata] lesson_id={self.lesson_id} section={name} "
+              f"bytes={len(body)} gzip={len(compressed)}")
+        return True
+
+    async def _upload_manifest(self) -> str:
+        manifest = dto.LessonMetadataManifestDto(sections=self._entries)
+        return await cloud_service.upload_json_content(
+            orjson.dumps(manifest.model_dump()).decode("utf-8"),
+            public_id=_public_id(self.lesson_id),
+        )
+
+    async def _upload_full_document(self) -> str:
+        for name in SECTION_MODELS:
+            await self.get(name)
+        document = dto.LessonGenerationAiMetadataDto(**self._sections)
+        return await cloud_service.upload_json_content(
+            orjson.dumps(document.model_dump(by_alias=True)).decode("utf-8"),
+            public_id=_public_id(self.lesson_id),
+        )
+
+
+async def load(lesson_id: int | None, url: str | None) -> LessonMetadata:
+    """Chỉ tải manifest (hoặc JSON đầy đủ kiểu cũ); lỗi -> metadata rỗng như trước."""
+    if not url:
+        return LessonMetadata(lesson_id)
+
+    data = await fetch_json_from_url(url)
+    if not isinstance(data, dict):
+        return LessonMetadata(lesson_id)
+
+    try:
+        if "manifestVersion" in data:
+            return LessonMetadata(lesson_id, manifest=dto.LessonMetadataManifestDto.model_validate(data), url=url)
+
+        legacy = dto.LessonGenerationAiMetadataDto.model_validate(data)
+        sections = {name: getattr(legacy, name) for name in SECTION_MODELS if getattr(legacy, name) is not None}
+        return LessonMetadata(lesson_id, sections=sections)
+    except Exception:
+        return LessonMetadata(lesson_id)
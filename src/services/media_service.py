@@ -1,11 +1,14 @@
 import asyncio
+import threading
 from src import dto
 from src.errors.base_exception import BaseException
 from src.errors.base_error_code import BaseErrorCode
+from src.services import audio_cache
+from src.services.job_cancellation import CancelToken, cancelled_error
+from src.utils.source_id import url_source_id, youtube_video_id
 import yt_dlp
 import os
 import logging as logger
-import uuid
 import requests
 import mimetypes # Để đoán đuôi file
 
@@ -18,11 +21,22 @@ YDL_INFO_OPTS = {
 }
 ydl_info_extractor = yt_dlp.YoutubeDL(YDL_INFO_OPTS)
 
-AUDIO_SAVE_PATH = os.getenv('AUDIO_SAVE_PATH', 'src/temp/audio_files')
+# Thư mục do audio_cache quản lý (LRU theo dung lượng, file của job đang chạy được pin)
+AUDIO_SAVE_PATH = audio_cache.AUDIO_SAVE_PATH
 
 # Tạo thư mục này nếu nó chưa tồn tại
 os.makedirs(AUDIO_SAVE_PATH, exist_ok=True)
 
+# Token huỷ của job đang tải trên thread hiện tại (ydl_downloader dùng chung giữa các job)
+_download_ctx = threading.local()
+
+
+def _check_download_cancelled(progress: dict) -> None:
+    token = getattr(_download_ctx, "cancel_token", None)
+    if token is not None and token.cancelled:
+        raise yt_dlp.utils.DownloadCancelled(f"AI job {token.ai_job_id} was cancelled")
+
+
 YDL_DOWNLOAD_OPTS = {
     'quiet': True,
     'no_warnings': True,
@@ -36,6 +50,9 @@ YDL_DOWNLOAD_OPTS = {
         'preferredcodec': 'mp3',
         'preferredquality': '192',  # Chất lượng 192kbps
     }],
+
+    # Gọi liên tục trong lúc tải -> job bị huỷ thì dừng tải ngay
+    'progress_hooks': [_check_download_cancelled],
 }
 
 # TẠO ĐỐI TƯỢNG DOWNLOADER TOÀN CỤC
@@ -47,8 +64,16 @@ MAX_AUDIO_SIZE_BYTES = 50 * 1024 * 1024  # 50MB
 
 
 #  YOUTUBE AUDIO (SYNC)
-def _download_youtube_audio_sync(rq: dto.MediaAudioCreateRequest) -> dto.AudioInfo:
+def _download_youtube_audio_sync(rq: dto.MediaAudioCreateRequest,
+                                 cancel_token: CancelToken | None = None) -> dto.AudioInfo:
+    # Video đã tải trước đó -> dùng file local, không gọi YouTube
+    cached = audio_cache.lookup_sync(youtube_video_id(rq.input_url))
+    if cached is not None:
+        print(f"Audio cache hit: {cached.file_path}")
+        return cached
+
     print("Đang lấy thông tin video...")
+    _download_ctx.cancel_token = cancel_token
 
     try:
         # LẤY THÔNG TIN
@@ -69,6 +94,8 @@ def _download_youtube_audio_sync(rq: dto.MediaAudioCreateRequest) -> dto.AudioIn
         print(f"Video hợp lệ (Thời lượng: {duration_sec}s). Bắt đầu tải...")
 
         # TẢI FILE MP3 (BLOCKING)
+        if cancel_token:
+            cancel_token.raise_if_cancelled()
         ydl_downloader.download([rq.input_url])
 
         # Xây dựng đường dẫn file cuối cùng (để lưu vào DB)
@@ -79,38 +106,57 @@ def _download_youtube_audio_sync(rq: dto.MediaAudioCreateRequest) -> dto.AudioIn
 
         print(f"Đã tải và convert thành công: {final_mp3_path}")
 
-        return dto.AudioInfo(
+        audio_info = dto.AudioInfo(
             file_path=final_mp3_path,
             duration=duration_sec,
             sourceReferenceId=video_id,
             thumbnailUrl=thumbnailUrl
         )
+        audio_cache.add_sync(audio_info)
+        return audio_info
 
+    except yt_dlp.utils.DownloadCancelled:
+        raise cancelled_error(cancel_token.ai_job_id if cancel_token else None)
     except yt_dlp.utils.DownloadError as e:
         raise BaseException(
             BaseErrorCode.BAD_REQUEST,
             message=f"Lỗi khi xử lý video: {str(e)}"
         )
+    except BaseException:
+        # Lỗi nghiệp vụ (video quá dài, job bị huỷ) -> giữ nguyên
+        raise
     except Exception as e:
         raise BaseException(
             BaseErrorCode.INTERNAL_SERVER_ERROR,
             message=f"Lỗi hệ thống: {str(e)}"
         )
+    finally:
+        _download_ctx.cancel_token = None
 
 
 #  YOUTUBE AUDIO (ASYNC)
-async def download_youtube_audio(rq: dto.MediaAudioCreateRequest) -> dto.AudioInfo:
-    return await asyncio.to_thread(_download_youtube_audio_sync, rq)
+async def download_youtube_audio(rq: dto.MediaAudioCreateRequest,
+                                 cancel_token: CancelToken | None = None) -> dto.AudioInfo:
+    return await asyncio.to_thread(_download_youtube_audio_sync, rq, cancel_token)
 
 
 #  DOWNLOAD AUDIO FILE (SYNC)
-def _download_audio_file_sync(rq: dto.MediaAudioCreateRequest) -> dto.AudioInfo:
+def _download_audio_file_sync(rq: dto.MediaAudioCreateRequest,
+                              cancel_token: CancelToken | None = None) -> dto.AudioInfo:
     """
     Tải file audio từ một URL bất kỳ (phiên bản an toàn) - BLOCKING.
     Dùng nội bộ, bọc ngoài bằng hàm async.
     """
     audio_url = rq.input_url
+    # Tên file = source id ổn định (audio_name hoặc hash URL) -> lần sau cache hit, không tải lại
+    source_id = getattr(rq, "audio_name", None) or url_source_id(audio_url)
+    cached = audio_cache.lookup_sync(source_id)
+    if cached is not None:
+        logger.info(f"Audio cache hit: {cached.file_path}")
+        return cached
+
     logger.info(f"Bắt đầu xử lý file audio từ URL: {audio_url}")
+    part_path = None
     try:
         # KIỂM TRA HEADERS (VALIDATION)
         with requests.head(audio_url, allow_redirects=True, timeout=5) as head_resp:
@@ -146,28 +192,44 @@ def _download_audio_file_sync(rq: dto.MediaAudioCreateRequest) -> dto.AudioInfo:
             # TẠO TÊN FILE AN TOÀN
             # Lấy đuôi file từ content-type (ví dụ: 'audio/mpeg' -> '.mp3')
             ext = mimetypes.guess_extension(content_type) or '.dat'  # Fallback nếu không đoán được
-            # Tạo tên file duy nhất bằng UUID để tránh trùng lặp
-            filename = (
-                f"{rq.audio_name}{ext}"
-                if getattr(rq, "audio_name", None)
-                else f"{uuid.uuid4()}{ext}"
-            )
+            filename = f"{source_id}{ext}"
             save_path = os.path.join(AUDIO_SAVE_PATH, filename)
 
         # TẢI FILE (STREAM) 
         logger.info(f"Đang tải file về {save_path}...")
+        # Ghi vào file .part rồi đổi tên -> cache không bao giờ thấy file dở dang
+        part_path = f"{save_path}.part"
+        written = 0
         with requests.get(audio_url, stream=True, timeout=60) as r_download:
             r_download.raise_for_status()
-            with open(save_path, 'wb') as f:
+            expected = r_download.headers.get('Content-Length')
+            if r_download.headers.get('Content-Encoding'):
+                expected = None  # iter_content trả dữ liệu đã giải nén -> không so được với header
+            with open(part_path, 'wb') as f:
                 for chunk in r_download.iter_content(chunk_size=8192):  # Tải từng cục 8KB
+                    if cancel_token and cancel_token.cancelled:
+                        break
                     if chunk:
                         f.write(chunk)
+                        written += len(chunk)
+
+        # Job bị huỷ giữa chừng -> file .part được xoá ở finally
+        if cancel_token:
+            cancel_token.raise_if_cancelled()
+        if expected and written < int(expected):
+            raise BaseException(
+                BaseErrorCode.BAD_REQUEST,
+                message=f"Tải file thất bại: chỉ nhận được {written}/{expected} bytes"
+            )
+        os.replace(part_path, save_path)
 
         logger.info(f"Đã tải file audio thành công: {save_path}")
-        return dto.AudioInfo(
+        audio_info = dto.AudioInfo(
             file_path=save_path,
-            sourceReferenceId=filename.split('.')[0],
+            sourceReferenceId=source_id,
         )
+        audio_cache.add_sync(audio_info)
+        return audio_info
 
     except requests.exceptions.Timeout:
         logger.error(f"Lỗi Timeout khi tải file: {audio_url}")
@@ -190,7 +252,15 @@ def _download_audio_file_sync(rq: dto.MediaAudioCreateRequest) -> dto.AudioInfo:
             BaseErrorCode.INTERNAL_SERVER_ERROR,
             message=f"Lỗi hệ thống khi xử lý file: {str(e)}"
         )
+    finally:
+        # Lỗi HTTP / timeout / đọc thiếu / huỷ -> không để .part nằm ngoài sự quản lý của audio_cache
+        if part_path and os.path.exists(part_path):
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
 
 #  DOWNLOAD AUDIO FILE (ASYNC)
-async def download_audio_file(rq: dto.MediaAudioCreateRequest) -> dto.AudioInfo:
-    return await asyncio.to_thread(_download_audio_file_sync, rq)
+async def download_audio_file(rq: dto.MediaAudioCreateRequest,
+                              cancel_token: CancelToken | None = None) -> dto.AudioInfo:
+    return await asyncio.to_thread(_download_audio_file_sync, rq, cancel_token)
@@ -0,0 +1,87 @@
+import hashlib
+import os
+from typing import List, Optional
+
+import orjson
+
+from src.gemini.config import config as gemini_config
+from src.gemini.prompts import SENTENCE_PROMPT_TEMPLATE
+from src.redis.redis_client import redis_client
+
+# =========================
+# CONFIG
+# =========================
+# Kết quả Gemini theo từng batch câu của lesson -> job lỗi giữa chừng / restart chỉ gọi lại batch còn thiếu
+NLP_CHECKPOINT_ENABLED = os.getenv("NLP_CHECKPOINT_ENABLED", "1") == "1"
+NLP_CHECKPOINT_TTL = int(os.getenv("NLP_CHECKPOINT_TTL", str(7 * 24 * 3600)))
+
+_REDIS_KEY_PREFIX = "nlpCheckpoint:"
+
+# Đổi model / prompt -> checkpoint cũ không còn khớp
+_PROMPT_VERSION = hashlib.sha256(
+    f"{gemini_config.model}\n{SENTENCE_PROMPT_TEMPLATE.template}".encode("utf-8")
+).hexdigest()[:16]
+
+_stats = {"loads": 0, "hits": 0, "misses": 0, "writes": 0, "errors": 0}
+
+
+def _redis_key(owner: str) -> str:
+    return f"{_REDIS_KEY_PREFIX}{owner}"
+
+
+def batch_digest(batch: List[dict]) -> str:
+    """Field trong hash: cùng orderIndex + text + prompt thì dùng lại được (kể cả sau khi transcribe lại)."""
+    body = orjson.dumps({"v": _PROMPT_VERSION, "batch": batch})
+    return hashlib.sha256(body).hexdigest()
+
+
+# PUBLIC API
+async def load(owner: str | None) -> dict[str, list]:
+    """Toàn bộ checkpoint của 1 lesson trong 1 lệnh HGETALL: digest -> kết quả Gemini."""
+    if not NLP_CHECKPOINT_ENABLED or not owner:
+        return {}
+    try:
+        raw = await redis_client.hgetall(_redis_key(owner))
+    except Exception as e:
+        _stats["errors"] += 1
+        print(f"[NlpCheckpoint] Redis load failed: {e}")
+        return {}
+
+    _stats["loads"] += 1
+    checkpoints = {}
+    for digest, value in raw.items():
+        try:
+            checkpoints[digest] = orjson.loads(value)
+        except Exception:
+            continue
+    return checkpoints
+
+
+def lookup(checkpoints: dict[str, list], batch: List[dict]) -> Optional[list]:
+    result = checkpoints.get(batch_digest(batch))
+    # Checkpoint chỉ được chứa orderIndex của chính batch đó
+    expected = {item["orderIndex"] for item in batch}
+    if isinstance(result, list) and all(isinstance(item, dict) and item.get("orderIndex") in expected for item in result):
+        _stats["hits"] += 1
+        return result
+    _stats["misses"] += 1
+    return None
+
+
+async def save(owner: str | None, batch: List[dict], result: list) -> None:
+    if not NLP_CHECKPOINT_ENABLED or not owner:
+        return
+    key = _redis_key(owner)
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, batch_digest(batch), orjson.dumps(result).decode("utf-8"))
+            pipe.expire(key, NLP_CHECKPOINT_TTL)
+            await pipe.execute()
+        _stats["writes"] += 1
+    except Exception as e:
+        _stats["errors"] += 1
+        print(f"[NlpCheckpoint] Redis save failed: {e}")
+
+
+def get_stats() -> dict:
+    return dict(_stats)
@@ -0,0 +1,101 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import orjson
+
+from src.dto import ShadowingRequest
+from src.redis.redis_client import redis_client
+from src.utils.lru_cache import LRUCache
+
+# =========================
+# CONFIG
+# =========================
+# sentenceId -> token câu mong đợi (đã chuẩn hoá), để client retry chỉ cần gửi sentenceId
+SENTENCE_TOKEN_CACHE_SIZE = int(os.getenv("SENTENCE_TOKEN_CACHE_SIZE", "10000"))
+SENTENCE_TOKEN_REDIS_TTL = int(os.getenv("SENTENCE_TOKEN_REDIS_TTL", str(7 * 24 * 3600)))
+
+_REDIS_KEY_PREFIX = "sentenceTokens:"
+
+
+@dataclass(frozen=True)
+class SentenceTokens:
+    """Câu mong đợi dạng mảng: texts (hiển thị) + normalized (để chấm), cùng độ dài."""
+    sentence_id: int
+    texts: tuple[str, ...]
+    normalized: tuple[str, ...]
+
+    @property
+    def expected_text(self) -> str:
+        return " ".join(self.texts)
+
+    @classmethod
+    def from_request(cls, rq: ShadowingRequest) -> "SentenceTokens":
+        return cls(
+            sentence_id=rq.sentenceId,
+            texts=tuple(w.wordText for w in rq.expectedWords),
+            normalized=tuple(w.wordNormalized for w in rq.expectedWords),
+        )
+
+
+# Tier 1: RAM (mỗi process)
+_local = LRUCache(max_entries=SENTENCE_TOKEN_CACHE_SIZE, name="sentence_tokens")
+
+_stats = {"localHits": 0, "redisHits": 0, "misses": 0, "writes": 0, "errors": 0}
+
+
+def _redis_key(sentence_id: int) -> str:
+    return f"{_REDIS_KEY_PREFIX}{sentence_id}"
+
+
+def _dumps(tokens: SentenceTokens) -> str:
+    return orjson.dumps({"texts": tokens.texts, "normalized": tokens.normalized}).decode("utf-8")
+
+
+def _loads(sentence_id: int, raw: str) -> Optional[SentenceTokens]:
+    data = orjson.loads(raw)
+    texts, normalized = data.get("texts"), data.get("normalized")
+    if not isinstance(texts, list) or not isinstance(normalized, list) or len(texts) != len(normalized):
+        return None
+    return SentenceTokens(sentence_id, tuple(texts), tuple(normalized))
+
+
+# PUBLIC API
+async def get(sentence_id: int) -> Optional[SentenceTokens]:
+    tokens = _local.get(sentence_id)
+    if tokens is not None:
+        _stats["localHits"] += 1
+        return tokens
+
+    try:
+        raw = await redis_client.get(_redis_key(sentence_id))
+        tokens = _loads(sentence_id, raw) if raw else None
+    except Exception as e:
+        _stats["errors"] += 1
+        print(f"[SentenceTokenStore] Redis get failed: {e}")
+        tokens = None
+
+    if tokens is None:
+        _stats["misses"] += 1
+        return None
+
+    _stats["redisHits"] += 1
+    _local.put(sentence_id, tokens)
+    return tokens
+
+
+async def put(tokens: SentenceTokens) -> None:
+    """Ghi khi client gửi kèm expectedWords; bỏ qua nếu RAM đã có đúng bản này."""
+    if _local.get(tokens.sentence_id) == tokens:
+        return
+    _local.put(tokens.sentence_id, tokens)
+    try:
+        await redis_client.set(_redis_key(tokens.sentence_id), _dumps(tokens), ex=SENTENCE_TOKEN_REDIS_TTL)
+        _stats["writes"] += 1
+    except Exception as e:
+        _stats["errors"] += 1
+        print(f"[SentenceTokenStore] Redis set failed: {e}")
+
+
+def get_stats() -> dict:
+    return {**_stats, "local": _local.get_stats()}
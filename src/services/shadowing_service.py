@@ -1,48 +1,70 @@
+import os
+from functools import lru_cache
 from typing import List, Tuple
 
-from src.dto import ShadowingResult, ShadowingWordCompare, ShadowingRequest
+import numpy as np
+
+from src.dto import ShadowingResult, ShadowingWordCompare
 from src.services.file_service import normalize_word_lower
+from src.services.sentence_token_store import SentenceTokens
+from src.utils.word_alignment import align_tokens
 
 # Kiểu token: (raw, normalized)
 RecToken = Tuple[str, str]
 
+# Memo (expected, recognized) -> (status, score); cặp từ lặp lại rất nhiều giữa các learner
+SHADOWING_WORD_CACHE_SIZE = int(os.getenv("SHADOWING_WORD_CACHE_SIZE", "65536"))
+
 
-# Levenshtein distance + similarity
-def _levenshtein_distance(a: str, b: str) -> int:
+# Levenshtein distance có ngưỡng
+def _bounded_levenshtein(a: str, b: str, max_dist: int) -> int:
     """
-    Levenshtein distance đơn giản O(len(a) * len(b)).
-    Dùng cho từ ngắn nên OK.
+    Levenshtein 2 hàng, chỉ tính trong band ±max_dist quanh đường chéo.
+    Vượt ngưỡng -> dừng sớm, trả về max_dist + 1 (không cần biết chính xác bao xa).
     """
-    if a == b:
-        return 0
-    if not a:
-        return len(b)
-    if not b:
-        return len(a)
-
+    over = max_dist + 1
     la, lb = len(a), len(b)
-    dp = [[0] * (lb + 1) for _ in range(la + 1)]
+    if abs(la - lb) > max_dist:
+        return over
+    if la == 0 or lb == 0:
+        return max(la, lb)
 
-    for i in range(la + 1):
-        dp[i][0] = i
-    for j in range(lb + 1):
-        dp[0][j] = j
+    prev = list(range(lb + 1))
+    cur = [0] * (lb + 1)
 
     for i in range(1, la + 1):
-        for j in range(1, lb + 1):
-            cost = 0 if a[i - 1] == b[j - 1] else 1
-            dp[i][j] = min(
-                dp[i - 1][j] + 1,          # delete
-                dp[i][j - 1] + 1,          # insert
-                dp[i - 1][j - 1] + cost,   # replace
-            )
+        ca = a[i - 1]
+        lo = max(1, i - max_dist)
+        hi = min(lb, i + max_dist)
+
+        cur[lo - 1] = i if lo == 1 else over
+        row_min = cur[lo - 1]
+        for j in range(lo, hi + 1):
+            value = prev[j - 1] if ca == b[j - 1] else prev[j - 1] + 1   # replace
+            if prev[j] + 1 < value:
+                value = prev[j] + 1                                      # delete
+            if cur[j - 1] + 1 < value:
+                value = cur[j - 1] + 1                                   # insert
+            cur[j] = value
+            if value < row_min:
+                row_min = value
+        if hi < lb:
+            cur[hi + 1] = over  # ô ngoài band của hàng kế tiếp
+
+        if row_min > max_dist:
+            return over
+        prev, cur = cur, prev
 
-    return dp[la][lb]
+    return min(prev[lb], over)
 
 
+def _near_limit(max_len: int) -> int:
+    """Số ký tự sai tối đa để còn NEAR: dist == 1 hoặc 1 - dist / max_len >= 0.8."""
+    return max(1, max_len // 5)
 
 
 # Phân loại 1 từ (status + score)
+@lru_cache(maxsize=SHADOWING_WORD_CACHE_SIZE)
 def _classify_word(
     expected_norm: str | None,
     recognized_norm: str | None,
@@ -60,8 +82,9 @@ def _classify_word(
         if expected_norm == recognized_norm:
             return "CORRECT", 1.0
 
-        dist = _levenshtein_distance(expected_norm, recognized_norm)
         max_len = max(len(expected_norm), len(recognized_norm))
+        limit = _near_limit(max_len)
+        dist = _bounded_levenshtein(expected_norm, recognized_norm, limit)
 
         # 1) Rất gần: sai 1 ký tự (vd: news/new, learning/learnin)
         if dist == 1:
@@ -73,9 +96,8 @@ def _classify_word(
             else:
                 return "NEAR", 0.85
 
-        # 2) Hơi lệch hơn 1 tí nhưng vẫn khá giống
-        sim = 1.0 - dist / max_len
-        if sim >= 0.8:
+        # 2) Hơi lệch hơn 1 tí nhưng vẫn khá giống (sim = 1 - dist / max_len >= 0.8)
+        if dist <= limit:
             return "NEAR", 0.7
 
         # 3) Còn lại -> sai hẳn
@@ -94,6 +116,20 @@ def _classify_word(
 
 
 
+# Cost thay thế cho alignment
+def _near_max_edits(max_len: np.ndarray) -> np.ndarray:
+    """_near_limit cho cả mảng (dùng lọc cặp trong alignment)."""
+    return np.maximum(1, max_len // 5)
+
+
+def _substitution_cost(expected_norm: str, recognized_norm: str) -> float:
+    """CORRECT = 0, NEAR = 1 - score (0.05–0.3), WRONG = 1 (bằng 1 lần thêm/bớt từ)."""
+    status, score = _classify_word(expected_norm, recognized_norm)
+    if status == "NEAR":
+        return 1.0 - score
+    return 0.0 if status == "CORRECT" else 1.0
+
+
 # Helper: lấy recognized text + tokens
 def _extract_recognized_tokens(transcription_result: dict) -> tuple[str, List[RecToken]]:
     """
@@ -126,36 +162,49 @@ def _extract_recognized_tokens(transcription_result: dict) -> tuple[str, List[Re
     return recognized_text, rec_items
 
 
-# Main: build_shadowing_result
-def build_shadowing_result(
-    rq: ShadowingRequest,
+# Main: build_shadowing_columns / build_shadowing_result
+def build_shadowing_columns(
+    expected: SentenceTokens,
     transcription_result: dict,
-) -> ShadowingResult:
-    expected_words = rq.expectedWords
-
+) -> dict:
+    """
+    Kết quả shadowing dạng cột: compares = {expectedWord: [...], status: [...], score: [...], ...}.
+    Response compact dùng trực tiếp, không tạo model cho từng vị trí.
+    """
     # Câu chuẩn để hiển thị
-    expected_text = " ".join(w.wordText for w in expected_words)
-    expected_norm = [w.wordNormalized for w in expected_words]
+    expected_text = expected.expected_text
+    expected_norm = expected.normalized
 
     # Câu recognized + tokens chuẩn hóa
     recognized_text, rec_items = _extract_recognized_tokens(transcription_result)
 
-    expected_len = len(expected_norm)
-    rec_len = len(rec_items)
-    max_len = max(expected_len, rec_len)
+    # Align theo edit distance (không so theo vị trí) -> 1 từ thừa/thiếu không làm lệch cả câu
+    ops = align_tokens(
+        expected_norm,
+        [n for _, n in rec_items],
+        _substitution_cost,
+        max_edits=_near_max_edits,
+    )
 
-    compares: List[ShadowingWordCompare] = []
+    compares = {
+        "expectedWord": [],
+        "recognizedWord": [],
+        "expectedNormalized": [],
+        "recognizedNormalized": [],
+        "status": [],
+        "score": [],
+    }
     correct_count = 0          # chỉ CORRECT
     total_score = 0.0          # sum(score) cho các từ expected có mặt
 
     last_recognized_position = -1
 
-    for i in range(max_len):
-        exp_word = expected_words[i].wordText if i < expected_len else None
-        exp_norm = expected_norm[i] if i < expected_len else None
+    for i, (exp_idx, rec_idx) in enumerate(ops):
+        exp_word = expected.texts[exp_idx] if exp_idx is not None else None
+        exp_norm = expected_norm[exp_idx] if exp_idx is not None else None
 
-        rec_raw = rec_items[i][0] if i < rec_len else None
-        rec_norm = rec_items[i][1] if i < rec_len else None
+        rec_raw = rec_items[rec_idx][0] if rec_idx is not None else None
+        rec_norm = rec_items[rec_idx][1] if rec_idx is not None else None
 
         if rec_norm is not None:
             last_recognized_position = i
@@ -169,17 +218,12 @@ def build_shadowing_result(
         if exp_norm is not None:
             total_score += score
 
-        compares.append(
-            ShadowingWordCompare(
-                position=i,
-                expectedWord=exp_word,
-                recognizedWord=rec_raw,
-                expectedNormalized=exp_norm,
-                recognizedNormalized=rec_norm,
-                status=status,
-                score=score,
-            )
-        )
+        compares["expectedWord"].append(exp_word)
+        compares["recognizedWord"].append(rec_raw)
+        compares["expectedNormalized"].append(exp_norm)
+        compares["recognizedNormalized"].append(rec_norm)
+        compares["status"].append(status)
+        compares["score"].append(score)
 
     total_words = len(expected_norm)
     if total_words > 0:
@@ -189,15 +233,47 @@ def build_shadowing_result(
         accuracy = 0.0
         weighted_accuracy = 0.0
 
+    return {
+        "sentenceId": expected.sentence_id,
+        "expectedText": expected_text,
+        "recognizedText": recognized_text,
+        "totalWords": total_words,
+        "correctWords": correct_count,
+        "accuracy": round(accuracy, 2),
+        "weightedAccuracy": round(weighted_accuracy, 2),
+        "recognizedWordCount": len(rec_items),
+        "lastRecognizedPosition": last_recognized_position,
+        "compares": compares,
+    }
+
+
+def build_shadowing_result(
+    expected: SentenceTokens,
+    transcription_result: dict,
+) -> ShadowingResult:
+    columns = build_shadowing_columns(expected, transcription_result)
+    compares = columns["compares"]
     return ShadowingResult(
-        sentenceId=rq.sentenceId,
-        expectedText=expected_text,
-        recognizedText=recognized_text,
-        totalWords=total_words,
-        correctWords=correct_count,
-        accuracy=round(accuracy, 2),
-        weightedAccuracy=round(weighted_accuracy, 2),
-        recognizedWordCount=len(rec_items),
-        lastRecognizedPosition=last_recognized_position,
-        compares=compares,
+        **{
+            **columns,
+            "compares": [
+                ShadowingWordCompare(
+                    position=i,
+                    expectedWord=exp_word,
+                    recognizedWord=rec_raw,
+                    expectedNormalized=exp_norm,
+                    recognizedNormalized=rec_norm,
+                    status=status,
+                    score=score,
+                )
+                for i, (exp_word, rec_raw, exp_norm, rec_norm, status, score) in enumerate(zip(
+                    compares["expectedWord"],
+                    compares["recognizedWord"],
+                    compares["expectedNormalized"],
+                    compares["recognizedNormalized"],
+                    compares["status"],
+                    compares["score"],
+                ))
+            ],
+        }
     )
@@ -0,0 +1,118 @@
+import asyncio
+import os
+from typing import Awaitable, Callable
+
+import numpy as np
+
+from src.dto import ShadowingResult
+from src.errors.base_exception import BaseException
+from src.errors.base_error_code import BaseErrorCode
+from src.services.sentence_token_store import SentenceTokens
+from src.services.shadowing_service import build_shadowing_result
+from src.services.speech_to_text_service import SAMPLE_RATE, BATCH_CLIP_MAX_SECONDS, transcribe_batched
+
+# Cứ mỗi N giây audio mới -> decode lại để đẩy kết quả tạm cho client
+SHADOWING_STREAM_PARTIAL_INTERVAL = float(os.getenv("SHADOWING_STREAM_PARTIAL_INTERVAL", "0.8"))
+
+PartialCallback = Callable[[ShadowingResult], Awaitable[None]]
+
+
+class ShadowingStreamSession:
+    """
+    1 phiên shadowing qua WebSocket.
+
+    - Nhận frame PCM s16le mono trong lúc learner đang nói.
+    - Mỗi SHADOWING_STREAM_PARTIAL_INTERVAL giây audio mới -> decode nền (text-only)
+      và đẩy ShadowingResult tạm (lastRecognizedPosition tăng dần).
+    - Khi kết thúc: nếu lần decode cuối đã phủ hết audio thì dùng lại luôn,
+      ngược lại chỉ còn 1 lần decode clip ngắn.
+    """
+
+    def __init__(
+        self,
+        expected: SentenceTokens,
+        on_partial: PartialCallback,
+        sample_rate: int = SAMPLE_RATE,
+        word_timings: bool = False,
+        prompt_hint: bool = True,
+    ):
+        self.expected = expected
+        self.sample_rate = sample_rate
+        self.word_timings = word_timings
+        expected_text = expected.expected_text
+        self.prompt = expected_text if prompt_hint and expected_text else None
+
+        self._on_partial = on_partial
+        self._frames: list[np.ndarray] = []
+        self._total_samples = 0
+        self._decoded_samples = 0
+        self._last_result: dict | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def duration(self) -> float:
+        return self._total_samples / SAMPLE_RATE
+
+    def feed(self, data: bytes) -> None:
+        if len(data) % 2:
+            data = data[:-1]
+        samples = np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+        if self.sample_rate != SAMPLE_RATE and samples.size:
+            target_len = int(round(samples.size * SAMPLE_RATE / self.sample_rate))
+            samples = np.interp(
+                np.linspace(0, samples.size - 1, target_len),
+                np.arange(samples.size),
+                samples,
+            ).astype(np.float32)
+
+        self._frames.append(samples)
+        self._total_samples += samples.size
+        if self.duration > BATCH_CLIP_MAX_SECONDS:
+            raise BaseException(
+                BaseErrorCode.BAD_REQUEST,
+                f"Shadowing stream longer than {int(BATCH_CLIP_MAX_SECONDS)}s",
+            )
+
+        new_seconds = (self._total_samples - self._decoded_samples) / SAMPLE_RATE
+        if new_seconds >= SHADOWING_STREAM_PARTIAL_INTERVAL and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._decode_partial())
+
+    def _snapshot(self) -> np.ndarray:
+        if len(self._frames) > 1:
+            self._frames = [np.concatenate(self._frames)]
+        return self._frames[0] if self._frames else np.zeros(0, dtype=np.float32)
+
+    async def _decode_partial(self) -> None:
+        audio = self._snapshot()
+        if audio.size == 0:
+            return
+        try:
+            result = await transcribe_batched(audio, word_timings=False, prompt=self.prompt, use_cache=False)
+        except Exception as e:
+            print(f"[ShadowingStream] Partial decode failed: {e}")
+            return
+
+        self._decoded_samples = audio.size
+        self._last_result = result
+        await self._on_partial(build_shadowing_result(self.expected, result))
+
+    async def finish(self) -> tuple[dict, ShadowingResult]:
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+        audio = self._snapshot()
+        if audio.size == 0:
+            raise BaseException(BaseErrorCode.INVALID_AUDIO_FILE, "No audio received")
+
+        # Lần decode tạm cuối đã phủ hết audio -> không còn việc gì phải làm
+        if self._last_result is not None and self._decoded_samples == audio.size and not self.word_timings:
+            result = self._last_result
+        else:
+            result = await transcribe_batched(audio, word_timings=self.word_timings, prompt=self.prompt)
+
+        return result, build_shadowing_result(self.expected, result)
+
+    async def close(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
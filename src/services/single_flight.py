@@ -0,0 +1,172 @@
+"""
+Single-flight: nhiều job cùng làm 1 việc (cùng nguồn audio, cùng batch câu) -> chỉ 1 job chạy,
+các job còn lại chờ và dùng chung kết quả.
+
+- Trong process: asyncio.Future theo key.
+- Giữa các instance: Redis lock `singleFlight:{key}:lock` (SET NX PX, gia hạn định kỳ khi đang chạy);
+  leader ghi kết quả vào `singleFlight:{key}:result` (TTL ngắn), follower poll tới khi có kết quả
+  hoặc lock biến mất (leader chết / lỗi) -> follower tự lên làm leader.
+- Leader lỗi hoặc bị huỷ -> follower chạy lại việc của mình, không nhận lỗi của job khác.
+- Redis lỗi -> chạy local, không chặn job.
+- `fresh=True` (lesson restart): xoá kết quả đã publish, không nhận kết quả cũ / đang chạy của job khác.
+"""
+import asyncio
+import os
+import uuid
+from typing import Any, Awaitable, Callable
+
+import orjson
+
+from src.enum import LessonSourceType
+from src.redis.redis_client import redis_client
+from src.utils.source_id import url_source_id, youtube_video_id
+
+# =========================
+# CONFIG
+# =========================
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "1") == "1"
+SINGLE_FLIGHT_LOCK_TTL = float(os.getenv("SINGLE_FLIGHT_LOCK_TTL", "30"))
+SINGLE_FLIGHT_RESULT_TTL = int(os.getenv("SINGLE_FLIGHT_RESULT_TTL", "300"))
+
+_KEY_PREFIX = "singleFlight:"
+_POLL_MIN_SECONDS = 0.2
+_POLL_MAX_SECONDS = 2.0
+
+# Xoá lock chỉ khi vẫn là của mình (lock có thể đã hết hạn và bị instance khác lấy)
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end
+return 0
+"""
+_REFRESH_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end
+return 0
+"""
+
+_inflight: dict[str, asyncio.Future] = {}
+_stats = {"leaders": 0, "localShared": 0, "remoteShared": 0, "takeovers": 0, "redisErrors": 0}
+
+
+def source_key(source_type: LessonSourceType, url: str | None) -> str | None:
+    """YouTube -> video id (mọi dạng link); URL khác -> hash URL đã chuẩn hoá."""
+    if not url:
+        return None
+    video_id = youtube_video_id(url) if source_type == LessonSourceType.youtube else None
+    if video_id:
+        return f"youtube:{video_id}"
+    return f"url:{url_source_id(url)}"
+
+
+def _lock_key(key: str) -> str:
+    return f"{_KEY_PREFIX}{key}:lock"
+
+
+def _result_key(key: str) -> str:
+    return f"{_KEY_PREFIX}{key}:result"
+
+
+# DISTRIBUTED
+async def _keep_lock(key: str, token: str) -> None:
+    ttl_ms = int(SINGLE_FLIGHT_LOCK_TTL * 1000)
+    while True:
+        await asyncio.sleep(SINGLE_FLIGHT_LOCK_TTL / 3)
+        try:
+            await redis_client.eval(_REFRESH_SCRIPT, 1, _lock_key(key), token, ttl_ms)
+        except Exception as e:
+            _stats["redisErrors"] += 1
+            print(f"[SingleFlight] Lock refresh failed key={key}: {e}")
+
+
+async def _run_distributed(key: str, fn: Callable[[], Awaitable[Any]],
+                           encode: Callable[[Any], Any], decode: Callable[[Any], Any],
+                           fresh: bool = False) -> Any:
+    token = uuid.uuid4().hex
+    poll = _POLL_MIN_SECONDS
+    waited = False
+    try:
+        if fresh:
+            await redis_client.delete(_result_key(key))
+        while True:
+            # fresh: chỉ chờ leader khác nhả lock rồi tự chạy, không đọc kết quả của nó
+            cached = None if fresh else await redis_client.get(_result_key(key))
+            if cached:
+                _stats["remoteShared"] += 1
+                return decode(orjson.loads(cached))
+            if await redis_client.set(_lock_key(key), token, nx=True, px=int(SINGLE_FLIGHT_LOCK_TTL * 1000)):
+                break
+            # Instance khác đang chạy -> chờ kết quả
+            if not waited:
+                print(f"[SingleFlight] Waiting for remote leader key={key}")
+                waited = True
+            await asyncio.sleep(poll)
+            poll = min(poll * 2, _POLL_MAX_SECONDS)
+    except Exception as e:
+        _stats["redisErrors"] += 1
+        print(f"[SingleFlight] Redis unavailable key={key}, running locally: {e}")
+        return await fn()
+
+    if waited:
+        _stats["takeovers"] += 1
+    _stats["leaders"] += 1
+    refresher = asyncio.create_task(_keep_lock(key, token))
+    try:
+        result = await fn()
+        try:
+            await redis_client.set(_result_key(key), orjson.dumps(encode(result)), ex=SINGLE_FLIGHT_RESULT_TTL)
+        except Exception as e:
+            _stats["redisErrors"] += 1
+            print(f"[SingleFlight] Cannot publish result key={key}: {e}")
+        return result
+    finally:
+        refresher.cancel()
+        try:
+            await redis_client.eval(_RELEASE_SCRIPT, 1, _lock_key(key), token)
+        except Exception:
+            _stats["redisErrors"] += 1
+
+
+# PUBLIC API
+async def run(key: str | None, fn: Callable[[], Awaitable[Any]],
+              encode: Callable[[Any], Any] = lambda v: v,
+              decode: Callable[[Any], Any] = lambda v: v,
+              fresh: bool = False) -> Any:
+    """
+    Chạy `fn()` 1 lần cho mỗi `key` đang bay; caller khác cùng key nhận chung kết quả.
+    encode/decode: kết quả <-> dữ liệu JSON để chia sẻ qua Redis.
+    fresh: bắt buộc chạy lại (kết quả cũ có thể chính là thứ cần làm lại); caller sau vẫn dùng chung kết quả mới.
+    """
+    if not SINGLE_FLIGHT_ENABLED or not key:
+        return await fn()
+
+    while not fresh:
+        shared = _inflight.get(key)
+        if shared is None:
+            break
+        try:
+            _stats["localShared"] += 1
+            return await asyncio.shield(shared)
+        except (asyncio.CancelledError, Exception):
+            if not shared.done():
+                raise  # chính caller này bị huỷ
+            # Leader lỗi / bị huỷ -> thử lại, có thể tự lên làm leader
+            _stats["takeovers"] += 1
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        result = await _run_distributed(key, fn, encode, decode, fresh)
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # không có follower thì cũng không cảnh báo "never retrieved"
+        raise
+    finally:
+        if _inflight.get(key) is future:
+            _inflight.pop(key, None)
+
+
+def get_stats() -> dict:
+    return {"inFlight": len(_inflight), **_stats}
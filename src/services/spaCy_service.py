@@ -1,6 +1,7 @@
 import spacy
 import asyncio
 import re
+import time
 
 from src.errors.base_error_code import BaseErrorCode
 
@@ -107,6 +108,20 @@ def preload_spacy_model():
         print(f"Failed to preload spaCy model: {e}")
 
 
+# WARM-UP: load + chạy 1 doc giả, trả về timings (giây)
+def warm_up_spacy_sync() -> dict:
+    started = time.perf_counter()
+    _ensure_spacy_model_loaded()
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    _spacy_model("Warm up the English pipeline.")
+    return {
+        "loadSeconds": round(load_seconds, 3),
+        "warmupSeconds": round(time.perf_counter() - started, 3),
+    }
+
+
 # UNLOAD MODEL
 def unload_spacy_model():
     global _spacy_model
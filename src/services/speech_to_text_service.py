@@ -1,12 +1,25 @@
 import asyncio
+import copy
 import os
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, is_dataclass, replace as dataclass_replace
 
-import librosa
+import numpy as np
 import torch
 import whisperx
+from faster_whisper.tokenizer import Tokenizer
 
+from src import dto
 from src.errors.base_exception import BaseException
 from src.errors.base_error_code import BaseErrorCode
+from src.services import transcription_cache
+from src.services.job_cancellation import CancelToken
+from src.services.asr_worker_pool import AsrWorkerPool, LaneConfig
+from src.services.transcription_batcher import TranscriptionBatcher
+from src.utils.audio_probe import probe_audio_duration
+from src.utils.lru_cache import LRUCache
 
 # =========================
 # CONFIG
@@ -14,38 +27,185 @@ from src.errors.base_error_code import BaseErrorCode
 ENABLE_WHISPERX = os.getenv("ENABLE_WHISPERX", "1") == "1"  # 1=bật, 0=tắt
 
 device = "cuda" if torch.cuda.is_available() else "cpu"
-compute_type = "float16" if device == "cuda" else "float32"
+# CPU: int8 (CTranslate2) nhanh hơn float32 nhiều lần trên node không có GPU
+compute_type = "float16" if device == "cuda" else "int8"
 
-# Model sẽ chỉ load khi cần
-whisper_model = None
+# Micro-batching cho shadowing (clip ngắn 2–5s)
+ASR_BATCH_WINDOW_MS = int(os.getenv("ASR_BATCH_WINDOW_MS", "50"))
+ASR_BATCH_MAX_SIZE = int(os.getenv("ASR_BATCH_MAX_SIZE", "8"))
 
-# Align model cache (per language)
-_align_model_cache: dict[str, tuple[object, dict]] = {}
+# Clip dài hơn 1 cửa sổ Whisper (30s) không gộp batch được -> chạy riêng
+SAMPLE_RATE = 16000
+BATCH_CLIP_MAX_SECONDS = 30.0
 
+# Streaming transcribe cho lesson: cắt audio dài thành chunk ~N giây tại khoảng lặng
+LESSON_CHUNK_SECONDS = float(os.getenv("LESSON_CHUNK_SECONDS", "60"))
+_VAD_FRAME_SECONDS = 0.03      # frame 30ms để tính năng lượng
+_SPLIT_SEARCH_SECONDS = 10.0   # tìm điểm cắt trong khoảng ±10s quanh mốc N giây
 
-# MODEL LOAD 
-def _ensure_whisper_model_loaded():
-    global whisper_model
+# Pool process ASR: mỗi lane có worker riêng (0 = chạy in-process bằng thread)
+ASR_POOL_SHADOWING_WORKERS = int(os.getenv("ASR_POOL_SHADOWING_WORKERS", "1"))
+ASR_POOL_LESSON_WORKERS = int(os.getenv("ASR_POOL_LESSON_WORKERS", "1"))
+ASR_POOL_SHADOWING_TIMEOUT = float(os.getenv("ASR_POOL_SHADOWING_TIMEOUT", "60"))
+ASR_POOL_LESSON_TIMEOUT = float(os.getenv("ASR_POOL_LESSON_TIMEOUT", "1800"))
+SHADOWING_LANE = "shadowing"
+LESSON_LANE = "lesson"
+
+
+# MODEL REGISTRY: mỗi workload (shadowing / lesson) chọn model + compute type riêng
+@dataclass(frozen=True)
+class AsrModelSpec:
+    name: str
+    compute_type: str
+
+
+ASR_MODEL_PROFILES: dict[str, AsrModelSpec] = {
+    SHADOWING_LANE: AsrModelSpec(
+        os.getenv("ASR_SHADOWING_MODEL") or "base.en",
+        os.getenv("ASR_SHADOWING_COMPUTE_TYPE") or compute_type,
+    ),
+    LESSON_LANE: AsrModelSpec(
+        os.getenv("ASR_LESSON_MODEL") or "base.en",
+        os.getenv("ASR_LESSON_COMPUTE_TYPE") or compute_type,
+    ),
+}
+
+# Model sẽ chỉ load khi cần; cùng spec -> load 1 lần, dùng chung giữa các workload
+_whisper_models: dict[AsrModelSpec, object] = {}
+_whisper_models_lock = threading.Lock()
+
+# Align model cache (per language): LRU có giới hạn, ngôn ngữ pinned không bị evict
+ALIGN_CACHE_MAX_ENTRIES = int(os.getenv("ALIGN_CACHE_MAX_ENTRIES", "3"))
+ALIGN_CACHE_MAX_MB = int(os.getenv("ALIGN_CACHE_MAX_MB", "0"))  # 0 = không giới hạn theo RAM
+ALIGN_CACHE_PINNED = [
+    lang.strip() for lang in os.getenv("ALIGN_CACHE_PINNED", "en").split(",") if lang.strip()
+]
+
+
+def _align_model_size(entry: tuple[object, dict]) -> int:
+    """Ước lượng RAM (bytes) của wav2vec2 align model = params + buffers."""
+    model = entry[0]
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except Exception:
+        return 0
+
+
+def _release_align_model(language_code: str, entry: tuple[object, dict]) -> None:
+    print(f"[WhisperX] Evicted align model for language={language_code}")
+    del entry
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+_align_model_cache = LRUCache(
+    max_entries=ALIGN_CACHE_MAX_ENTRIES,
+    max_size=ALIGN_CACHE_MAX_MB * 1024 * 1024,
+    size_fn=_align_model_size,
+    pinned=ALIGN_CACHE_PINNED,
+    on_evict=_release_align_model,
+    name="align_models",
+)
 
+
+# MODEL LOAD 
+def _ensure_whisperx_enabled():
     if not ENABLE_WHISPERX:
         raise BaseException(
             BaseErrorCode.INVALID_REQUEST,
             "WhisperX is disabled (set ENABLE_WHISPERX=1 to enable).",
         )
 
-    if whisper_model is None:
-        print(f"[WhisperX] Loading ASR model (base.en) on {device} ({compute_type})...")
+
+def _get_whisper_model(profile: str = LESSON_LANE):
+    _ensure_whisperx_enabled()
+    spec = ASR_MODEL_PROFILES.get(profile, ASR_MODEL_PROFILES[LESSON_LANE])
+
+    model = _whisper_models.get(spec)
+    if model is not None:
+        return model
+
+    with _whisper_models_lock:
+        if spec not in _whisper_models:
+            print(f"[WhisperX] Loading ASR model ({spec.name}) on {device} ({spec.compute_type}) for {profile}...")
+            with torch.no_grad():
+                _whisper_models[spec] = whisperx.load_model(
+                    spec.name,
+                    device=device,
+                    compute_type=spec.compute_type,
+                )
+            print(f"✅ [WhisperX] ASR model {spec.name} loaded successfully!")
+        return _whisper_models[spec]
+
+
+# Opt-in: load model lúc startup + chạy 1 lần inference giả để JIT/cấp phát buffer
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "0") == "1"
+
+
+def warm_up_models_sync(run_inference: bool = True, profiles: list[str] | None = None) -> dict:
+    """
+    Load ASR (theo từng workload) + align (en), tuỳ chọn chạy inference giả trên 1s audio.
+    Trả về timings (giây) cho /ready.
+    """
+    timings: dict = {}
+    profiles = profiles or list(ASR_MODEL_PROFILES.keys())
+    dummy = np.zeros(SAMPLE_RATE, dtype=np.float32)
+
+    for profile in profiles:
+        key = f"asr_{profile}"
+        started = time.perf_counter()
+        model = _get_whisper_model(profile)
+        timings[key] = {
+            "model": ASR_MODEL_PROFILES[profile].name,
+            "computeType": ASR_MODEL_PROFILES[profile].compute_type,
+            "loadSeconds": round(time.perf_counter() - started, 3),
+        }
+        if run_inference:
+            started = time.perf_counter()
+            with torch.no_grad():
+                _warm_up_decode(model, dummy)
+            timings[key]["warmupSeconds"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    align_model, metadata = _get_align_model("en")
+    timings["align_en"] = {"loadSeconds": round(time.perf_counter() - started, 3)}
+
+    if run_inference:
+        started = time.perf_counter()
         with torch.no_grad():
-            whisper_model = whisperx.load_model(
-                "base.en",
-                device=device,
-                compute_type=compute_type,
+            whisperx.align(
+                [{"text": "warm up", "start": 0.0, "end": 1.0}],
+                align_model, metadata, dummy, device,
             )
-        print("✅ [WhisperX] ASR model loaded successfully!")
+        timings["align_en"]["warmupSeconds"] = round(time.perf_counter() - started, 3)
+
+    return timings
+
+
+def _warm_up_decode(model, audio: np.ndarray) -> None:
+    """
+    Decode trực tiếp qua pipeline như `_transcribe_batch_sync` (bỏ VAD): `model.transcribe` trên
+    audio im lặng bị VAD lọc hết segment -> decoder CTranslate2 không chạy, request thật vẫn chịu cold decode.
+    """
+    decoder = model
+    if model.tokenizer is None:
+        # Model đa ngôn ngữ: tokenizer chỉ có sau detect language -> gắn tokenizer "en" trên bản sao
+        decoder = copy.copy(model)
+        decoder.tokenizer = Tokenizer(
+            model.model.hf_tokenizer, model.model.model.is_multilingual, task="transcribe", language="en",
+        )
+    list(decoder([{"inputs": audio}], batch_size=1, num_workers=0))
+
+
+# Chạy trong mỗi ASR worker process lúc khởi động: chỉ load model của lane đó + align (en)
+def warm_up_worker(lane: str) -> dict:
+    return warm_up_models_sync(run_inference=MODEL_WARMUP, profiles=[lane])
+
+
 # UNLOAD MODEL
 def unload_whisperx():
-    global whisper_model
-    whisper_model = None
+    _whisper_models.clear()
     _align_model_cache.clear()
 
     if torch.cuda.is_available():
@@ -58,8 +218,9 @@ def _get_align_model(language_code: str) -> tuple[object, dict]:
     if not language_code:
         language_code = "en"
 
-    if language_code in _align_model_cache:
-        return _align_model_cache[language_code]
+    cached = _align_model_cache.get(language_code)
+    if cached is not None:
+        return cached
 
     print(f"[WhisperX] Loading align model for language={language_code} on {device}...")
     with torch.no_grad():
@@ -67,18 +228,51 @@ def _get_align_model(language_code: str) -> tuple[object, dict]:
             language_code=language_code,
             device=device,
         )
-    _align_model_cache[language_code] = (align_model, metadata)
+    _align_model_cache.put(language_code, (align_model, metadata))
     print(f"✅ [WhisperX] Align model for {language_code} loaded & cached.")
     return align_model, metadata
 
 
 # UTILS
+# Chunk đọc từ ffmpeg khi phải decode để đếm sample (constant memory)
+_DURATION_STREAM_CHUNK = 1024 * 1024
+
+
+def _stream_decode_duration_sync(path: str) -> float:
+    """
+    Fallback khi header thiếu: decode streaming qua ffmpeg, chỉ đếm số byte PCM.
+    Không giữ sample trong RAM.
+    """
+    cmd = [
+        "ffmpeg", "-nostdin", "-v", "error",
+        "-i", path,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+        "-",
+    ]
+    total_bytes = 0
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as proc:
+        while True:
+            chunk = proc.stdout.read(_DURATION_STREAM_CHUNK)
+            if not chunk:
+                break
+            total_bytes += len(chunk)
+        if proc.wait() != 0 or total_bytes == 0:
+            raise ValueError("ffmpeg could not decode audio")
+    return total_bytes / 2 / SAMPLE_RATE
+
+
 def _get_audio_duration_sync(path: str) -> float:
     if not os.path.exists(path):
         raise BaseException(BaseErrorCode.NOT_FOUND, f"File not found: {path}")
+
+    # Chỉ đọc header (MP3/WAV/FLAC/OGG/M4A) -> vài ms, không decode
+    duration = probe_audio_duration(path)
+    if duration is not None:
+        return duration
+
+    print(f"[Audio] Header duration not available, stream decoding: {path}")
     try:
-        y, sr = librosa.load(path, sr=None)
-        return librosa.get_duration(y=y, sr=sr)
+        return _stream_decode_duration_sync(path)
     except Exception:
         raise BaseException(
             BaseErrorCode.INVALID_AUDIO_FILE,
@@ -86,13 +280,84 @@ def _get_audio_duration_sync(path: str) -> float:
         )
 
 
-def _transcribe_sync(audio_path: str):
-    _ensure_whisper_model_loaded()
+def _decode_audio_bytes_sync(data: bytes) -> np.ndarray:
+    """
+    Decode bytes upload -> waveform 16 kHz mono float32 (qua ffmpeg stdin/stdout).
+    Không ghi file tạm; waveform này dùng chung cho duration, ASR và align.
+    """
+    if not data:
+        raise BaseException(BaseErrorCode.INVALID_AUDIO_FILE, "Empty audio file")
+
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0",
+        "-i", "pipe:0",
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+        "-",
+    ]
+    try:
+        out = subprocess.run(cmd, input=data, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise BaseException(
+            BaseErrorCode.INVALID_AUDIO_FILE,
+            f"Invalid audio file: {e.stderr.decode(errors='ignore')[-200:]}",
+        )
+
+    audio = np.frombuffer(out, np.int16).flatten().astype(np.float32) / 32768.0
+    if audio.size == 0:
+        raise BaseException(BaseErrorCode.INVALID_AUDIO_FILE, "Audio file has no samples")
+    return audio
+
+
+def get_waveform_duration(audio: np.ndarray) -> float:
+    return len(audio) / SAMPLE_RATE
+
+
+def _with_prompt(model, prompt: str | None):
+    """
+    Pipeline cho 1 lần decode với `initial_prompt` (câu mong đợi).
+    Model dùng chung giữa các lane / request -> không sửa `model.options`; bản sao nông
+    có options riêng, vẫn dùng chung weights / tokenizer với model gốc.
+    """
+    if not prompt:
+        return model
+
+    options = model.options
+    decoder = copy.copy(model)
+    if is_dataclass(options):
+        decoder.options = dataclass_replace(options, initial_prompt=prompt)
+    else:
+        decoder.options = options._replace(initial_prompt=prompt)
+    return decoder
+
+
+def _text_only_result(text: str, audio: np.ndarray, language_code: str) -> dict:
+    """Kết quả không align: chỉ text + 1 segment phủ cả clip (đủ cho shadowing)."""
+    text = text.strip()
+    segments = [{"text": text, "start": 0.0, "end": round(len(audio) / SAMPLE_RATE, 3)}] if text else []
+    return {"segments": segments, "language": language_code, "text": text}
+
+
+def _transcribe_sync(
+    audio_path: str | np.ndarray,
+    profile: str = LESSON_LANE,
+    align: bool = True,
+    prompt: str | None = None,
+):
+    """
+    `audio_path` có thể là đường dẫn file hoặc waveform 16 kHz đã decode sẵn
+    (WhisperX transcribe/align đều nhận np.ndarray -> không decode lại).
+    `align=False`: bỏ qua wav2vec2 forced alignment, chỉ trả text.
+    """
+    model = _get_whisper_model(profile)
 
     with torch.no_grad():
-        result = whisper_model.transcribe(audio_path, batch_size=4)
+        result = _with_prompt(model, prompt).transcribe(audio_path, batch_size=4)
 
         language_code = result.get("language") or "en"
+        if not align:
+            text = " ".join(seg.get("text", "").strip() for seg in result.get("segments", []))
+            return {"segments": result.get("segments", []), "language": language_code, "text": text.strip()}
+
         align_model, metadata = _get_align_model(language_code)
 
         aligned = whisperx.align(
@@ -109,10 +374,330 @@ def _transcribe_sync(audio_path: str):
     return aligned
 
 
+def _align_clip_sync(text: str, audio, language_code: str) -> dict:
+    duration = round(len(audio) / SAMPLE_RATE, 3)
+    segments = [{"text": text, "start": 0.0, "end": duration}]
+    if not text.strip():
+        return {"segments": [], "language": language_code}
+
+    align_model, metadata = _get_align_model(language_code)
+    with torch.no_grad():
+        aligned = whisperx.align(segments, align_model, metadata, audio, device)
+
+    if isinstance(aligned, dict):
+        aligned.pop("word_segments", None)
+        aligned["language"] = language_code
+    return aligned
+
+
+@dataclass
+class ShadowingClip:
+    audio: np.ndarray
+    align: bool = False           # True: cần word timings -> chạy forced alignment
+    prompt: str | None = None     # câu mong đợi, dùng làm initial_prompt khi decode
+
+
+def _transcribe_batch_sync(clips: list[ShadowingClip], profile: str = SHADOWING_LANE) -> list:
+    """
+    Chạy nhiều clip ngắn qua ASR model của workload `profile` trong 1 batch.
+    Mỗi clip (<30s) là 1 input của pipeline -> bỏ qua VAD, gộp decode.
+    Clip cùng prompt decode chung 1 batch (prompt là option của cả batch, gắn vào bản sao của model).
+    Trả về list kết quả cùng thứ tự, phần tử là Exception nếu clip đó lỗi.
+    """
+    model = _get_whisper_model(profile)
+
+    results: list = [None] * len(clips)
+    groups: dict[str | None, list[int]] = {}
+
+    for i, clip in enumerate(clips):
+        # Clip dài / model đa ngôn ngữ (cần detect language) -> đi đường transcribe thường
+        if len(clip.audio) / SAMPLE_RATE > BATCH_CLIP_MAX_SECONDS or model.tokenizer is None:
+            try:
+                results[i] = _transcribe_sync(clip.audio, profile, align=clip.align, prompt=clip.prompt)
+            except Exception as e:
+                results[i] = e
+            continue
+
+        groups.setdefault(clip.prompt, []).append(i)
+
+    language_code = getattr(model, "preset_language", None) or "en"
+
+    for prompt, indexes in groups.items():
+        try:
+            with torch.no_grad():
+                outputs = list(
+                    _with_prompt(model, prompt)(
+                        ({"inputs": clips[i].audio} for i in indexes),
+                        batch_size=len(indexes),
+                        num_workers=0,
+                    )
+                )
+        except Exception as e:
+            for i in indexes:
+                results[i] = e
+            continue
+
+        for i, out in zip(indexes, outputs):
+            try:
+                text = out["text"]
+                if isinstance(text, list):
+                    text = text[0] if text else ""
+                if clips[i].align:
+                    results[i] = _align_clip_sync(text, clips[i].audio, language_code)
+                else:
+                    results[i] = _text_only_result(text, clips[i].audio, language_code)
+            except Exception as e:
+                results[i] = e
+
+    return results
+
+
+# STREAMING (LESSON)
+def _find_chunk_boundaries(audio: np.ndarray, chunk_seconds: float) -> list[tuple[int, int]]:
+    """
+    Chia waveform thành các đoạn ~chunk_seconds, điểm cắt đặt tại frame có
+    năng lượng (RMS) thấp nhất quanh mốc -> cắt vào khoảng lặng, không cắt giữa từ.
+    """
+    total = len(audio)
+    target = int(chunk_seconds * SAMPLE_RATE)
+    search = min(int(_SPLIT_SEARCH_SECONDS * SAMPLE_RATE), target // 2)
+    if target <= 0 or total <= target + search:
+        return [(0, total)]
+
+    frame = int(_VAD_FRAME_SECONDS * SAMPLE_RATE)
+    n_frames = total // frame
+    energy = np.sqrt(np.mean(audio[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+
+    bounds: list[tuple[int, int]] = []
+    start = 0
+    while total - start > target + search:
+        lo = (start + target - search) // frame
+        hi = min((start + target + search) // frame, n_frames)
+        quietest = lo + int(np.argmin(energy[lo:hi]))
+        cut = quietest * frame + frame // 2
+        bounds.append((start, cut))
+        start = cut
+
+    bounds.append((start, total))
+    return bounds
+
+
+def _shift_segments(segments: list[dict], offset: float) -> list[dict]:
+    for seg in segments:
+        for key in ("start", "end"):
+            if key in seg:
+                seg[key] = round(seg[key] + offset, 3)
+        for word in seg.get("words", []):
+            for key in ("start", "end"):
+                if key in word:
+                    word[key] = round(word[key] + offset, 3)
+    return segments
+
+
+def _transcribe_chunk_sync(audio: np.ndarray, offset: float, profile: str = LESSON_LANE) -> list[dict]:
+    result = _transcribe_sync(audio, profile)
+    return _shift_segments(result.get("segments", []), offset)
+
+
+async def transcribe_stream(audio_path: str, chunk_seconds: float = LESSON_CHUNK_SECONDS,
+                            cancel_token: CancelToken | None = None):
+    """
+    Transcribe + align từng chunk (cắt tại khoảng lặng), yield TranscribedChunkDto
+    ngay khi chunk xong -> caller publish tiến độ / xử lý tiếp sớm.
+    `cancel_token`: job bị huỷ -> dừng chunk đang chạy (kill worker của lane lesson), không gửi chunk tiếp theo.
+    """
+    _ensure_whisperx_enabled()
+    try:
+        audio = await asyncio.to_thread(whisperx.load_audio, audio_path)
+    except Exception:
+        raise BaseException(BaseErrorCode.INVALID_AUDIO_FILE, f"Invalid audio file: {audio_path}")
+
+    # Cache hit (restart, video YouTube đã xử lý...) -> bỏ qua toàn bộ ASR + align
+    cache_key = await transcription_cache.build_key(
+        audio, _cache_settings(LESSON_LANE, chunkSeconds=chunk_seconds)
+    )
+    cached = await transcription_cache.get(cache_key)
+    if cached is not None:
+        print(f"[WhisperX] Transcription cache hit for {audio_path}")
+        yield dto.TranscribedChunkDto(
+            index=0,
+            totalChunks=1,
+            start=0.0,
+            end=round(len(audio) / SAMPLE_RATE, 3),
+            segments=[dto.SegmentDto.model_validate(seg) for seg in cached["segments"]],
+        )
+        return
+
+    bounds = _find_chunk_boundaries(audio, chunk_seconds)
+    print(f"[WhisperX] Streaming transcribe {audio_path}: {len(bounds)} chunk(s)")
+
+    all_segments: list[dict] = []
+    for index, (start, end) in enumerate(bounds):
+        offset = start / SAMPLE_RATE
+        chunk_job = _run_in_lane(
+            LESSON_LANE, _transcribe_chunk_sync, audio[start:end], offset, cancel_token=cancel_token
+        )
+        segments = await (cancel_token.guard(chunk_job) if cancel_token else chunk_job)
+        all_segments.extend(segments)
+        yield dto.TranscribedChunkDto(
+            index=index,
+            totalChunks=len(bounds),
+            start=round(offset, 3),
+            end=round(end / SAMPLE_RATE, 3),
+            segments=[dto.SegmentDto.model_validate(seg) for seg in segments],
+        )
+
+    await transcription_cache.put(cache_key, {"segments": all_segments})
+
+
+# TRANSCRIPTION CACHE
+def _cache_settings(profile: str, **extra) -> dict:
+    """Những gì ảnh hưởng tới kết quả -> nằm trong cache key."""
+    spec = ASR_MODEL_PROFILES[profile]
+    return {
+        "model": spec.name,
+        "computeType": spec.compute_type,
+        "align": True,
+        "alignLanguage": "auto",
+        **extra,
+    }
+
+
+# WORKER POOL
+asr_pool = AsrWorkerPool(
+    {
+        SHADOWING_LANE: LaneConfig(ASR_POOL_SHADOWING_WORKERS, ASR_POOL_SHADOWING_TIMEOUT),
+        LESSON_LANE: LaneConfig(ASR_POOL_LESSON_WORKERS, ASR_POOL_LESSON_TIMEOUT),
+    },
+    initializer=f"{__name__}:warm_up_worker",
+)
+
+
+def start_asr_pool():
+    if ENABLE_WHISPERX:
+        asr_pool.start()
+
+
+def asr_runs_in_process() -> bool:
+    """True nếu có lane chạy in-process (không có worker) -> model nằm ở process chính."""
+    return not (asr_pool.is_running(SHADOWING_LANE) and asr_pool.is_running(LESSON_LANE))
+
+
+async def _run_in_lane(lane: str, fn, *args, cancel_token: CancelToken | None = None):
+    """
+    Gửi job sang worker process của lane; pool chưa chạy -> thread in-process.
+    `cancel_token`: job bị huỷ -> pool kill worker đang chạy (thread in-process thì chỉ bỏ kết quả).
+    """
+    if asr_pool.is_running(lane):
+        return await asr_pool.submit(lane, f"{__name__}:{fn.__name__}", *args, cancel_token=cancel_token)
+    return await asyncio.to_thread(fn, *args)
+
+
+async def _run_shadowing_batch(clips: list[ShadowingClip]) -> list:
+    return await _run_in_lane(SHADOWING_LANE, _transcribe_batch_sync, clips)
+
+
+shadowing_batcher = TranscriptionBatcher(
+    _run_shadowing_batch,
+    window_ms=ASR_BATCH_WINDOW_MS,
+    max_batch_size=ASR_BATCH_MAX_SIZE,
+    name="shadowing",
+    # Mỗi batch chiếm 1 worker của lane shadowing -> chạy song song tối đa bằng số worker
+    max_concurrency=ASR_POOL_SHADOWING_WORKERS,
+)
+
+
 
 async def get_audio_duration(path: str) -> float:
     return await asyncio.to_thread(_get_audio_duration_sync, path)
 
 
-async def transcribe(audio_path: str):
-    return await asyncio.to_thread(_transcribe_sync, audio_path)
+async def decode_audio_bytes(data: bytes) -> np.ndarray:
+    return await asyncio.to_thread(_decode_audio_bytes_sync, data)
+
+
+async def transcribe(audio_path: str | np.ndarray, profile: str = LESSON_LANE):
+    lane = SHADOWING_LANE if profile == SHADOWING_LANE else LESSON_LANE
+    if not isinstance(audio_path, np.ndarray):
+        return await _run_in_lane(lane, _transcribe_sync, audio_path, profile)
+
+    cache_key = await transcription_cache.build_key(audio_path, _cache_settings(profile, mode="full"))
+    cached = await transcription_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    result = await _run_in_lane(lane, _transcribe_sync, audio_path, profile)
+    await transcription_cache.put(cache_key, result)
+    return result
+
+
+# Shadowing: cache theo nội dung -> micro-batching queue
+async def transcribe_batched(
+    audio: np.ndarray,
+    word_timings: bool = False,
+    prompt: str | None = None,
+    use_cache: bool = True,
+):
+    """
+    Mặc định (fast mode): chỉ text, không forced alignment.
+    `word_timings=True`: chạy align để có timestamps từng từ.
+    `prompt`: câu mong đợi làm gợi ý decode (clip ngắn decode nhanh + đúng hơn).
+    `use_cache=False`: kết quả tạm (vd: streaming) không cần ghi cache.
+    """
+    clip = ShadowingClip(audio=audio, align=word_timings, prompt=prompt)
+    if not use_cache:
+        return await shadowing_batcher.submit(clip)
+
+    cache_key = await transcription_cache.build_key(
+        audio, _cache_settings(SHADOWING_LANE, mode="batched", align=word_timings, prompt=prompt)
+    )
+    cached = await transcription_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    result = await shadowing_batcher.submit(clip)
+    await transcription_cache.put(cache_key, result)
+    return result
+
+
+async def transcribe_shadowing_batch(clips: list[ShadowingClip]) -> list:
+    """
+    Batch endpoint: tra cache từng clip, phần còn lại decode chung 1 batch
+    (không qua cửa sổ của micro-batcher). Trả về list kết quả | Exception.
+    """
+    keys = await asyncio.gather(*[
+        transcription_cache.build_key(
+            clip.audio, _cache_settings(SHADOWING_LANE, mode="batched", align=clip.align, prompt=clip.prompt)
+        )
+        for clip in clips
+    ])
+    results: list = list(await asyncio.gather(*[transcription_cache.get(key) for key in keys]))
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    if not missing:
+        return results
+
+    try:
+        outputs = await _run_shadowing_batch([clips[i] for i in missing])
+    except Exception as e:
+        outputs = [e] * len(missing)
+
+    for i, output in zip(missing, outputs):
+        results[i] = output
+        if not isinstance(output, Exception):
+            await transcription_cache.put(keys[i], output)
+    return results
+
+
+def get_batcher_metrics() -> dict:
+    return {
+        "batcher": shadowing_batcher.get_metrics(),
+        "models": {
+            profile: {"model": spec.name, "computeType": spec.compute_type, "device": device}
+            for profile, spec in ASR_MODEL_PROFILES.items()
+        },
+        "workerPool": asr_pool.get_metrics(),
+        # Cache của process chính (worker process giữ cache riêng)
+        "alignCache": _align_model_cache.get_stats(),
+        "transcriptionCache": transcription_cache.get_stats(),
+    }
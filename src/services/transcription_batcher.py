@@ -0,0 +1,173 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, List
+
+
+# Hàm chạy 1 batch: nhận list input, trả về list kết quả cùng thứ tự.
+# Phần tử là Exception nếu riêng item đó lỗi.
+# - SYNC: chạy trong thread pool
+# - ASYNC (coroutine function): await trực tiếp (vd: gửi sang ASR worker process)
+BatchRunner = Callable[[List[Any]], List[Any] | Awaitable[List[Any]]]
+
+
+class TranscriptionBatcher:
+    """
+    Micro-batching scheduler đặt trước ASR model.
+
+    - Gom các request đến trong cửa sổ `window_ms` (tối đa `max_batch_size`).
+    - Chạy cả batch qua model 1 lần (thread pool hoặc ASR worker process).
+    - Tối đa `max_concurrency` batch chạy cùng lúc (= số ASR worker của lane); hết slot thì
+      request tiếp tục dồn trong queue -> batch sau to hơn.
+    - Trả kết quả riêng cho từng caller qua Future.
+    """
+
+    def __init__(self, run_batch: BatchRunner, window_ms: int, max_batch_size: int, name: str = "asr",
+                 max_concurrency: int = 1):
+        self.name = name
+        self.window_s = max(window_ms, 0) / 1000.0
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_concurrency = max(max_concurrency, 1)
+        self._run_batch = run_batch
+
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._running: set[asyncio.Task] = set()
+
+        # Metrics
+        self._submitted = 0
+        self._batches = 0
+        self._items_processed = 0
+        self._failed_items = 0
+        self._last_batch_size = 0
+        self._max_batch_size_seen = 0
+        self._last_batch_seconds = 0.0
+
+    # PUBLIC API
+    async def submit(self, item: Any) -> Any:
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._submitted += 1
+        await self._queue.put((item, future))
+        return await future
+
+    def get_metrics(self) -> dict:
+        return {
+            "name": self.name,
+            "queueDepth": self._queue.qsize() if self._queue else 0,
+            "windowMs": int(self.window_s * 1000),
+            "maxBatchSize": self.max_batch_size,
+            "maxConcurrency": self.max_concurrency,
+            "runningBatches": len(self._running),
+            "submitted": self._submitted,
+            "batches": self._batches,
+            "itemsProcessed": self._items_processed,
+            "failedItems": self._failed_items,
+            "lastBatchSize": self._last_batch_size,
+            "maxBatchSizeSeen": self._max_batch_size_seen,
+            "avgBatchSize": round(self._items_processed / self._batches, 2) if self._batches else 0.0,
+            "lastBatchSeconds": round(self._last_batch_seconds, 3),
+        }
+
+    async def stop(self) -> None:
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        # Batch đang chạy: huỷ task -> future của caller bị huỷ trong _execute
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+
+        # Huỷ các request còn đợi trong queue
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.cancel()
+
+    # INTERNAL
+    def _ensure_started(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+            print(f"[Batcher:{self.name}] started window={int(self.window_s * 1000)}ms "
+                  f"max_batch={self.max_batch_size} concurrency={self.max_concurrency}")
+
+    async def _collect_batch(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window_s
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Lấy thêm các item đã nằm sẵn trong queue (không đợi)
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            # Đợi slot trước khi gom: đang đủ batch chạy thì request dồn lại cho batch sau
+            await self._slots.acquire()
+            try:
+                batch = await self._collect_batch()
+            except BaseException:
+                self._slots.release()
+                raise
+
+            # Bỏ qua caller đã huỷ (client disconnect, timeout...)
+            batch = [(item, fut) for item, fut in batch if not fut.cancelled()]
+            if not batch:
+                self._slots.release()
+                continue
+
+            task = asyncio.create_task(self._execute(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _execute(self, batch: list) -> None:
+        items = [item for item, _ in batch]
+        started = time.perf_counter()
+        try:
+            try:
+                if asyncio.iscoroutinefunction(self._run_batch):
+                    results = await self._run_batch(items)
+                else:
+                    results = await asyncio.to_thread(self._run_batch, items)
+            except asyncio.CancelledError:
+                for _, future in batch:
+                    future.cancel()
+                raise
+            except Exception as e:
+                results = [e] * len(items)
+        finally:
+            self._slots.release()
+
+        self._batches += 1
+        self._items_processed += len(items)
+        self._last_batch_size = len(items)
+        self._max_batch_size_seen = max(self._max_batch_size_seen, len(items))
+        self._last_batch_seconds = time.perf_counter() - started
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                self._failed_items += 1
+                future.set_exception(result)
+            else:
+                future.set_result(result)
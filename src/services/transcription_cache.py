@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import os
+import time
+
+import numpy as np
+import orjson
+
+from src.redis.redis_client import redis_client
+from src.utils.lru_cache import LRUCache
+from src.utils.orjson_utils import dumps_numpy
+
+# =========================
+# CONFIG
+# =========================
+TRANSCRIPTION_CACHE_ENABLED = os.getenv("TRANSCRIPTION_CACHE_ENABLED", "1") == "1"
+
+# Tier 1: disk local (LRU theo dung lượng)
+TRANSCRIPTION_CACHE_DIR = os.getenv("TRANSCRIPTION_CACHE_DIR", "src/temp/transcription_cache")
+TRANSCRIPTION_CACHE_DISK_MAX_MB = int(os.getenv("TRANSCRIPTION_CACHE_DISK_MAX_MB", "512"))
+
+# Tier 2: Redis (dùng chung giữa các instance), TTL + giới hạn số entry + size mỗi entry
+TRANSCRIPTION_CACHE_REDIS_TTL = int(os.getenv("TRANSCRIPTION_CACHE_REDIS_TTL", str(7 * 24 * 3600)))
+TRANSCRIPTION_CACHE_REDIS_MAX_ENTRIES = int(os.getenv("TRANSCRIPTION_CACHE_REDIS_MAX_ENTRIES", "5000"))
+TRANSCRIPTION_CACHE_REDIS_MAX_ENTRY_KB = int(os.getenv("TRANSCRIPTION_CACHE_REDIS_MAX_ENTRY_KB", "1024"))
+
+_REDIS_KEY_PREFIX = "transcription:"
+_REDIS_INDEX_KEY = "transcription:index"  # sorted set: key -> thời điểm ghi (để trim)
+
+# Tăng khi format kết quả thay đổi -> cache cũ tự vô hiệu
+_CACHE_SCHEMA_VERSION = 1
+
+
+# KEY
+def _hash_audio_sync(audio: np.ndarray, settings: dict) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    h.update(np.ascontiguousarray(audio, dtype=np.float32).tobytes())
+    h.update(orjson.dumps({**settings, "v": _CACHE_SCHEMA_VERSION}, option=orjson.OPT_SORT_KEYS))
+    return h.hexdigest()
+
+
+async def build_key(audio: np.ndarray, settings: dict) -> str:
+    """Key = hash(waveform đã decode + model + cấu hình alignment)."""
+    return await asyncio.to_thread(_hash_audio_sync, audio, settings)
+
+
+# DISK TIER
+def _disk_path(key: str) -> str:
+    return os.path.join(TRANSCRIPTION_CACHE_DIR, f"{key}.json")
+
+
+def _remove_disk_entry(key: str, _size: int) -> None:
+    try:
+        os.remove(_disk_path(key))
+    except OSError:
+        pass
+
+
+# value = size file (bytes) -> LRUCache quản lý budget, on_evict xoá file
+_disk_index = LRUCache(
+    max_size=TRANSCRIPTION_CACHE_DISK_MAX_MB * 1024 * 1024,
+    size_fn=lambda size: size,
+    on_evict=_remove_disk_entry,
+    name="transcription_disk",
+)
+_disk_index_loaded = False
+
+
+def _load_disk_index_sync() -> None:
+    global _disk_index_loaded
+    if _disk_index_loaded:
+        return
+    os.makedirs(TRANSCRIPTION_CACHE_DIR, exist_ok=True)
+
+    entries = []
+    for name in os.listdir(TRANSCRIPTION_CACHE_DIR):
+        if not name.endswith(".json"):
+            continue
+        stat = os.stat(os.path.join(TRANSCRIPTION_CACHE_DIR, name))
+        entries.append((stat.st_mtime, name[:-5], stat.st_size))
+
+    # Cũ trước -> mới sau (thứ tự LRU)
+    for _, key, size in sorted(entries):
+        _disk_index.put(key, size)
+    _disk_index_loaded = True
+
+
+def _disk_get_sync(key: str):
+    _load_disk_index_sync()
+    if _disk_index.get(key) is None:
+        return None
+    path = _disk_path(key)
+    try:
+        with open(path, "rb") as f:
+            value = orjson.loads(f.read())
+        os.utime(path)  # giữ thứ tự LRU sau restart
+        return value
+    except (OSError, orjson.JSONDecodeError):
+        _disk_index.pop(key)
+        return None
+
+
+def _disk_put_sync(key: str, payload: bytes) -> None:
+    _load_disk_index_sync()
+    path = _disk_path(key)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+    _disk_index.put(key, len(payload))
+
+
+# REDIS TIER
+async def _redis_get(key: str):
+    raw = await redis_client.get(f"{_REDIS_KEY_PREFIX}{key}")
+    return orjson.loads(raw) if raw else None
+
+
+async def _redis_put(key: str, payload: bytes) -> None:
+    if len(payload) > TRANSCRIPTION_CACHE_REDIS_MAX_ENTRY_KB * 1024:
+        return
+
+    pipe = redis_client.pipeline()
+    pipe.set(f"{_REDIS_KEY_PREFIX}{key}", payload.decode("utf-8"), ex=TRANSCRIPTION_CACHE_REDIS_TTL)
+    pipe.zadd(_REDIS_INDEX_KEY, {key: time.time()})
+    await pipe.execute()
+
+    # Vượt số entry -> xoá các entry cũ nhất
+    overflow = await redis_client.zcard(_REDIS_INDEX_KEY) - TRANSCRIPTION_CACHE_REDIS_MAX_ENTRIES
+    if overflow > 0:
+        oldest = await redis_client.zpopmin(_REDIS_INDEX_KEY, overflow)
+        if oldest:
+            await redis_client.delete(*[f"{_REDIS_KEY_PREFIX}{k}" for k, _ in oldest])
+
+
+# PUBLIC API
+_stats = {"diskHits": 0, "redisHits": 0, "misses": 0, "writes": 0, "errors": 0}
+
+
+async def get(key: str):
+    if not TRANSCRIPTION_CACHE_ENABLED:
+        return None
+
+    value = await asyncio.to_thread(_disk_get_sync, key)
+    if value is not None:
+        _stats["diskHits"] += 1
+        return value
+
+    try:
+        value = await _redis_get(key)
+    except Exception as e:
+        _stats["errors"] += 1
+        print(f"[TranscriptionCache] Redis get failed: {e}")
+        value = None
+
+    if value is None:
+        _stats["misses"] += 1
+        return None
+
+    _stats["redisHits"] += 1
+    # Kéo về disk để lần sau khỏi đi mạng
+    try:
+        await asyncio.to_thread(_disk_put_sync, key, dumps_numpy(value))
+    except OSError as e:
+        print(f"[TranscriptionCache] Disk backfill failed: {e}")
+    return value
+
+
+async def put(key: str, value) -> None:
+    if not TRANSCRIPTION_CACHE_ENABLED:
+        return
+
+    payload = dumps_numpy(value)
+    try:
+        await asyncio.to_thread(_disk_put_sync, key, payload)
+        await _redis_put(key, payload)
+        _stats["writes"] += 1
+    except Exception as e:
+        _stats["errors"] += 1
+        print(f"[TranscriptionCache] Write failed: {e}")
+
+
+def get_stats() -> dict:
+    return {
+        "enabled": TRANSCRIPTION_CACHE_ENABLED,
+        **_stats,
+        "disk": _disk_index.get_stats(),
+    }
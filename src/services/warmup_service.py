@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+from src.services import speech_to_text_service, spaCy_service
+
+# Trạng thái từng model cho /ready
+# status: PENDING | LOADING | READY | FAILED
+_model_states: dict[str, dict] = {}
+_warmup_started = False
+
+
+def _set_state(name: str, status: str, **extra) -> None:
+    _model_states[name] = {"status": status, **extra}
+
+
+async def _warm_up(name: str, fn, *args) -> None:
+    _set_state(name, "LOADING")
+    started = time.perf_counter()
+    try:
+        timings = await asyncio.to_thread(fn, *args)
+        _set_state(name, "READY", totalSeconds=round(time.perf_counter() - started, 3), timings=timings)
+        print(f"✅ [Warm-up] {name} ready in {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        _set_state(name, "FAILED", error=str(e))
+        print(f"❌ [Warm-up] {name} failed: {e}")
+
+
+async def warm_up_models() -> None:
+    """
+    Opt-in (MODEL_WARMUP=1): load ASR, align (en), spaCy + chạy inference giả.
+    ASR chạy trong worker process thì worker tự warm-up khi start (xem asr_worker_pool).
+    """
+    global _warmup_started
+    if not speech_to_text_service.MODEL_WARMUP:
+        return
+    _warmup_started = True
+
+    jobs = {"spacy": spaCy_service.warm_up_spacy_sync}
+    if speech_to_text_service.ENABLE_WHISPERX and speech_to_text_service.asr_runs_in_process():
+        jobs["whisperx"] = speech_to_text_service.warm_up_models_sync
+
+    for name in jobs:
+        _set_state(name, "PENDING")
+    await asyncio.gather(*[_warm_up(name, fn) for name, fn in jobs.items()])
+
+
+def get_readiness() -> dict:
+    """
+    ready = True khi mọi model (và mọi ASR worker) đã load + warm-up xong.
+    Không bật MODEL_WARMUP -> model load lazy, luôn ready (giữ hành vi cũ).
+    """
+    workers = speech_to_text_service.asr_pool.get_readiness()
+    workers_ready = all(lane["ready"] for lane in workers.values())
+
+    if not _warmup_started:
+        return {"ready": True, "warmup": "DISABLED", "models": {}, "asrWorkers": workers}
+
+    models_ready = all(state["status"] == "READY" for state in _model_states.values())
+    return {
+        "ready": models_ready and workers_ready,
+        "warmup": "ENABLED",
+        "models": _model_states,
+        "asrWorkers": workers,
+    }
@@ -0,0 +1,310 @@
+# src/utils/audio_probe.py
+"""
+Đọc duration audio chỉ từ header container/stream (không decode sample).
+
+Hỗ trợ: WAV, FLAC, OGG (Vorbis/Opus), MP3 (Xing/Info/VBRI hoặc CBR), MP4/M4A.
+Mỗi hàm chỉ đọc vài KB đầu/cuối file -> constant memory, trả về trong vài ms.
+Trả về None nếu không đọc được header (caller tự fallback sang decode).
+"""
+import os
+import struct
+from typing import BinaryIO, Optional
+
+# Đọc tối đa bấy nhiêu byte để tìm frame MP3 đầu tiên / page OGG cuối cùng
+_SCAN_BYTES = 64 * 1024
+
+# Số frame MP3 liền nhau phải hợp lệ: frame ngay đầu data / frame tìm thấy sau khi dò qua byte rác
+_MP3_CHAIN_AT_START = 2
+_MP3_CHAIN_SCANNED = 3
+
+# EBML (WebM / Matroska): không có duration ở header cố định -> để caller decode
+_EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+
+
+# WAV
+def _probe_wav(f: BinaryIO, file_size: int) -> Optional[float]:
+    f.seek(12)
+    byte_rate = None
+
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        chunk_id, chunk_size = struct.unpack("<4sI", header)
+
+        if chunk_id == b"fmt ":
+            fmt = f.read(chunk_size)
+            if len(fmt) < 16:
+                return None
+            byte_rate = struct.unpack("<I", fmt[8:12])[0]
+        elif chunk_id == b"data":
+            if not byte_rate:
+                return None
+            data_start = f.tell()
+            # WAV stream (ffmpeg pipe...) hay ghi size = 0 / 0xFFFFFFFF
+            if chunk_size in (0, 0xFFFFFFFF) or data_start + chunk_size > file_size:
+                chunk_size = file_size - data_start
+            return chunk_size / byte_rate
+        else:
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+
+# FLAC
+def _probe_flac(f: BinaryIO, offset: int) -> Optional[float]:
+    f.seek(offset + 4)
+    block_header = f.read(4)
+    if len(block_header) < 4 or (block_header[0] & 0x7F) != 0:  # STREAMINFO phải là block đầu
+        return None
+
+    info = f.read(34)
+    if len(info) < 34:
+        return None
+
+    packed = int.from_bytes(info[10:18], "big")
+    sample_rate = packed >> 44
+    total_samples = packed & ((1 << 36) - 1)
+    if not sample_rate or not total_samples:
+        return None
+    return total_samples / sample_rate
+
+
+# OGG (Vorbis / Opus)
+def _probe_ogg(f: BinaryIO, file_size: int) -> Optional[float]:
+    f.seek(0)
+    page = f.read(_SCAN_BYTES)
+    if len(page) < 28:
+        return None
+
+    n_segments = page[26]
+    packet = page[27 + n_segments:]
+
+    pre_skip = 0
+    if packet.startswith(b"\x01vorbis") and len(packet) >= 16:
+        sample_rate = struct.unpack("<I", packet[12:16])[0]
+    elif packet.startswith(b"OpusHead") and len(packet) >= 12:
+        # Granule của Opus luôn tính theo 48 kHz
+        pre_skip = struct.unpack("<H", packet[10:12])[0]
+        sample_rate = 48000
+    else:
+        return None
+    if not sample_rate:
+        return None
+
+    # Granule position của page cuối = tổng số sample
+    tail_size = min(file_size, _SCAN_BYTES)
+    f.seek(file_size - tail_size)
+    tail = f.read(tail_size)
+    last = tail.rfind(b"OggS")
+    if last < 0 or last + 14 > len(tail):
+        return None
+
+    granule = struct.unpack("<q", tail[last + 6:last + 14])[0]
+    if granule <= 0:
+        return None
+    return max(granule - pre_skip, 0) / sample_rate
+
+
+# MP3
+_MP3_BITRATES = {
+    # (mpeg1?, layer) -> kbps theo index 0..15
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448, 0],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384, 0],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256, 0],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0],
+}
+_MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG 1
+    2: [22050, 24000, 16000],  # MPEG 2
+    0: [11025, 12000, 8000],   # MPEG 2.5
+}
+
+
+def _parse_mp3_frame_header(h: int) -> Optional[dict]:
+    if (h >> 21) & 0x7FF != 0x7FF:
+        return None
+    version = (h >> 19) & 0x3
+    layer_bits = (h >> 17) & 0x3
+    bitrate_idx = (h >> 12) & 0xF
+    sr_idx = (h >> 10) & 0x3
+    if version == 1 or layer_bits == 0 or bitrate_idx in (0, 15) or sr_idx == 3:
+        return None
+
+    mpeg1 = version == 3
+    layer = 4 - layer_bits
+    bitrate = _MP3_BITRATES[(mpeg1, layer)][bitrate_idx] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][sr_idx]
+    padding = (h >> 9) & 0x1
+    mono = ((h >> 6) & 0x3) == 3
+
+    if layer == 1:
+        samples_per_frame = 384
+        frame_len = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples_per_frame = 1152 if (layer == 2 or mpeg1) else 576
+        frame_len = samples_per_frame // 8 * bitrate // sample_rate + padding
+
+    return {
+        "mpeg1": mpeg1,
+        "layer": layer,
+        "bitrate": bitrate,
+        "sample_rate": sample_rate,
+        "samples_per_frame": samples_per_frame,
+        "frame_len": frame_len,
+        "mono": mono,
+    }
+
+
+def _mp3_frame_chain(buf: bytes, pos: int, frames: int, eof: bool) -> Optional[dict]:
+    """
+    Header frame tại `pos` nếu `frames` frame liền nhau đều hợp lệ và cùng version/layer/sample rate
+    (1 header lẻ rất dễ là byte ngẫu nhiên). Chuỗi chạm đúng cuối file (`eof`) cũng tính là đủ.
+    """
+    first = None
+    for _ in range(frames):
+        if pos + 4 > len(buf):
+            return first if eof and pos == len(buf) else None
+        frame = _parse_mp3_frame_header(struct.unpack(">I", buf[pos:pos + 4])[0])
+        if not frame or frame["frame_len"] <= 0:
+            return None
+        if first is None:
+            first = frame
+        elif (frame["mpeg1"], frame["layer"], frame["sample_rate"]) != (
+                first["mpeg1"], first["layer"], first["sample_rate"]):
+            return None
+        pos += frame["frame_len"]
+    return first
+
+
+def _probe_mp3(f: BinaryIO, offset: int, file_size: int) -> Optional[float]:
+    f.seek(offset)
+    buf = f.read(_SCAN_BYTES)
+    eof = offset + len(buf) >= file_size
+
+    # File MP3 chuẩn: frame nằm ngay sau ID3v2. Có byte rác phía trước -> dò sync, đòi chuỗi dài hơn
+    frame_pos, frame = 0, _mp3_frame_chain(buf, 0, _MP3_CHAIN_AT_START, eof)
+    if frame is None:
+        for i in range(1, len(buf) - 4):
+            if buf[i] != 0xFF or (buf[i + 1] & 0xE0) != 0xE0:
+                continue
+            frame = _mp3_frame_chain(buf, i, _MP3_CHAIN_SCANNED, eof)
+            if frame is not None:
+                frame_pos = i
+                break
+
+    if frame is None:
+        return None
+
+    # Xing / Info (VBR hoặc LAME CBR): nằm sau side info
+    if frame["mpeg1"]:
+        side_info = 17 if frame["mono"] else 32
+    else:
+        side_info = 9 if frame["mono"] else 17
+    xing_pos = frame_pos + 4 + side_info
+    tag = buf[xing_pos:xing_pos + 4]
+    if tag in (b"Xing", b"Info") and len(buf) >= xing_pos + 12:
+        flags = struct.unpack(">I", buf[xing_pos + 4:xing_pos + 8])[0]
+        if flags & 0x1:
+            frames = struct.unpack(">I", buf[xing_pos + 8:xing_pos + 12])[0]
+            if frames:
+                return frames * frame["samples_per_frame"] / frame["sample_rate"]
+
+    # VBRI (Fraunhofer): cố định 32 byte sau header
+    vbri_pos = frame_pos + 4 + 32
+    if buf[vbri_pos:vbri_pos + 4] == b"VBRI" and len(buf) >= vbri_pos + 18:
+        frames = struct.unpack(">I", buf[vbri_pos + 14:vbri_pos + 18])[0]
+        if frames:
+            return frames * frame["samples_per_frame"] / frame["sample_rate"]
+
+    # CBR: ước lượng theo dung lượng audio / bitrate
+    audio_bytes = file_size - (offset + frame_pos)
+    f.seek(max(file_size - 128, 0))
+    if f.read(3) == b"TAG":  # ID3v1
+        audio_bytes -= 128
+    if audio_bytes <= 0:
+        return None
+    return audio_bytes * 8 / frame["bitrate"]
+
+
+# MP4 / M4A
+def _iter_boxes(f: BinaryIO, start: int, end: int):
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        header_len = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header_len = 16
+        elif size == 0:
+            size = end - pos
+        if size < header_len:
+            return
+        yield box_type, pos + header_len, pos + size
+        pos += size
+
+
+def _probe_mp4(f: BinaryIO, file_size: int) -> Optional[float]:
+    for box_type, body_start, body_end in _iter_boxes(f, 0, file_size):
+        if box_type != b"moov":
+            continue
+        for child_type, child_start, _ in _iter_boxes(f, body_start, body_end):
+            if child_type != b"mvhd":
+                continue
+            f.seek(child_start)
+            version = f.read(1)[0]
+            f.seek(3, os.SEEK_CUR)  # flags
+            if version == 1:
+                _, _, timescale, duration = struct.unpack(">QQIQ", f.read(28))
+            else:
+                _, _, timescale, duration = struct.unpack(">IIII", f.read(16))
+            if not timescale or duration in (0, 0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+                return None
+            return duration / timescale
+        return None
+    return None
+
+
+def _skip_id3v2(f: BinaryIO) -> int:
+    f.seek(0)
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+# PUBLIC
+def probe_audio_duration(path: str) -> Optional[float]:
+    """
+    Đọc duration (giây) từ header. Trả về None nếu format không hỗ trợ
+    hoặc header thiếu thông tin (vd: WebM, MP3 hỏng header).
+    """
+    try:
+        file_size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            magic = f.read(12)
+            if len(magic) < 12:
+                return None
+
+            if magic[:4] == b"RIFF" and magic[8:12] == b"WAVE":
+                return _probe_wav(f, file_size)
+            if magic[:4] == b"OggS":
+                return _probe_ogg(f, file_size)
+            if magic[4:8] == b"ftyp":
+                return _probe_mp4(f, file_size)
+            if magic[:4] == _EBML_MAGIC:
+                return None
+
+            offset = _skip_id3v2(f)
+            f.seek(offset)
+            if f.read(4) == b"fLaC":
+                return _probe_flac(f, offset)
+            return _probe_mp3(f, offset, file_size)
+    except (OSError, struct.error, IndexError, ValueError, ZeroDivisionError):
+        return None
@@ -0,0 +1,51 @@
+# src/utils/compact_response.py
+"""
+Response compact (opt-in): dữ liệu dạng cột, serialize bằng orjson, gzip khi đủ lớn.
+
+Client chọn bằng header `Accept: application/vnd.compact+json` hoặc query `?format=compact`.
+Không chọn -> endpoint trả JSON như cũ qua response_model.
+"""
+import asyncio
+import gzip
+import os
+from typing import Optional
+
+from fastapi import Request, Response
+
+from src.utils.orjson_utils import dumps_numpy
+
+COMPACT_MEDIA_TYPE = "application/vnd.compact+json"
+COMPACT_FORMAT = "compact"
+
+# Body nhỏ hơn ngưỡng này thì gzip không đáng (header + CPU)
+COMPACT_GZIP_MIN_BYTES = int(os.getenv("COMPACT_GZIP_MIN_BYTES", "1024"))
+COMPACT_GZIP_LEVEL = int(os.getenv("COMPACT_GZIP_LEVEL", "5"))
+
+# Body lớn (transcript cả lesson) -> nén trong thread, không chặn event loop
+_GZIP_IN_THREAD_BYTES = 64 * 1024
+
+
+def wants_compact(request: Request, format: Optional[str] = None) -> bool:
+    if format == COMPACT_FORMAT:
+        return True
+    return COMPACT_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+async def compact_response(request: Request, data, message: str = "Success") -> Response:
+    """Bọc giống ApiResponse.success (code/message/result) nhưng bỏ qua pydantic."""
+    body = dumps_numpy({"code": 200, "message": message, "result": data})
+    headers = {"Vary": "Accept, Accept-Encoding"}
+
+    if len(body) >= COMPACT_GZIP_MIN_BYTES and "gzip" in request.headers.get("accept-encoding", ""):
+        if len(body) >= _GZIP_IN_THREAD_BYTES:
+            body = await asyncio.to_thread(gzip.compress, body, COMPACT_GZIP_LEVEL)
+        else:
+            body = gzip.compress(body, compresslevel=COMPACT_GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+
+    return Response(content=body, media_type=COMPACT_MEDIA_TYPE, headers=headers)
+
+
+def columns(rows: list[dict], fields: dict[str, str], default=None) -> dict[str, list]:
+    """[{word, start, ...}, ...] -> {"text": [...], "start": [...]}; fields: tên cột -> key trong dict."""
+    return {column: [row.get(key, default) for row in rows] for column, key in fields.items()}
@@ -0,0 +1,131 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Optional
+
+
+class LRUCache:
+    """
+    LRU cache có giới hạn số entry và/hoặc tổng size (đơn vị do `size_fn` quyết định).
+
+    - Key pinned không bao giờ bị evict.
+    - `on_evict(key, value)` được gọi khi 1 entry bị đẩy ra (giải phóng tài nguyên).
+    - Thread-safe (dùng chung giữa event loop và asyncio.to_thread).
+    - 0 = không giới hạn.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 0,
+        max_size: int = 0,
+        size_fn: Optional[Callable[[Any], int]] = None,
+        pinned: Iterable[Hashable] = (),
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+        name: str = "cache",
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self._size_fn = size_fn or (lambda _: 1)
+        self._on_evict = on_evict
+        self._pinned = set(pinned)
+
+        self._data: "OrderedDict[Hashable, tuple[Any, int]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self._size_fn(value)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._data[key] = (value, size)
+            self._size += size
+            self._evict_if_needed()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            self._size -= entry[1]
+            return entry[0]
+
+    def pin(self, key: Hashable) -> None:
+        with self._lock:
+            self._pinned.add(key)
+
+    def unpin(self, key: Hashable) -> None:
+        with self._lock:
+            self._pinned.discard(key)
+            self._evict_if_needed()
+
+    def clear(self) -> None:
+        with self._lock:
+            items = list(self._data.items())
+            self._data.clear()
+            self._size = 0
+        if self._on_evict:
+            for key, (value, _) in items:
+                self._on_evict(key, value)
+
+    def keys(self) -> list:
+        with self._lock:
+            return list(self._data.keys())
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "entries": len(self._data),
+                "size": self._size,
+                "maxEntries": self.max_entries,
+                "maxSize": self.max_size,
+                "pinned": sorted(str(k) for k in self._pinned),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _over_budget(self) -> bool:
+        if self.max_entries and len(self._data) > self.max_entries:
+            return True
+        if self.max_size and self._size > self.max_size:
+            return True
+        return False
+
+    def _evict_if_needed(self) -> None:
+        while self._over_budget():
+            victim = next((k for k in self._data if k not in self._pinned), None)
+            if victim is None:
+                return  # chỉ còn entry pinned
+            value, size = self._data.pop(victim)
+            self._size -= size
+            self.evictions += 1
+            if self._on_evict:
+                self._on_evict(victim, value)
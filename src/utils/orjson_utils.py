@@ -0,0 +1,14 @@
+# src/utils/orjson_utils.py
+"""orjson dùng chung: serialize kết quả có numpy (array + scalar) thành JSON bytes."""
+import orjson
+
+
+def orjson_default(obj):
+    # numpy scalar (điểm align, timestamps...) -> python scalar
+    if hasattr(obj, "item"):
+        return obj.item()
+    raise TypeError
+
+
+def dumps_numpy(value) -> bytes:
+    return orjson.dumps(value, default=orjson_default, option=orjson.OPT_SERIALIZE_NUMPY)
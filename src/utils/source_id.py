@@ -0,0 +1,21 @@
+# src/utils/source_id.py
+"""Id ổn định cho nguồn audio: cùng video / cùng URL -> cùng id (cache file, single-flight)."""
+import hashlib
+import re
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
+
+_YOUTUBE_ID = re.compile(r"(?:v=|youtu\.be/|/shorts/|/embed/|/live/)([A-Za-z0-9_-]{11})")
+
+
+def youtube_video_id(url: str | None) -> Optional[str]:
+    """watch?v=, youtu.be/, shorts/, embed/, live/ -> video id (11 ký tự)."""
+    match = _YOUTUBE_ID.search(url or "")
+    return match.group(1) if match else None
+
+
+def url_source_id(url: str) -> str:
+    """Hash URL đã chuẩn hoá (scheme/host thường, bỏ fragment)."""
+    parts = urlsplit(url.strip())
+    normalized = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, parts.query, ""))
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:20]
@@ -0,0 +1,329 @@
+# src/utils/word_alignment.py
+"""
+Global alignment (edit distance) giữa 2 dãy token, dùng cho chấm shadowing.
+
+- Cost: khớp = 0, thêm/bớt 1 token = 1, thay thế = `sub_cost(a, b)` trong (0, 1].
+- Đường mặc định: DP thuần Python với ngưỡng cắt (Ukkonen): bỏ ô có D[i][j] + |skew - (j - i)| > ngưỡng
+  (đi tiếp tới đích cần thêm ít nhất chừng đó lần thêm/bớt) -> chỉ tính dải hẹp quanh đường đi tốt,
+  dải co lại khi lỗi tích luỹ. Ngưỡng = cost của 1 alignment tham lam (cận trên) nên chạy 1 lần là
+  tối ưu. sub_cost chỉ gọi khi ô chéo còn có thể thắng.
+- Ngưỡng quá lớn (câu rất lệch / rất dài) -> DP theo từng hàng bằng NumPy trên cả ma trận:
+  hàng i tính từ hàng i-1 trong O(1) lệnh numpy (D[i, j] = j + cummin(A[k] - k), A = min(xoá, thay thế)).
+  `sub_cost` chỉ được gọi cho các cặp trong band và qua được bộ lọc cận dưới (chênh độ dài +
+  bag distance); band tự nới ra nếu kết quả có thể đi ra ngoài band (Ukkonen).
+"""
+from itertools import chain
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# (index bên a, index bên b): (i, j) = cặp, (i, None) = thiếu bên b, (None, j) = thừa bên b
+AlignOp = Tuple[Optional[int], Optional[int]]
+
+SubCostFn = Callable[[str, str], float]
+MaxEditsFn = Callable[[np.ndarray], np.ndarray]
+
+_GAP_COST = 1.0
+_EPS = 1e-9
+_BAND_SLACK = 8
+_INF = float("inf")
+
+# DP thuần Python: ngưỡng cắt có thể giữ quá số ô này thì chuyển sang đường NumPy
+_PY_MAX_CELLS = 40_000
+
+
+def _char_masks(tokens: Sequence[str], lengths: np.ndarray) -> np.ndarray:
+    """Bitmask 64 bit các ký tự có trong từng token (bit = code % 64)."""
+    codes = np.frombuffer("".join(tokens).encode("utf-32-le"), dtype=np.uint32) % 64
+    if codes.size == 0:
+        return np.zeros(len(tokens), dtype=np.uint64)
+    bits = np.left_shift(np.uint64(1), codes.astype(np.uint64))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    non_empty = lengths > 0
+    masks = np.zeros(len(tokens), dtype=np.uint64)
+    masks[non_empty] = np.bitwise_or.reduceat(bits, starts[non_empty])
+    return masks
+
+
+def _substitution_matrix(
+    a: Sequence[str],
+    b: Sequence[str],
+    sub_cost: SubCostFn,
+    max_edits: Optional[MaxEditsFn],
+    band_lo: int,
+    band_hi: int,
+    memo: dict,
+) -> np.ndarray:
+    n, m = len(a), len(b)
+    vocab: dict[str, int] = {}
+    ids_a = np.fromiter((vocab.setdefault(t, len(vocab)) for t in a), dtype=np.int64, count=n)
+    ids_b = np.fromiter((vocab.setdefault(t, len(vocab)) for t in b), dtype=np.int64, count=m)
+
+    sub = np.full((n, m), _GAP_COST)
+    sub[ids_a[:, None] == ids_b[None, :]] = 0.0
+
+    # Các ô trong band: (i, j) với band_lo <= j - i <= band_hi
+    rows = np.arange(n)
+    offsets = np.arange(band_lo, band_hi + 1)
+    ii = np.repeat(rows, offsets.size)
+    jj = np.tile(offsets, n) + ii
+    inside = (jj >= 0) & (jj < m)
+    ii, jj = ii[inside], jj[inside]
+    different = ids_a[ii] != ids_b[jj]
+    ii, jj = ii[different], jj[different]
+
+    if max_edits is not None and ii.size:
+        lengths_a = np.fromiter((len(t) for t in a), dtype=np.int64, count=n)
+        lengths_b = np.fromiter((len(t) for t in b), dtype=np.int64, count=m)
+        len_a, len_b = lengths_a[ii], lengths_b[jj]
+        limit = max_edits(np.maximum(len_a, len_b))
+        keep = np.abs(len_a - len_b) <= limit
+        ii, jj, limit = ii[keep], jj[keep], limit[keep]
+
+        if ii.size:
+            # Mỗi ký tự chỉ có ở 1 bên cần >= 1 phép sửa -> cận dưới của edit distance
+            mask_a, mask_b = _char_masks(a, lengths_a)[ii], _char_masks(b, lengths_b)[jj]
+            only_a = np.bitwise_count(mask_a & ~mask_b)
+            only_b = np.bitwise_count(mask_b & ~mask_a)
+            keep = np.maximum(only_a, only_b) <= limit
+            ii, jj = ii[keep], jj[keep]
+
+    for i, j in zip(ii.tolist(), jj.tolist()):
+        key = (a[i], b[j])
+        cost = memo.get(key)
+        if cost is None:
+            cost = memo[key] = sub_cost(a[i], b[j])
+        sub[i, j] = cost
+    return sub
+
+
+def _edit_matrix(sub: np.ndarray) -> np.ndarray:
+    """
+    Ma trận D (n+1, m+1). Tính trên E[i, j] = D[i, j] - j để chèn liên tiếp trong hàng
+    thành 1 phép cummin: E[i, j] = min(E[i, j-1], E[i-1, j] + 1, E[i-1, j-1] + sub - 1).
+    """
+    n, m = sub.shape
+    cols = np.arange(m + 1, dtype=np.float64) * _GAP_COST
+    shifted = np.empty((n + 1, m + 1))
+    shifted[0] = 0.0
+    sub_shifted = sub - _GAP_COST
+
+    up = np.empty(m)
+    for i in range(1, n + 1):
+        prev, row = shifted[i - 1], shifted[i]
+        row[0] = prev[0] + _GAP_COST
+        np.add(prev[1:], _GAP_COST, out=up)
+        np.add(prev[:-1], sub_shifted[i - 1], out=row[1:])
+        np.minimum(row[1:], up, out=row[1:])
+        np.minimum.accumulate(row, out=row)
+    return shifted + cols
+
+
+def _trace_back(dist: np.ndarray, sub: np.ndarray, offset: int) -> List[AlignOp]:
+    # Ô (i, j) đến từ đâu -> tính 1 lần cho cả ma trận, vòng lặp chỉ đọc bool
+    from_diag = np.abs(dist[1:, 1:] - dist[:-1, :-1] - sub) < _EPS
+    from_up = np.abs(dist[1:, 1:] - dist[:-1, 1:] - _GAP_COST) < _EPS
+
+    ops: List[AlignOp] = []
+    i, j = sub.shape
+    while i > 0 and j > 0:
+        if from_diag[i - 1, j - 1]:
+            i, j = i - 1, j - 1
+            ops.append((offset + i, offset + j))
+        elif from_up[i - 1, j - 1]:
+            i -= 1
+            ops.append((offset + i, None))
+        else:
+            j -= 1
+            ops.append((None, offset + j))
+    ops.extend((offset + k, None) for k in range(i - 1, -1, -1))
+    ops.extend((None, offset + k) for k in range(j - 1, -1, -1))
+    ops.reverse()
+    return ops
+
+
+def _cutoff_rows(a: Sequence[str], b: Sequence[str], sub_cost: SubCostFn,
+                 memo: dict, limit: float) -> Optional[List[Tuple[int, List[float]]]]:
+    """
+    Hàng i = (j đầu, [D[i][j], ...] + [inf]), bỏ ô có D[i][j] + |skew - (j - i)| > limit
+    (mọi đường qua ô đó tốn > limit). None nếu không đường nào <= limit. memo: a_token -> {b_token: cost}.
+    """
+    n, m = len(a), len(b)
+    skew = m - n
+    width = 0
+    while width <= m and width + abs(skew - width) <= limit:
+        width += 1
+    if not width:
+        return None
+    rows = [(0, [j * _GAP_COST for j in range(width)] + [_INF])]
+    for i in range(1, n + 1):
+        x = a[i - 1]
+        costs = memo.get(x)
+        if costs is None:
+            costs = memo[x] = {x: 0.0}
+        get = costs.get
+
+        p_lo, prev = rows[-1]
+        if p_lo == 0:
+            values = [prev[0] + _GAP_COST]
+            diag, up, j_lo = prev, prev[1:], 1
+        else:
+            values = []
+            diag, up, j_lo = chain((_INF,), prev), prev, p_lo
+        left = values[0] if values else _INF
+        push = values.append
+        for y, value, above in zip(b[j_lo - 1:min(m, p_lo + len(prev) - 1)], diag, up):
+            left += _GAP_COST
+            above += _GAP_COST
+            if above < left:
+                left = above
+            # sub_cost > 0 khi khác từ -> chỉ cần tính khi ô chéo nhỏ hơn hẳn 2 hướng kia
+            if value < left:
+                cost = get(y)
+                if cost is None:
+                    cost = costs[y] = sub_cost(x, y)
+                value += cost
+                if value < left:
+                    left = value
+            push(left)
+
+        # Bên phải hàng trước chỉ đi ngang được (thêm từ); |skew - (j - i)| = |diagonal - j|
+        diagonal = skew + i
+        j = p_lo + len(values)
+        while j <= m:
+            left += _GAP_COST
+            if left + abs(diagonal - j) > limit:
+                break
+            push(left)
+            j += 1
+
+        start, stop = 0, len(values)
+        while start < stop and values[start] + abs(diagonal - p_lo - start) > limit:
+            start += 1
+        while stop > start and values[stop - 1] + abs(diagonal - p_lo - stop + 1) > limit:
+            stop -= 1
+        if start == stop:
+            return None
+        if start or stop < len(values):
+            values = values[start:stop]
+        values.append(_INF)
+        rows.append((p_lo + start, values))
+
+    last_lo, last = rows[n]
+    return rows if last_lo + len(last) - 2 == m else None
+
+
+def _greedy_cost(a: Sequence[str], b: Sequence[str], sub_cost: SubCostFn, window: int = 4) -> float:
+    """Cost của 1 alignment tham lam (lệch thì nhảy tới chỗ khớp y hệt gần nhất) = cận trên của tối ưu."""
+    n, m = len(a), len(b)
+    # (bỏ bên a, bỏ bên b) theo thứ tự nhảy gần -> xa
+    skips = [(da, dist - da) for dist in range(1, 2 * window + 1)
+             for da in range(max(0, dist - window), min(dist, window) + 1)]
+    i = j = 0
+    cost = 0.0
+    while i < n and j < m:
+        if a[i] == b[j]:
+            i, j = i + 1, j + 1
+            continue
+        # 2 cặp liền nhau khớp mới tính là bắt lại nhịp (1 cặp dễ trùng ngẫu nhiên: "the", "a")
+        skip_a = skip_b = 1
+        for da, db in skips:
+            x, y = i + da, j + db
+            if x + 1 < n and y + 1 < m and a[x] == b[y] and a[x + 1] == b[y + 1]:
+                skip_a, skip_b = da, db
+                break
+        for k in range(min(skip_a, skip_b)):
+            cost += sub_cost(a[i + k], b[j + k])
+        cost += abs(skip_a - skip_b) * _GAP_COST
+        i, j = i + skip_a, j + skip_b
+    return cost + (n - i + m - j) * _GAP_COST
+
+
+def _align_python(a: Sequence[str], b: Sequence[str], sub_cost: SubCostFn) -> Optional[List[AlignOp]]:
+    """Alignment tối ưu bằng DP có ngưỡng cắt; None nếu dải có thể vượt `_PY_MAX_CELLS` ô."""
+    n, m = len(a), len(b)
+    # Ngưỡng = cost 1 alignment có thật -> đường tối ưu không bao giờ bị cắt, chạy đúng 1 lần
+    limit = _greedy_cost(a, b, sub_cost) + _EPS
+    # Mỗi hàng giữ tối đa limit + 1 ô (|k| + |skew - k| <= limit)
+    if (n + 1) * (limit + 1) > _PY_MAX_CELLS:
+        return None
+    memo: dict = {}
+    rows = _cutoff_rows(a, b, sub_cost, memo, limit)
+    if rows is None:
+        return None
+
+    def at(i: int, j: int) -> float:
+        lo, values = rows[i]
+        return values[j - lo] if lo <= j < lo + len(values) else _INF
+
+    ops: List[AlignOp] = []
+    i, j = n, m
+    while i > 0 and j > 0:
+        value = at(i, j)
+        # Cặp chưa có trong memo = ô chéo không thể thắng
+        if abs(value - at(i - 1, j - 1) - memo[a[i - 1]].get(b[j - 1], _INF)) < _EPS:
+            i, j = i - 1, j - 1
+            ops.append((i, j))
+        elif abs(value - at(i - 1, j) - _GAP_COST) < _EPS:
+            i -= 1
+            ops.append((i, None))
+        else:
+            j -= 1
+            ops.append((None, j))
+    ops.extend((k, None) for k in range(i - 1, -1, -1))
+    ops.extend((None, k) for k in range(j - 1, -1, -1))
+    ops.reverse()
+    return ops
+
+
+def align_tokens(
+    a: Sequence[str],
+    b: Sequence[str],
+    sub_cost: SubCostFn,
+    max_edits: Optional[MaxEditsFn] = None,
+) -> List[AlignOp]:
+    """
+    Alignment tối ưu giữa `a` (expected) và `b` (recognized).
+
+    sub_cost(x, y): cost thay thế x -> y khi x != y, trong (0, 1].
+    max_edits(max_len): (tuỳ chọn, vectorized) số ký tự sai tối đa để sub_cost còn < 1;
+        cặp nào chắc chắn vượt ngưỡng thì bỏ qua sub_cost, gán luôn 1.
+    """
+    n, m = len(a), len(b)
+
+    # Phần đầu/cuối khớp y hệt -> luôn nằm trong 1 alignment tối ưu, khỏi đưa vào DP
+    head = 0
+    while head < n and head < m and a[head] == b[head]:
+        head += 1
+    tail = 0
+    while tail < n - head and tail < m - head and a[n - 1 - tail] == b[m - 1 - tail]:
+        tail += 1
+
+    prefix: List[AlignOp] = [(k, k) for k in range(head)]
+    suffix: List[AlignOp] = [(n - tail + k, m - tail + k) for k in range(tail)]
+    mid_a, mid_b = a[head:n - tail], b[head:m - tail]
+
+    if not mid_a or not mid_b:
+        middle = [(head + k, None) for k in range(len(mid_a))] + [(None, head + k) for k in range(len(mid_b))]
+        return prefix + middle + suffix
+
+    ops = _align_python(mid_a, mid_b, sub_cost)
+    if ops is not None:
+        return prefix + [(None if i is None else head + i, None if j is None else head + j) for i, j in ops] + suffix
+
+    memo: dict = {}
+    skew = len(mid_b) - len(mid_a)
+    slack = max(_BAND_SLACK, max(len(mid_a), len(mid_b)) // 8)
+    while True:
+        band_lo, band_hi = min(0, skew) - slack, max(0, skew) + slack
+        sub = _substitution_matrix(mid_a, mid_b, sub_cost, max_edits, band_lo, band_hi, memo)
+        dist = _edit_matrix(sub)
+
+        # Đường đi ra ngoài band cần >= |skew| + 2 * (slack + 1) lần thêm/bớt
+        covers_all = band_lo <= -len(mid_a) and band_hi >= len(mid_b)
+        if covers_all or dist[-1, -1] < abs(skew) + 2 * (slack + 1) - _EPS:
+            break
+        slack *= 2
+
+    # Offset: trace_back trả index trong đoạn giữa -> cộng head
+    return prefix + _trace_back(dist, sub, head) + suffix
@@ -0,0 +1,9 @@
+# tests/conftest.py
+"""Module trong src đọc config lúc import (Redis, Gemini) -> đặt giá trị mặc định trước khi test import."""
+import os
+import sys
+
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/15")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,118 @@
+# tests/test_audio_probe.py
+"""Duration đọc từ header từng container; file không phải audio (hoặc WebM) -> None để caller decode."""
+import random
+import struct
+import wave
+
+import pytest
+
+from src.utils.audio_probe import probe_audio_duration
+
+# MPEG1 Layer III, 128 kbps, 44.1 kHz, stereo, không padding -> 417 byte / frame, 1152 sample / frame
+_MP3_HEADER = b"\xff\xfb\x90\x00"
+_MP3_FRAME_LEN = 417
+
+
+def _write(tmp_path, name: str, data: bytes) -> str:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def _mp3_frames(count: int) -> bytes:
+    return (_MP3_HEADER + b"\x00" * (_MP3_FRAME_LEN - 4)) * count
+
+
+def _id3v2(body_size: int) -> bytes:
+    size = bytes((body_size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    return b"ID3\x04\x00\x00" + size + b"\x00" * body_size
+
+
+def _ogg_page(granule: int, packet: bytes) -> bytes:
+    header = b"OggS\x00\x02" + struct.pack("<qIII", granule, 1, 0, 0) + bytes([1, len(packet)])
+    return header + packet
+
+
+def _box(box_type: bytes, body: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(body)) + box_type + body
+
+
+def test_wav(tmp_path):
+    path = str(tmp_path / "a.wav")
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes(b"\x00\x00" * 16000 * 3)
+    assert probe_audio_duration(path) == pytest.approx(3.0)
+
+
+def test_flac(tmp_path):
+    # STREAMINFO: sample rate 20 bit | channels 3 | bps 5 | total samples 36 bit
+    packed = (44100 << 44) | (1 << 41) | (15 << 36) | (44100 * 5)
+    streaminfo = b"\x00" * 10 + packed.to_bytes(8, "big") + b"\x00" * 16
+    data = b"fLaC" + b"\x80" + (34).to_bytes(3, "big") + streaminfo
+    assert probe_audio_duration(_write(tmp_path, "a.flac", data)) == pytest.approx(5.0)
+
+
+def test_ogg_opus(tmp_path):
+    head = b"OpusHead\x01\x01" + struct.pack("<H", 312) + struct.pack("<I", 48000) + b"\x00\x00\x00"
+    data = _ogg_page(0, head) + b"\x00" * 1000 + _ogg_page(48000 * 4 + 312, b"\x00")
+    assert probe_audio_duration(_write(tmp_path, "a.opus", data)) == pytest.approx(4.0)
+
+
+def test_ogg_vorbis(tmp_path):
+    ident = b"\x01vorbis" + struct.pack("<IBI", 0, 2, 22050) + b"\x00" * 16
+    data = _ogg_page(0, ident) + b"\x00" * 1000 + _ogg_page(22050 * 2, b"\x00")
+    assert probe_audio_duration(_write(tmp_path, "a.ogg", data)) == pytest.approx(2.0)
+
+
+def test_mp4(tmp_path):
+    mvhd = _box(b"mvhd", b"\x00\x00\x00\x00" + struct.pack(">IIII", 0, 0, 1000, 7500) + b"\x00" * 80)
+    data = _box(b"ftyp", b"M4A \x00\x00\x00\x00") + _box(b"moov", mvhd)
+    assert probe_audio_duration(_write(tmp_path, "a.m4a", data)) == pytest.approx(7.5)
+
+
+def test_mp3_cbr_after_id3(tmp_path):
+    frames = 100
+    data = _id3v2(200) + _mp3_frames(frames)
+    expected = frames * _MP3_FRAME_LEN * 8 / 128000
+    assert probe_audio_duration(_write(tmp_path, "a.mp3", data)) == pytest.approx(expected)
+
+
+def test_mp3_xing_frame_count(tmp_path):
+    # Xing nằm sau 32 byte side info (MPEG1 stereo): flags = có số frame
+    first = _MP3_HEADER + b"\x00" * 32 + b"Xing" + struct.pack(">II", 1, 1000)
+    first += b"\x00" * (_MP3_FRAME_LEN - len(first))
+    data = first + _mp3_frames(20)
+    assert probe_audio_duration(_write(tmp_path, "a.mp3", data)) == pytest.approx(1000 * 1152 / 44100)
+
+
+def test_mp3_after_leading_junk(tmp_path):
+    data = b"\x00" * 300 + _mp3_frames(50)
+    assert probe_audio_duration(_write(tmp_path, "a.mp3", data)) is not None
+
+
+def test_webm_returns_none(tmp_path):
+    rng = random.Random(3)
+    for i in range(50):
+        data = b"\x1a\x45\xdf\xa3" + rng.randbytes(rng.randint(1_000, 200_000))
+        assert probe_audio_duration(_write(tmp_path, f"{i}.webm", data)) is None
+
+
+def test_random_bytes_return_none(tmp_path):
+    rng = random.Random(4)
+    for i in range(50):
+        data = rng.randbytes(rng.randint(1_000, 200_000))
+        assert probe_audio_duration(_write(tmp_path, f"{i}.bin", data)) is None
+
+
+def test_non_audio_file_returns_none(tmp_path):
+    data = b"<html><body>" + b"not audio " * 2000 + b"</body></html>"
+    assert probe_audio_duration(_write(tmp_path, "page.html", data)) is None
+
+
+def test_truncated_mp3_single_sync_returns_none(tmp_path):
+    # 1 header lẻ, frame kế tiếp không có -> không được bịa duration
+    data = b"\x00" * 10 + _MP3_HEADER + b"\x00" * 100
+    assert probe_audio_duration(_write(tmp_path, "a.mp3", data)) is None
@@ -0,0 +1,36 @@
+# tests/test_kafka_offsets.py
+"""Watermark commit của consumer: job xong không theo thứ tự vẫn chỉ commit tới offset nhỏ nhất còn chạy."""
+from src.kafka.consumer.consumer import _PartitionOffsets
+
+
+def test_out_of_order_finish_waits_for_lowest_in_flight():
+    offsets = _PartitionOffsets()
+    for offset in (10, 11, 12):
+        offsets.start(offset)
+
+    assert offsets.finish(12) is None  # 10, 11 còn chạy
+    assert offsets.finish(11) is None
+    assert offsets.finish(10) == 13  # cả 3 xong -> commit sau message cuối
+
+
+def test_watermark_advances_to_next_in_flight():
+    offsets = _PartitionOffsets()
+    for offset in (0, 1, 2, 3):
+        offsets.start(offset)
+
+    assert offsets.finish(1) is None
+    assert offsets.finish(0) == 2  # 1 đã xong, 2 còn chạy
+    assert offsets.finish(3) is None
+    assert offsets.finish(2) == 4
+
+
+def test_never_commits_backwards_or_twice():
+    offsets = _PartitionOffsets()
+    offsets.start(5)
+    assert offsets.finish(5) == 6
+    assert offsets.finish(5) is None  # finish lặp lại không commit lại
+
+    offsets.start(6)
+    offsets.start(7)
+    assert offsets.finish(7) is None
+    assert offsets.finish(6) == 8
@@ -0,0 +1,116 @@
+# tests/test_lesson_metadata_store.py
+"""Metadata dạng cũ (1 JSON đầy đủ) vẫn đọc được và lần lưu sau chuyển sang manifest + section."""
+import asyncio
+
+import orjson
+import pytest
+
+from src import dto
+from src.services import lesson_metadata_store as store
+
+LESSON_ID = 42
+LEGACY_URL = "https://cdn.test/legacy.json"
+
+SOURCE = dto.SourceFetchedDto(duration=95, sourceReferenceId="dQw4w9WgXcQ", audioUrl="https://cdn.test/a.mp3")
+TRANSCRIBED = dto.TranscribedDto(segments=[])
+NLP = dto.NlpAnalyzedDto(sentences=[])
+
+
+class _FakeCloud:
+    """Upload lưu vào dict url -> bytes; fetch đọc lại từ đó."""
+
+    def __init__(self):
+        self.objects: dict[str, bytes] = {}
+        self.uploads: list[str] = []
+
+    async def upload_json_content(self, json_str: str, public_id: str) -> str:
+        return self._put(f"https://cdn.test/{public_id}.json", json_str.encode("utf-8"))
+
+    async def upload_raw_content(self, data: bytes, public_id: str, format: str) -> str:
+        return self._put(f"https://cdn.test/{public_id}.{format}", data)
+
+    async def fetch_json(self, url: str):
+        raw = self.objects.get(url)
+        return orjson.loads(raw) if raw is not None else None
+
+    async def fetch_bytes(self, url: str):
+        return self.objects.get(url)
+
+    def _put(self, url: str, data: bytes) -> str:
+        self.objects[url] = data
+        self.uploads.append(url)
+        return url
+
+
+@pytest.fixture
+def cloud(monkeypatch):
+    fake = _FakeCloud()
+    fake.objects[LEGACY_URL] = orjson.dumps(
+        dto.LessonGenerationAiMetadataDto(sourceFetched=SOURCE, transcribed=TRANSCRIBED).model_dump(by_alias=True)
+    )
+    monkeypatch.setattr(store.cloud_service, "upload_json_content", fake.upload_json_content)
+    monkeypatch.setattr(store.cloud_service, "upload_raw_content", fake.upload_raw_content)
+    monkeypatch.setattr(store, "fetch_json_from_url", fake.fetch_json)
+    monkeypatch.setattr(store, "fetch_bytes_from_url", fake.fetch_bytes)
+    return fake
+
+
+def test_legacy_document_loads_as_sections(cloud):
+    metadata = asyncio.run(store.load(LESSON_ID, LEGACY_URL))
+
+    assert metadata.url is None  # chưa có manifest
+    assert metadata.has("sourceFetched") and metadata.has("transcribed")
+    assert not metadata.has("nlpAnalyzed")
+    assert asyncio.run(metadata.get("sourceFetched")) == SOURCE
+
+
+def test_legacy_document_migrates_to_manifest_on_next_put(cloud, monkeypatch):
+    monkeypatch.setattr(store, "LESSON_METADATA_SECTIONED", True)
+
+    async def migrate():
+        metadata = await store.load(LESSON_ID, LEGACY_URL)
+        return await metadata.put("nlpAnalyzed", NLP)
+
+    url = asyncio.run(migrate())
+
+    # Section cũ chưa có object riêng cũng được upload cùng section mới
+    section_urls = [u for u in cloud.uploads if u.endswith(".gz")]
+    assert len(section_urls) == 3
+    manifest = orjson.loads(cloud.objects[url])
+    assert manifest["manifestVersion"] == 1
+    assert set(manifest["sections"]) == {"sourceFetched", "transcribed", "nlpAnalyzed"}
+
+    async def reload():
+        metadata = await store.load(LESSON_ID, url)
+        return [await metadata.get(name) for name in ("sourceFetched", "transcribed", "nlpAnalyzed")]
+
+    assert asyncio.run(reload()) == [SOURCE, TRANSCRIBED, NLP]
+
+
+def test_unchanged_section_is_not_uploaded_again(cloud, monkeypatch):
+    monkeypatch.setattr(store, "LESSON_METADATA_SECTIONED", True)
+
+    async def run_twice():
+        metadata = await store.load(LESSON_ID, LEGACY_URL)
+        url = await metadata.put("nlpAnalyzed", NLP)
+        uploads = len(cloud.uploads)
+        restarted = await store.load(LESSON_ID, url)
+        assert await restarted.put("nlpAnalyzed", NLP) == url
+        return uploads
+
+    uploads = asyncio.run(run_twice())
+    assert len(cloud.uploads) == uploads  # cùng sha256 -> không upload section lẫn manifest
+
+
+def test_default_keeps_full_document(cloud, monkeypatch):
+    monkeypatch.setattr(store, "LESSON_METADATA_SECTIONED", False)
+
+    async def save():
+        metadata = await store.load(LESSON_ID, LEGACY_URL)
+        return await metadata.put("nlpAnalyzed", NLP)
+
+    url = asyncio.run(save())
+
+    document = dto.LessonGenerationAiMetadataDto.model_validate(orjson.loads(cloud.objects[url]))
+    assert (document.sourceFetched, document.transcribed, document.nlpAnalyzed) == (SOURCE, TRANSCRIBED, NLP)
+    assert not any(u.endswith(".gz") for u in cloud.uploads)
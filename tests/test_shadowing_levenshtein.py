@@ -0,0 +1,31 @@
+# tests/test_shadowing_levenshtein.py
+"""Levenshtein có ngưỡng: trong ngưỡng = đúng khoảng cách, vượt ngưỡng = max_dist + 1."""
+import random
+
+from src.services.shadowing_service import _bounded_levenshtein
+
+
+def _levenshtein(a, b):
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (a[i - 1] != b[j - 1]))
+        prev = cur
+    return prev[-1]
+
+
+def test_matches_full_levenshtein_within_bound():
+    rng = random.Random(14)
+    for _ in range(2000):
+        a = "".join(rng.choice("abcde") for _ in range(rng.randint(0, 10)))
+        b = "".join(rng.choice("abcde") for _ in range(rng.randint(0, 10)))
+        max_dist = rng.randint(0, 4)
+        exact = _levenshtein(a, b)
+        assert _bounded_levenshtein(a, b, max_dist) == (exact if exact <= max_dist else max_dist + 1)
+
+
+def test_typical_near_words():
+    assert _bounded_levenshtein("learning", "learnin", 1) == 1
+    assert _bounded_levenshtein("pronunciation", "pronounciation", 2) == 1
+    assert _bounded_levenshtein("government", "environment", 2) == 3
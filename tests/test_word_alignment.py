@@ -0,0 +1,105 @@
+# tests/test_word_alignment.py
+"""Alignment chấm shadowing: cost luôn bằng DP đầy đủ O(n * m), cả đường Python lẫn đường NumPy."""
+import random
+
+import pytest
+
+from src.services.shadowing_service import _near_max_edits, _substitution_cost
+from src.utils import word_alignment
+from src.utils.word_alignment import align_tokens
+
+_VOCAB = (
+    "the a learner should practice speaking english every day because listening and repeating "
+    "sentences helps build fluency confidence pronunciation vocabulary grammar news learning"
+).split()
+
+
+def _reference_cost(a, b):
+    prev = [float(j) for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        cur = [float(i)] + [0.0] * len(b)
+        for j in range(1, len(b) + 1):
+            sub = 0.0 if a[i - 1] == b[j - 1] else _substitution_cost(a[i - 1], b[j - 1])
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + sub)
+        prev = cur
+    return prev[-1]
+
+
+def _ops_cost(a, b, ops):
+    cost = 0.0
+    for i, j in ops:
+        if i is None or j is None:
+            cost += 1
+        elif a[i] != b[j]:
+            cost += _substitution_cost(a[i], b[j])
+    return cost
+
+
+def _learner_version(words, rng, error_rate):
+    out = []
+    for w in words:
+        r = rng.random()
+        if r < error_rate * 0.25:
+            continue
+        if r < error_rate * 0.5:
+            out.extend([rng.choice(["uh", "um", "the"]), w])
+        elif r < error_rate * 0.75 and len(w) > 3:
+            out.append(w[:-1])
+        elif r < error_rate:
+            out.append(rng.choice(_VOCAB))
+        else:
+            out.append(w)
+    return out
+
+
+def _cases(seed, count):
+    rng = random.Random(seed)
+    for _ in range(count):
+        vocab = _VOCAB[:rng.randint(3, len(_VOCAB))]
+        expected = [rng.choice(vocab) for _ in range(rng.randint(0, 60))]
+        if rng.random() < 0.7:
+            recognized = _learner_version(expected, rng, rng.random())
+        else:
+            recognized = [rng.choice(vocab) for _ in range(rng.randint(0, 60))]
+        yield expected, recognized
+
+
+def _check(expected, recognized):
+    ops = align_tokens(expected, recognized, _substitution_cost, max_edits=_near_max_edits)
+    # Mỗi index xuất hiện đúng 1 lần, theo thứ tự
+    assert [i for i, _ in ops if i is not None] == list(range(len(expected)))
+    assert [j for _, j in ops if j is not None] == list(range(len(recognized)))
+    assert _ops_cost(expected, recognized, ops) == pytest.approx(_reference_cost(expected, recognized), abs=1e-6)
+
+
+def test_python_path_matches_reference_dp():
+    for expected, recognized in _cases(seed=13, count=400):
+        _check(expected, recognized)
+
+
+def test_numpy_fallback_matches_reference_dp(monkeypatch):
+    monkeypatch.setattr(word_alignment, "_PY_MAX_CELLS", 0)
+    for expected, recognized in _cases(seed=14, count=200):
+        _check(expected, recognized)
+
+
+def test_long_paragraph_matches_reference_dp():
+    rng = random.Random(200)
+    expected = [rng.choice(_VOCAB) for _ in range(200)]
+    for error_rate in (0.0, 0.1, 0.3):
+        _check(expected, _learner_version(expected, rng, error_rate))
+
+
+def test_extra_word_does_not_shift_the_rest():
+    expected = "i want to learn english every day".split()
+    recognized = "uh i want to learn english day".split()
+    ops = align_tokens(expected, recognized, _substitution_cost)
+    assert ops[0] == (None, 0)
+    assert (5, None) in ops  # "every" bị bỏ
+    assert all(expected[i] == recognized[j] for i, j in ops if i is not None and j is not None)
+
+
+def test_greedy_cost_is_an_upper_bound():
+    for expected, recognized in _cases(seed=15, count=200):
+        greedy = word_alignment._greedy_cost(expected, recognized, _substitution_cost)
+        assert greedy >= _reference_cost(expected, recognized) - 1e-9